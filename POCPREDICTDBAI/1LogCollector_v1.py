@@ -8,10 +8,18 @@ It uses multi-threading to process multiple file uploads in parallel.
 Key Features:
 - Configurable log directory and Azure Storage connection settings.
 - Multi-threaded uploads to speed up the process.
+- Local upload manifest so unchanged files are skipped on later runs.
+- The live ERRORLOG / SQLAGENT.OUT is uploaded as an append blob, sending only the bytes written since the last run.
+- One pooled BlobServiceClient shared by all upload threads.
+- Large files are split into blocks staged concurrently and committed with a block list.
+- Optional (off by default) gzip/zstd compression of archived logs; the codec is recorded in the blob's 'codec'
+  metadata and as its Content-Encoding.
+- Upload counters and block latency histograms exported through pipeline_metrics (metrics/collector.prom).
 
 Requirements:
 - Python 3.8+
 - Azure SDK for Python (azure-storage-blob)
+- zstandard (optional, only when upload_codec = "zstd")
 - Modify the azure_storage_connection_string, logs_directory, and container_name variables.
 
 Usage:
@@ -20,34 +28,249 @@ Run the script to upload logs from the specified directory to Azure Blob Storage
 """
 
 import os
-from concurrent.futures import ThreadPoolExecutor
-from azure.storage.blob import BlobServiceClient, ContentSettings
+import json
+import zlib
+import base64
+import hashlib
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, BlobBlock, ContentSettings
+import pipeline_metrics as metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Global variables
 azure_storage_connection_string = "DefaultEndpointsProtocol=https;AccountName=<PROVIDE ACCOUNT NAME HERE>;AccountKey=<PROVIDE ACCOUNT KEY>"
 logs_directory = "<PROVIDE YOUR LOG DIRECTORY>"  # Replace this with the appropriate path or use GUI input
 container_name = "<PROVIDE YOUR CONTAINER NAME CREATED UNDER AZURE STORAGE>"
 max_workers = 5  # This value can be adjusted or set via GUI input in the future
+manifest_path = "upload_manifest.json"  # Local record of what has already been uploaded
+live_log_suffixes = ("ERRORLOG", "SQLAGENT.OUT")  # Files still being written to by SQL Server
+append_block_size = 4 * 1024 * 1024  # Maximum bytes sent per append_block call
+head_fingerprint_size = 64 * 1024  # Bytes hashed to detect that a live log has been cycled
+block_size = 8 * 1024 * 1024  # Size of each staged block for large files
+block_upload_workers = 4  # Concurrent block uploads per file
+upload_codec = None  # Opt-in compression for archived logs: None, "gzip" or "zstd"
+
+# Lock for thread-safe manifest updates
+manifest_lock = threading.Lock()
+
+# Shared BlobServiceClient, created once and reused by every upload thread
+blob_service_client = None
+client_lock = threading.Lock()
+
+# Function to get the process-wide BlobServiceClient with a connection pool sized for all upload threads
+def get_blob_service_client():
+    global blob_service_client
+    with client_lock:
+        if blob_service_client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers * block_upload_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            transport = RequestsTransport(session=session, session_owner=False)
+            blob_service_client = BlobServiceClient.from_connection_string(azure_storage_connection_string, transport=transport)
+        return blob_service_client
+
+# Function to load the upload manifest from disk
+def load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as file:
+            return json.load(file)
+    except Exception as e:
+        print(f"Error reading manifest {manifest_path}, starting with an empty one: {e}")
+        return {}
+
+# Function to save the upload manifest atomically
+def save_manifest(manifest):
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, manifest_path)
+
+# Function to check whether a file is a live log that SQL Server keeps appending to
+def is_live_log(file_path):
+    return os.path.basename(file_path).upper().endswith(live_log_suffixes)
+
+# Function to compute the SHA-256 of a file, optionally limited to its first `limit` bytes
+def hash_file(file_path, limit=None):
+    sha256 = hashlib.sha256()
+    remaining = limit
+    with open(file_path, "rb") as data:
+        while remaining is None or remaining > 0:
+            chunk_size = append_block_size if remaining is None else min(append_block_size, remaining)
+            chunk = data.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return sha256.hexdigest()
+
+# Function to create a streaming compressor for the given codec (None means no compression)
+def new_compressor(codec):
+    if codec == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header and trailer
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return None
+
+# Function to read a file as a sequence of blocks of at most block_size bytes, compressed on the fly
+def read_blocks(file_path, codec):
+    compressor = new_compressor(codec)
+    pending = bytearray()
+    with open(file_path, "rb") as data:
+        while True:
+            chunk = data.read(block_size)
+            if not chunk:
+                break
+            pending += compressor.compress(chunk) if compressor else chunk
+            while len(pending) >= block_size:
+                yield bytes(pending[:block_size])
+                del pending[:block_size]
+    if compressor:
+        pending += compressor.flush()
+    if pending:
+        yield bytes(pending)
+
+# Function to stage one block of a block blob
+def stage_block(blob_client, block_id, block):
+    with metrics.timer("collector_block_upload_seconds", operation="stage_block"):
+        blob_client.stage_block(block_id, block)
+    metrics.inc("collector_bytes_uploaded_total", len(block))
+
+# Function to upload a file as a block blob, staging blocks concurrently for large files
+def upload_blocks_to_blob(blob_client, file_path, codec):
+    # The Content-Encoding tells HTTP clients the stored bytes are compressed text, not text/plain as is
+    content_settings = ContentSettings(content_type='text/plain', content_encoding=codec)
+    metadata = {'codec': codec} if codec else {}
+    blocks = read_blocks(file_path, codec)
+    first_block = next(blocks, b"")
+    second_block = next(blocks, None)
+
+    # Small file: a single put is cheaper than staging and committing
+    if second_block is None:
+        with metrics.timer("collector_block_upload_seconds", operation="upload_blob"):
+            result = blob_client.upload_blob(first_block, overwrite=True, content_settings=content_settings, metadata=metadata)
+        metrics.inc("collector_bytes_uploaded_total", len(first_block))
+        return result['etag']
+
+    block_list = []
+    with ThreadPoolExecutor(max_workers=block_upload_workers) as executor:
+        in_flight = set()
+        for index, block in enumerate(chain([first_block, second_block], blocks)):
+            # Fixed-width ids: Azure requires all block ids of a blob to have the same length
+            block_id = base64.b64encode(f"{index:08d}".encode()).decode()
+            block_list.append(BlobBlock(block_id=block_id))
+            in_flight.add(executor.submit(stage_block, blob_client, block_id, block))
+            # Bound the number of blocks held in memory while they are uploading
+            if len(in_flight) >= block_upload_workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in in_flight:
+            future.result()
+
+    with metrics.timer("collector_block_upload_seconds", operation="commit_block_list"):
+        result = blob_client.commit_block_list(block_list, content_settings=content_settings, metadata=metadata)
+    return result['etag']
+
+# Function to upload a live log as an append blob, sending only bytes after `offset`
+def append_file_to_blob(blob_client, file_path, offset, etag):
+    with open(file_path, "rb") as data:
+        if offset == 0:
+            result = blob_client.create_append_blob(content_settings=ContentSettings(content_type='text/plain'))
+            etag = result['etag']
+        data.seek(offset)
+        while True:
+            chunk = data.read(append_block_size)
+            if not chunk:
+                break
+            # Conditional append: fails if the blob was changed by anyone else since our last write
+            with metrics.timer("collector_block_upload_seconds", operation="append_block"):
+                result = blob_client.append_block(chunk, etag=etag, match_condition=MatchConditions.IfNotModified)
+            metrics.inc("collector_bytes_uploaded_total", len(chunk))
+            etag = result['etag']
+            offset += len(chunk)
+    return offset, etag
 
 # Function to upload a single file to Azure Blob Storage
-def upload_file_to_blob(file_path):
+def upload_file_to_blob(file_path, manifest=None):
+    if manifest is None:
+        manifest = {}
     try:
-        # Create a BlobServiceClient
-        blob_service_client = BlobServiceClient.from_connection_string(azure_storage_connection_string)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=os.path.basename(file_path))
-
-        # Upload the file
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type='text/plain'))
-        
+        stat = os.stat(file_path)
+        entry = manifest.get(file_path)
+
+        # Size and mtime unchanged: nothing new to send
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            print(f"Skipping unchanged file {file_path}")
+            metrics.inc("collector_files_total", result="unchanged")
+            return
+
+        # Reuse the shared BlobServiceClient
+        blob_client = get_blob_service_client().get_blob_client(container=container_name, blob=os.path.basename(file_path))
+
+        if is_live_log(file_path):
+            head_hash = hash_file(file_path, limit=head_fingerprint_size)
+            offset = 0
+            etag = None
+            # Resume from the recorded offset unless the log was cycled (shrunk or rewritten from the start)
+            if entry and entry.get('blob_type') == 'append' and stat.st_size >= entry['size'] \
+                    and entry.get('head_hash') == head_hash:
+                offset = entry['size']
+                etag = entry['etag']
+            try:
+                offset, etag = append_file_to_blob(blob_client, file_path, offset, etag)
+            except (ResourceModifiedError, ResourceNotFoundError):
+                print(f"Blob for {file_path} changed remotely, re-uploading from the start")
+                metrics.inc("collector_retries_total", reason="blob_changed_remotely")
+                offset, etag = append_file_to_blob(blob_client, file_path, 0, None)
+            new_entry = {'size': offset, 'mtime': stat.st_mtime, 'sha256': None, 'head_hash': head_hash,
+                         'etag': etag, 'blob_type': 'append'}
+        else:
+            content_hash = hash_file(file_path)
+            # Touched but identical content: record the new mtime and skip the upload
+            if entry and entry.get('sha256') == content_hash:
+                with manifest_lock:
+                    manifest[file_path] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+                print(f"Skipping unchanged file {file_path}")
+                metrics.inc("collector_files_total", result="unchanged")
+                return
+
+            # Upload the file
+            codec = upload_codec
+            if codec == "zstd" and zstandard is None:
+                print("zstandard is not installed, falling back to gzip compression")
+                codec = "gzip"
+            etag = upload_blocks_to_blob(blob_client, file_path, codec)
+            new_entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': content_hash,
+                         'etag': etag, 'blob_type': 'block', 'codec': codec}
+
+        with manifest_lock:
+            manifest[file_path] = new_entry
+
         print(f"Successfully uploaded {file_path} to {container_name}")
+        metrics.inc("collector_files_total", result="uploaded")
     except Exception as e:
         print(f"Error uploading {file_path}: {e}")
+        metrics.inc("collector_files_total", result="failed")
 
 # Function to process files in parallel
-def upload_files_in_parallel(file_paths):
+def upload_files_in_parallel(file_paths, manifest=None):
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(upload_file_to_blob, file_path) for file_path in file_paths]
+        futures = [executor.submit(upload_file_to_blob, file_path, manifest) for file_path in file_paths]
         for future in futures:
             future.result()
 
@@ -56,9 +279,19 @@ def main():
     # List all files in the provided directory
     file_paths = [os.path.join(logs_directory, file) for file in os.listdir(logs_directory) if os.path.isfile(os.path.join(logs_directory, file))]
 
+    # Load what was uploaded by previous runs
+    manifest = load_manifest()
+
     # Call the parallel upload function
-    upload_files_in_parallel(file_paths)
+    with metrics.stage("collect.upload"):
+        upload_files_in_parallel(file_paths, manifest)
+
+    # Record this run's uploads for the next one
+    save_manifest(manifest)
 
 if __name__ == "__main__":
-    # Run the main function
-    main()
+    # Run the main function; the metrics are exported even when it fails
+    try:
+        main()
+    finally:
+        metrics.export("collector")
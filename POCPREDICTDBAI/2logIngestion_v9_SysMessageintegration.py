@@ -8,12 +8,31 @@ It supports multi-threaded log processing to ensure high performance.
 Key Features:
 - Filters error logs based on error codes and severity.
 - Multi-threaded log processing and batch inserts into SQL Server.
+- One pooled BlobServiceClient per process, shared by the listing and every download thread.
+- Transparently decompresses blobs uploaded with gzip/zstd by the collector (blob 'codec' metadata).
+- Streams each blob in chunks and decodes incrementally, so memory per worker is bounded by the chunk size plus the sink's batch size.
+- Cheap encoding detection: BOM sniffing, then for files without a BOM chardet on a bounded sample, with its
+  result cached per (server, log file type); a BOM is always read from the file itself and never cached.
+- Single-pass block parser: one precompiled regex filters lines and extracts date, error code and severity
+  over whole blocks of lines, with the fixed-width timestamp decoded without strptime. It lives in
+  log_block_parser.py, which parse workers can import without running this script's setup.
+- Pooled, persistent SQL Server connections with fast_executemany and health checks; no process-wide DB lock.
+- Pluggable log sink: row-wise inserts, a bulk staging-table load with one set-based INSERT ... SELECT per batch,
+  or a local SQLite stand-in for testing without SQL Server.
+- Resumable, idempotent runs: per-blob checkpoints (etag, creation time, byte offset of the last complete line,
+  last LogDate) skip unchanged blobs, process appended blobs from the last offset and resume a crashed run
+  without duplicating rows.
+- Staged pipeline: download/decode threads, a process pool for parsing and dedicated writer threads,
+  connected by bounded queues (backpressure) with per-stage queue-depth statistics.
+- Download, encoding detection, parse and write counters and batch latency histograms exported through
+  pipeline_metrics (metrics/ingestion.prom and metrics/ingestion_summary.json).
 - Connection details for Azure Storage and SQL Server must be updated in the script.
 
 Requirements:
 - Python 3.8+
 - Azure SDK for Python (azure-storage-blob)
 - pyodbc for SQL Server connection
+- zstandard (optional, only for blobs uploaded with the zstd codec)
 - Modify the azure_storage_connection_string and sql_conn_str variables.
 
 Usage:
@@ -23,14 +42,33 @@ Run the script to ingest logs from Azure Blob Storage and insert them into the S
 
 import getpass
 import threading
+import queue
+import time
+from contextlib import contextmanager
 import concurrent.futures
-from azure.storage.blob import BlobServiceClient
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, BlobType
 import pyodbc
 from datetime import datetime
 import logging
 import os
 import re
+import json
+import zlib
+import sqlite3
+import codecs
 import chardet
+from itertools import chain
+import pipeline_metrics as metrics
+# The parse pool's workers import the block parser from its own module, so they never run this script's setup
+from log_block_parser import parse_log_block
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Disable oneDNN custom operations
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
@@ -49,12 +87,219 @@ logging.basicConfig(
 azure_storage_connection_string = "<PROVIDE YOUR CONNECTION STRING>"
 sql_conn_str = "<PROVIDE YOUR CONNECTION STRING OR ODBC DSN>"
 
-# Lock for thread-safe database access
-db_lock = threading.Lock()
-
 # Adjustable parameters
-MAX_WORKERS = 16
+DOWNLOAD_WORKERS = 8  # Threads downloading and decoding blobs
+PARSE_WORKERS = os.cpu_count() or 1  # Processes parsing blocks of lines (0 parses inline in the download threads)
+WRITER_WORKERS = 4  # Threads writing parsed entries through the sink; each blob is always handled by the same writer
+PARSE_QUEUE_SIZE = 2 * (PARSE_WORKERS or 1)  # Blocks submitted to the parse pool and not yet parsed
+WRITE_QUEUE_SIZE = 16  # Parsed blocks waiting for each writer
 BATCH_SIZE = 1000
+DB_POOL_SIZE = DOWNLOAD_WORKERS + WRITER_WORKERS  # Maximum number of open SQL Server connections
+DB_POOL_HEALTH_CHECK_INTERVAL = 60  # Seconds a connection may sit idle before it is checked with SELECT 1
+LOG_SINK = "bulk"  # Where LogMessages rows go: "rows", "bulk" or "sqlite"
+BULK_BATCH_SIZE = 50000  # Rows loaded into the staging table per set-based merge
+FILL_LOG_MESSAGE_ON_MERGE = False  # Opt-in: bulk sink fills LogMessage from sys.messages during the merge instead of EXEC UpdateLogMessages
+SYS_MESSAGES_LANGUAGE_ID = 1033  # sys.messages language used to fill LogMessage
+SQLITE_SINK_PATH = "ingestion_standin.db"  # Database file used by the SQLite stand-in sink
+CHECKPOINT_PATH = "ingestion_checkpoints.json"  # Per-blob watermarks used to skip, append and resume
+STREAM_CHUNK_SIZE = 4 * 1024 * 1024  # Bytes downloaded (and decompressed) per chunk
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes passed to chardet when there is no BOM
+
+# Byte order marks, longest first so UTF-32 LE is not mistaken for UTF-16 LE.
+# The third column is the encoding for continuing the same stream after the BOM (resumed downloads).
+ENCODING_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32', 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32', 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8-sig', 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16', 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16', 'utf-16-be'),
+]
+
+# Leading bytes of a stream compressed with each collector codec
+CODEC_MAGIC_BYTES = {'gzip': b"\x1f\x8b", 'zstd': b"\x28\xb5\x2f\xfd"}
+
+# Encodings detected by chardet, cached per (server name, log file type)
+encoding_cache = {}
+encoding_cache_lock = threading.Lock()
+
+# How often each detection path was taken: BOM, cache hit, sampled chardet, or default fallback
+encoding_detection_stats = {'bom': 0, 'cache': 0, 'chardet': 0, 'default': 0}
+
+# Shared BlobServiceClient, created once per process and reused by the listing and every download thread
+blob_service_client = None
+blob_client_lock = threading.Lock()
+
+# Per-blob checkpoints, loaded from CHECKPOINT_PATH by read_blob_logs
+checkpoints = {}
+checkpoint_lock = threading.Lock()
+
+class StageStats:
+    """
+    Queue-depth and wait-time statistics of one pipeline stage. A stage whose upstream spends a long time
+    waiting to enqueue is saturated; a stage that spends a long time waiting to dequeue is starved.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.items = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.enqueue_wait = 0.0
+        self.dequeue_wait = 0.0
+
+    def record_enqueue(self, depth, waited):
+        with self.lock:
+            self.items += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+            self.enqueue_wait += waited
+
+    def record_dequeue(self, waited):
+        with self.lock:
+            self.dequeue_wait += waited
+
+    def summary(self):
+        with self.lock:
+            average_depth = self.depth_total / self.items if self.items else 0
+            return (f"{self.name}: {self.items} items, depth avg {average_depth:.1f} / max {self.max_depth} "
+                    f"of {self.capacity}, enqueue wait {self.enqueue_wait:.1f}s, dequeue wait {self.dequeue_wait:.1f}s")
+
+class StageQueue:
+    """
+    Bounded FIFO between two pipeline stages; put blocks while the queue is full.
+    """
+
+    def __init__(self, stats):
+        self.queue = queue.Queue(maxsize=stats.capacity)
+        self.stats = stats
+
+    def put(self, item):
+        start = time.monotonic()
+        self.queue.put(item)
+        self.stats.record_enqueue(self.queue.qsize(), time.monotonic() - start)
+
+    def get(self):
+        start = time.monotonic()
+        item = self.queue.get()
+        self.stats.record_dequeue(time.monotonic() - start)
+        return item
+
+class ParseStage:
+    """
+    Submits blocks to the parse process pool with at most `capacity` blocks in flight.
+    Returns futures so each blob's blocks keep their order in the writer queue.
+    """
+
+    def __init__(self, executor, stats):
+        self.executor = executor
+        self.stats = stats
+        self.slots = threading.BoundedSemaphore(stats.capacity)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def _release(self, future):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def submit(self, log_id, block):
+        if self.executor is None:
+            future = concurrent.futures.Future()
+            future.set_result(parse_log_block(log_id, block))
+            return future
+
+        start = time.monotonic()
+        self.slots.acquire()
+        with self.lock:
+            self.in_flight += 1
+            depth = self.in_flight
+        self.stats.record_enqueue(depth, time.monotonic() - start)
+        future = self.executor.submit(parse_log_block, log_id, block)
+        future.add_done_callback(self._release)
+        return future
+
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent pyodbc connections shared by the worker threads.
+    At most `size` connections are open at once; idle connections are health-checked before reuse.
+    """
+
+    def __init__(self, conn_str, size, health_check_interval):
+        self.conn_str = conn_str
+        self.health_check_interval = health_check_interval
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def _open(self):
+        return pyodbc.connect(self.conn_str)
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1").fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _checkout(self):
+        try:
+            connection, last_used = self.idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(connection):
+            logging.warning("Discarding unhealthy pooled database connection and reconnecting.")
+            metrics.inc("ingest_retries_total", reason="db_reconnect")
+            self._discard(connection)
+            return self._open()
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except pyodbc.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of a with-block. On error the transaction is rolled back,
+        and the connection is dropped if even the rollback fails.
+        """
+        self.slots.acquire()
+        connection = None
+        try:
+            connection = self._checkout()
+            yield connection
+        except Exception:
+            if connection is not None:
+                try:
+                    connection.rollback()
+                except pyodbc.Error:
+                    self._discard(connection)
+                    connection = None
+            raise
+        finally:
+            if connection is not None:
+                self.idle.put((connection, time.monotonic()))
+            self.slots.release()
+
+    def close_all(self):
+        """
+        Closes every idle connection in the pool.
+        """
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+# Connection pool used by every database function in this script
+db_pool = ConnectionPool(sql_conn_str, DB_POOL_SIZE, DB_POOL_HEALTH_CHECK_INTERVAL)
 
 def extract_db_connection_info(conn_str):
     """
@@ -81,52 +326,309 @@ def extract_db_connection_info(conn_str):
 def filter_log_lines(lines):
     """
     Filters log lines to only include those with error codes and severities.
+    Lines are consumed and yielded lazily so any iterable, including a stream, can be passed in.
     """
-    filtered_lines = []
     for line in lines:
         if "Error:" in line and "Severity:" in line:
-            filtered_lines.append(line)
-    return filtered_lines
+            yield line
 
 def detect_file_encoding(data):
     """
-    Detects the encoding of the given data.
+    Detects the encoding of the given data using chardet on at most ENCODING_SAMPLE_SIZE bytes.
     """
     try:
-        result = chardet.detect(data)
+        result = chardet.detect(data[:ENCODING_SAMPLE_SIZE])
         encoding = result['encoding']
+        # An ASCII-only sample says nothing about the rest of the file; UTF-8 is the compatible superset
+        if encoding == 'ascii':
+            encoding = 'utf-8'
         logging.info(f"Detected file encoding: {encoding}")
         return encoding
     except Exception as e:
         logging.error(f"An error occurred while detecting file encoding: {str(e)}")
         return None
 
+def detect_bom_encoding(data, continuation=False):
+    """
+    Returns the encoding indicated by a byte order mark at the start of data, or None.
+    With continuation=True, returns the byte-order-explicit encoding for decoding later parts of the same stream.
+    """
+    for bom, encoding, continuation_encoding in ENCODING_BOMS:
+        if data.startswith(bom):
+            return continuation_encoding if continuation else encoding
+    return None
+
+def detect_blob_encoding(data, servername, logfiletype):
+    """
+    Detects the encoding of a blob from its first chunk: BOM first (not cached, it is in the data), then the
+    per-server cache of chardet results, then chardet on a bounded sample. The path taken is counted in encoding_detection_stats.
+    """
+    cache_key = (servername, logfiletype)
+    start = time.perf_counter()
+
+    encoding = detect_bom_encoding(data)
+    if encoding:
+        path = 'bom'
+    else:
+        with encoding_cache_lock:
+            encoding = encoding_cache.get(cache_key)
+        if encoding:
+            path = 'cache'
+        else:
+            encoding = detect_file_encoding(data)
+            if encoding:
+                path = 'chardet'
+                with encoding_cache_lock:
+                    encoding_cache[cache_key] = encoding
+            else:
+                path = 'default'
+                encoding = 'utf-8'
+
+    with encoding_cache_lock:
+        encoding_detection_stats[path] += 1
+    metrics.observe("ingest_encoding_detection_seconds", time.perf_counter() - start, path=path)
+    return encoding
+
+def iter_download_chunks(download_stream):
+    """
+    Yields the raw chunks of a blob download, counting the bytes downloaded.
+    """
+    for chunk in download_stream.chunks():
+        metrics.inc("ingest_bytes_downloaded_total", len(chunk))
+        yield chunk
+
+class ChunkReader:
+    """
+    Minimal file-like reader over an iterator of byte chunks, for decompressors that pull their input.
+    A read returns at most the rest of the current chunk; b"" means the chunks are exhausted.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = b""
+        self.position = 0
+
+    def read(self, size=-1):
+        while self.position >= len(self.chunk):
+            self.chunk = next(self.chunks, None)
+            self.position = 0
+            if self.chunk is None:
+                self.chunk = b""
+                return b""
+        end = len(self.chunk) if size is None or size < 0 else self.position + size
+        data = self.chunk[self.position:end]
+        self.position += len(data)
+        return data
+
+def iter_blob_chunks(download_stream, codec):
+    """
+    Yields the content of a blob download chunk by chunk, decompressing according to the
+    'codec' metadata written by the collector. No decompressed chunk is larger than STREAM_CHUNK_SIZE.
+    The collector also sets the blob's Content-Encoding, which an HTTP client may already have decoded;
+    the codec's magic bytes at the start of the download tell which.
+    """
+    raw_chunks = iter_download_chunks(download_stream)
+    if codec:
+        first_chunk = next(raw_chunks, b"")
+        if not first_chunk.startswith(CODEC_MAGIC_BYTES[codec]):
+            codec = None
+        raw_chunks = chain([first_chunk], raw_chunks)
+
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed.")
+        # The decompressor pulls its input, so one small but highly compressed chunk cannot expand in one piece
+        reader = ChunkReader(raw_chunks)
+        for data in zstandard.ZstdDecompressor().read_to_iter(reader, write_size=STREAM_CHUNK_SIZE):
+            yield data
+    elif codec == 'gzip':
+        decompressor = zlib.decompressobj(wbits=31)
+        for chunk in raw_chunks:
+            while chunk:
+                data = decompressor.decompress(chunk, STREAM_CHUNK_SIZE)
+                chunk = decompressor.unconsumed_tail
+                if data:
+                    yield data
+        data = decompressor.flush()
+        if data:
+            yield data
+    else:
+        for chunk in raw_chunks:
+            yield chunk
+
+def encoded_line_break(encoding):
+    """
+    Returns the bytes of a line break in the given encoding, without the BOM some codecs prepend.
+    """
+    return "\n\n".encode(encoding)[len("\n".encode(encoding)):]
+
+def record_raw_chunk(stream_stats, raw_chunk):
+    """
+    Adds a raw chunk to stream_stats['bytes']. With stream_stats['newline'] (the encoded line break) it also
+    records in stream_stats['line_end'] the raw byte position just after the last complete line, counted from
+    the start of the pass, so a resume offset never depends on re-encoding decoded (possibly replaced) text.
+    """
+    position = stream_stats['bytes']
+    stream_stats['bytes'] += len(raw_chunk)
+    newline = stream_stats.get('newline')
+    if not newline:
+        return
+    # The last bytes of the previous chunk are searched again, so a multi-byte line break split across chunks is found
+    data = stream_stats['carry'] + raw_chunk
+    start = position - len(stream_stats['carry'])
+    index = data.rfind(newline)
+    # In UTF-16 and UTF-32 a line break only counts where it starts on a code unit boundary
+    while index >= 0 and (start + index) % len(newline):
+        index = data.rfind(newline, 0, index + len(newline) - 1)
+    if index >= 0:
+        stream_stats['line_end'] = start + index + len(newline)
+    stream_stats['carry'] = data[len(data) - (len(newline) - 1):]
+
+def iter_text_chunks(first_text, raw_chunks, decoder, stream_stats):
+    """
+    Decodes raw chunks incrementally and records the raw size (see record_raw_chunk) and whether
+    "SQL Server" appears anywhere in the stream in stream_stats.
+    """
+    marker = "SQL Server"
+    tail = first_text[-(len(marker) - 1):]
+    for raw_chunk in raw_chunks:
+        record_raw_chunk(stream_stats, raw_chunk)
+        text_chunk = decoder.decode(raw_chunk)
+        if not stream_stats['sql_server'] and marker in tail + text_chunk:
+            stream_stats['sql_server'] = True
+        tail = text_chunk[-(len(marker) - 1):]
+        yield text_chunk
+    text_chunk = decoder.decode(b"", final=True)
+    if not stream_stats['sql_server'] and marker in tail + text_chunk:
+        stream_stats['sql_server'] = True
+    yield text_chunk
+
+def iter_line_blocks(text_chunks, hold_partial_line=False):
+    """
+    Re-cuts a stream of decoded text chunks into blocks that end on a line boundary,
+    carrying the partial last line of each chunk over to the next block. With hold_partial_line, the partial
+    last line of the stream is not yielded; the next pass reads it whole.
+    """
+    pending = ""
+    for text_chunk in text_chunks:
+        block = pending + text_chunk
+        end = block.rfind("\n") + 1
+        pending = block[end:]
+        if end:
+            yield block[:end]
+    if pending and not hold_partial_line:
+        yield pending
+
+def load_checkpoints():
+    """
+    Loads the per-blob ingestion checkpoints from CHECKPOINT_PATH.
+    """
+    if not os.path.exists(CHECKPOINT_PATH):
+        return {}
+    try:
+        with open(CHECKPOINT_PATH, "r") as file:
+            return json.load(file)
+    except Exception as e:
+        logging.error(f"An error occurred while reading checkpoints, starting without them: {str(e)}")
+        return {}
+
+def update_checkpoint(blob_name, **fields):
+    """
+    Updates the checkpoint of one blob and persists all checkpoints atomically.
+    """
+    with checkpoint_lock:
+        checkpoints.setdefault(blob_name, {}).update(fields)
+        temp_path = CHECKPOINT_PATH + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(checkpoints, file, indent=2)
+        os.replace(temp_path, CHECKPOINT_PATH)
+
+def is_blob_unchanged(blob):
+    """
+    Returns True when the blob was fully ingested before and its etag has not changed since.
+    """
+    with checkpoint_lock:
+        checkpoint = checkpoints.get(blob.name)
+    return bool(checkpoint) and checkpoint.get('status') == 'complete' and checkpoint.get('etag') == blob.etag
+
+def get_blob_service_client():
+    """
+    Returns the process-wide BlobServiceClient, creating it on first use with a connection pool sized for
+    the download threads and downloads in chunks of STREAM_CHUNK_SIZE.
+    """
+    global blob_service_client
+    with blob_client_lock:
+        if blob_service_client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=DOWNLOAD_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            transport = RequestsTransport(session=session, session_owner=False)
+            blob_service_client = BlobServiceClient.from_connection_string(
+                azure_storage_connection_string, transport=transport,
+                max_single_get_size=STREAM_CHUNK_SIZE, max_chunk_get_size=STREAM_CHUNK_SIZE
+            )
+        return blob_service_client
+
 def read_blob_logs():
     """
     Reads logs from Azure Blob Storage and processes each blob.
     """
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(azure_storage_connection_string)
-        container_client = blob_service_client.get_container_client("logs")
+        container_client = get_blob_service_client().get_container_client("logs")
 
-        blobs = list(container_client.list_blobs())
+        blobs = list(container_client.list_blobs(include=['metadata']))
         logging.info(f"Found {len(blobs)} blobs in the container.")
 
         if not blobs:
             logging.warning("No blobs found in the container. Exiting.")
             return
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [executor.submit(process_blob, blob) for blob in blobs]
-            concurrent.futures.wait(futures)
+        # Skip blobs already ingested in full without downloading them
+        checkpoints.update(load_checkpoints())
+        changed_blobs = [blob for blob in blobs if not is_blob_unchanged(blob)]
+        logging.info(f"Skipping {len(blobs) - len(changed_blobs)} unchanged blobs.")
+        metrics.inc("ingest_blobs_total", len(blobs) - len(changed_blobs), result="unchanged")
+        blobs = changed_blobs
+
+        parse_stats = StageStats("parse", PARSE_QUEUE_SIZE)
+        write_queues = [StageQueue(StageStats(f"writer {index}", WRITE_QUEUE_SIZE)) for index in range(WRITER_WORKERS)]
+
+        parse_executor = None
+        if PARSE_WORKERS:
+            parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+            # Start the parse processes before any pipeline thread exists, so no held lock is copied into them
+            list(parse_executor.map(abs, range(PARSE_WORKERS)))
+        try:
+            parse_stage = ParseStage(parse_executor, parse_stats)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=WRITER_WORKERS) as writer_executor:
+                writers = [writer_executor.submit(write_blob_entries, write_queue) for write_queue in write_queues]
+
+                # Each blob goes to one writer so its batches and checkpoints stay in order
+                with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_executor:
+                    futures = [download_executor.submit(process_blob, blob, parse_stage, write_queues[zlib.crc32(blob.name.encode()) % WRITER_WORKERS])
+                               for blob in blobs]
+                    concurrent.futures.wait(futures)
+
+                for write_queue in write_queues:
+                    write_queue.put(None)
+                concurrent.futures.wait(writers)
+        finally:
+            if parse_executor:
+                parse_executor.shutdown()
+
+        logging.info(f"Pipeline stage statistics - {parse_stats.summary()}")
+        for write_queue in write_queues:
+            logging.info(f"Pipeline stage statistics - {write_queue.stats.summary()}")
 
     except Exception as e:
         logging.error(f"An error occurred while reading blob logs: {str(e)}")
 
-def process_blob(blob):
+def process_blob(blob, parse_stage, write_queue):
     """
-    Processes each log file (blob) by extracting its content and filtering the relevant lines.
+    Download stage: streams and decodes a blob, cuts it into blocks of complete lines, submits each block
+    to the parse stage and queues the resulting futures, in order, for the blob's writer.
     """
+    blob_state = None
     try:
         logging.info(f"Processing blob: {blob.name}")
 
@@ -139,56 +641,206 @@ def process_blob(blob):
         logfile_gen_date = blob.creation_time
         LogExtractedTime = datetime.now()
 
-        blob_client = BlobServiceClient.from_connection_string(azure_storage_connection_string).get_blob_client(container="logs", blob=blob.name)
-        download_stream = blob_client.download_blob()
-        raw_data = download_stream.readall()
+        codec = (blob.metadata or {}).get('codec')
 
-        # Detect file encoding
-        encoding = detect_file_encoding(raw_data)
-        if not encoding:
-            encoding = 'utf-8'
+        with checkpoint_lock:
+            checkpoint = dict(checkpoints.get(blob.name, {}))
+
+        # Decide where this pass starts: fresh blob, resumed crashed pass, new bytes of an append blob, or a rewritten blob.
+        # An append blob changes its etag as it grows, so it is matched on its creation time: a blob deleted and
+        # recreated under the same name starts over even when it has grown past the checkpointed offset.
+        log_id = checkpoint.get('log_id')
+        same_append_blob = blob.blob_type == BlobType.APPENDBLOB and checkpoint.get('creation_time') == str(blob.creation_time)
+        offset = 0
+        pass_start_log_date = None
+        cutoff_log_date = None
+        pass_write_from = None
+        if checkpoint.get('status') == 'in_progress' and (checkpoint.get('etag') == blob.etag or same_append_blob):
+            offset = checkpoint['pass_offset']
+            pass_start_log_date = checkpoint.get('pass_start_log_date')
+            # Only LogDates of rows the crashed pass itself (possibly) wrote; none means it wrote nothing
+            pass_write_from = checkpoint.get('pass_write_from')
+            cutoff_log_date = checkpoint.get('last_log_date') or pass_write_from
+            logging.info(f"Resuming interrupted ingestion of {blob.name} from offset {offset}, LogDate {cutoff_log_date}")
+            metrics.inc("ingest_retries_total", reason="resumed_pass")
+        elif checkpoint.get('status') == 'complete' and same_append_blob and not codec and blob.size > checkpoint['offset']:
+            offset = checkpoint['offset']
+            pass_start_log_date = checkpoint.get('last_log_date')
+            logging.info(f"Ingesting {blob.size - offset} appended bytes of {blob.name} from offset {offset}")
+        elif log_id:
+            logging.info(f"Blob {blob.name} was rewritten; replacing its previously ingested rows")
+
+        # Rows written after the last checkpoint of a crashed pass (or all rows of a rewritten blob) are removed first.
+        # Rows at the LogDate where the pass started belong to the previous pass, which is not read again, so at
+        # that LogDate the crashed pass's rows are kept and the re-read entries skipped.
+        cutoff = datetime.fromisoformat(cutoff_log_date) if cutoff_log_date else None
+        cutoff_inclusive = not (cutoff and pass_start_log_date and cutoff <= datetime.fromisoformat(pass_start_log_date))
+        if log_id and (cutoff or offset == 0):
+            if not log_sink.delete_log_messages(log_id, cutoff, inclusive=cutoff_inclusive):
+                raise RuntimeError(f"Could not remove partially ingested rows for LogID {log_id}")
+
+        blob_client = get_blob_service_client().get_blob_client(container="logs", blob=blob.name)
+        download_stream = blob_client.download_blob(offset=offset or None)
+        raw_chunks = iter_blob_chunks(download_stream, codec)
+        first_chunk = next(raw_chunks, b"")
+
+        # Detect file encoding from the first chunk; a pass starting mid-blob reuses the encoding recorded for it
+        if offset:
+            encoding = checkpoint['encoding']
+        else:
+            encoding = detect_blob_encoding(first_chunk, servername, logfiletype)
 
         try:
-            log_content = raw_data.decode(encoding)
-        except UnicodeDecodeError as e:
-            logging.error(f"Decoding error with {encoding} encoding: {str(e)}. Trying with fallback encoding 'ISO-8859-1'.")
-            log_content = raw_data.decode('ISO-8859-1', errors='replace')
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            logging.error(f"Unknown encoding {encoding}. Trying with fallback encoding 'ISO-8859-1'.")
+            encoding = 'ISO-8859-1'
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
 
-        logging.info(f"Downloaded log file: {LogFileName} from server: {servername}")
+        logging.info(f"Streaming log file: {LogFileName} from server: {servername}")
 
-        if "SQL Server" not in log_content:
+        # The header in the first chunk normally identifies SQL Server; the rest of the stream is checked as it is read
+        first_text = decoder.decode(first_chunk)
+        if offset:
+            db_type = checkpoint['db_type']
+        elif "SQL Server" not in first_text:
             db_type = "other"
 
-        log_id = insert_log_details(servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime)
+        reused_log_details = bool(log_id)
+        if not log_id:
+            log_id = log_sink.insert_log_details(servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime)
         
         if log_id:
-            lines = log_content.splitlines()
-            filtered_lines = filter_log_lines(lines)
-            log_entries = []
+            continuation_encoding = encoding if offset else (detect_bom_encoding(first_chunk, continuation=True) or encoding)
+            update_checkpoint(
+                blob.name, status='in_progress', etag=blob.etag, creation_time=str(blob.creation_time), log_id=log_id,
+                pass_offset=offset, pass_start_log_date=pass_start_log_date, pass_write_from=pass_write_from,
+                last_log_date=cutoff_log_date, db_type=db_type, encoding=continuation_encoding
+            )
 
-            for line in filtered_lines:
-                log_entry = process_log_line(log_id, line)
-                if log_entry:
-                    log_entries.append(log_entry)
+            # An uncompressed append blob may be mid-line at its end: the partial line is left for the next pass,
+            # and the checkpoint offset is the raw position after the last complete line
+            track_line_end = blob.blob_type == BlobType.APPENDBLOB and not codec
+            stream_stats = {'bytes': 0, 'sql_server': db_type == "MSSQL"}
+            if track_line_end:
+                stream_stats.update(newline=encoded_line_break(continuation_encoding), carry=b"", line_end=0)
+            record_raw_chunk(stream_stats, first_chunk)
 
-                if len(log_entries) >= BATCH_SIZE:
-                    batch_insert_log_lines(log_entries)
-                    log_entries = []
+            # Everything the writer needs to finish the blob; stream_stats is complete once 'end' is queued
+            blob_state = {
+                'name': blob.name, 'log_id': log_id, 'offset': offset, 'codec': codec,
+                'cutoff': cutoff, 'cutoff_inclusive': cutoff_inclusive, 'written': bool(cutoff_log_date),
+                'encoding': continuation_encoding,
+                'LogFileSize': LogFileSize, 'db_type': db_type, 'reused_log_details': reused_log_details,
+                'stream_stats': stream_stats,
+                'pending': [], 'failed': False
+            }
+            text_chunks = iter_text_chunks(first_text, raw_chunks, decoder, blob_state['stream_stats'])
 
-            if log_entries:
-                batch_insert_log_lines(log_entries)
+            for block in iter_line_blocks(chain([first_text], text_chunks), hold_partial_line=track_line_end):
+                if blob_state['failed']:
+                    break
+                # Counting lines costs a pass over the block, so it is skipped while metrics are disabled
+                if metrics.metrics_enabled:
+                    metrics.inc("ingest_lines_scanned_total", block.count("\n"))
+                write_queue.put(('block', blob_state, parse_stage.submit(log_id, block)))
 
     except Exception as e:
         logging.error(f"An error occurred while processing blob: {str(e)}")
+        if blob_state:
+            blob_state['failed'] = True
+    finally:
+        if blob_state:
+            write_queue.put(('end', blob_state, None))
+
+def write_blob_entries(write_queue):
+    """
+    Writer stage: collects parsed entries per blob, writes them through the sink in batches of the
+    sink's batch size with checkpoints, and completes each blob when its 'end' item arrives.
+    """
+    while True:
+        item = write_queue.get()
+        if item is None:
+            return
+        kind, blob_state, future = item
+        if blob_state['failed']:
+            if kind == 'end':
+                metrics.inc("ingest_blobs_total", result="failed")
+            continue
+
+        try:
+            log_entries = blob_state['pending']
+            if kind == 'block':
+                block_entries = future.result()
+                metrics.inc("ingest_lines_matched_total", len(block_entries))
+                if blob_state['cutoff']:
+                    # Entries before the checkpointed LogDate were already written by the interrupted pass
+                    cutoff = blob_state['cutoff']
+                    if blob_state['cutoff_inclusive']:
+                        block_entries = [log_entry for log_entry in block_entries if log_entry[1] >= cutoff]
+                    else:
+                        block_entries = [log_entry for log_entry in block_entries if log_entry[1] > cutoff]
+                log_entries.extend(block_entries)
+
+                batch_size = log_sink.batch_size
+                if len(log_entries) >= batch_size:
+                    full_batches_end = len(log_entries) - len(log_entries) % batch_size
+                    for start in range(0, full_batches_end, batch_size):
+                        write_checkpointed_batch(blob_state, log_entries[start:start + batch_size])
+                    blob_state['pending'] = log_entries[full_batches_end:]
+                continue
+
+            if log_entries:
+                write_checkpointed_batch(blob_state, log_entries)
+                blob_state['pending'] = []
+
+            # Correct the LogDetails row when the full stream disagrees with what was known up front
+            stream_stats = blob_state['stream_stats']
+            stream_db_type = "MSSQL" if stream_stats['sql_server'] else "other"
+            stream_file_size = round(stream_stats['bytes'] / 1024, 2) if blob_state['codec'] else blob_state['LogFileSize']
+            if blob_state['reused_log_details'] or stream_db_type != blob_state['db_type'] or stream_file_size != blob_state['LogFileSize']:
+                log_sink.update_log_details(blob_state['log_id'], stream_file_size, stream_db_type)
+
+            # The checkpoint offset is the end of the last complete line; a partial last line is read again next pass
+            pass_bytes = stream_stats['line_end'] if 'line_end' in stream_stats else stream_stats['bytes']
+            update_checkpoint(blob_state['name'], status='complete', offset=blob_state['offset'] + pass_bytes,
+                              db_type=stream_db_type)
+            metrics.inc("ingest_blobs_total", result="ingested")
+
+        except Exception as e:
+            logging.error(f"An error occurred while writing blob {blob_state['name']}: {str(e)}")
+            blob_state['failed'] = True
+            if kind == 'end':
+                metrics.inc("ingest_blobs_total", result="failed")
+
+def write_checkpointed_batch(blob_state, log_entries):
+    """
+    Writes a batch through the sink and advances the blob's LogDate checkpoint. A failed write raises,
+    leaving the checkpoint in progress so the next run resumes from the last written batch. Before the
+    first write of a pass its first LogDate is recorded, so a crash during that write is cleaned up too.
+    """
+    blob_name = blob_state['name']
+    if not blob_state['written']:
+        update_checkpoint(blob_name, pass_write_from=min(log_entry[1] for log_entry in log_entries).isoformat(sep=' '))
+        blob_state['written'] = True
+    with metrics.timer("ingest_batch_write_seconds", sink=LOG_SINK):
+        written = log_sink.write(log_entries)
+    if not written:
+        metrics.inc("ingest_batches_total", result="failed")
+        raise RuntimeError(f"Writing a batch of {len(log_entries)} log lines for {blob_name} failed")
+    metrics.inc("ingest_batches_total", result="written")
+    metrics.inc("ingest_rows_inserted_total", len(log_entries))
+    last_log_date = max(log_entry[1] for log_entry in log_entries)
+    update_checkpoint(blob_name, last_log_date=last_log_date.isoformat(sep=' '))
 
 def batch_insert_log_lines(log_entries):
     """
-    Batch inserts log entries into the LogMessages table.
+    Batch inserts log entries into the LogMessages table. Returns True on success.
     """
     try:
-        with db_lock:
-            connection = pyodbc.connect(sql_conn_str)
+        with db_pool.connection() as connection:
             cursor = connection.cursor()
+            cursor.fast_executemany = True
 
             insert_query = """
             INSERT INTO [dbo].[LogMessages] (LogID, LogDate, LogMessageType, ErrorCode, Severity, LogMessage, Euser)
@@ -202,34 +854,86 @@ def batch_insert_log_lines(log_entries):
             connection.commit()
 
             cursor.close()
-            connection.close()
 
             logging.info(f"Batch insert of {len(log_entries)} log lines completed.")
+        return True
     except Exception as e:
         logging.error(f"An error occurred during batch insertion: {str(e)}")
+        return False
+
+def bulk_insert_log_lines(log_entries):
+    """
+    Loads log entries into a session temp staging table with fast_executemany, then moves them into
+    the LogMessages table with one set-based INSERT ... SELECT, optionally filling LogMessage from sys.messages.
+    Returns True on success.
+    """
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.fast_executemany = True
+
+            # The temp table lives as long as the pooled connection, so it is created once per connection
+            cursor.execute("""
+            IF OBJECT_ID('tempdb..#LogMessagesStaging') IS NULL
+                CREATE TABLE #LogMessagesStaging (
+                    LogID BIGINT NOT NULL, LogDate DATETIME2(3) NOT NULL, LogMessageType VARCHAR(20) NOT NULL,
+                    ErrorCode INT NOT NULL, Severity INT NOT NULL, Euser NVARCHAR(128) NOT NULL
+                )
+            """)
+
+            log_entries_with_user = [(log_id, log_date, log_message_type, error_code, severity, executing_user)
+                                     for (log_id, log_date, log_message_type, error_code, severity) in log_entries]
+            cursor.executemany("""
+            INSERT INTO #LogMessagesStaging (LogID, LogDate, LogMessageType, ErrorCode, Severity, Euser)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, log_entries_with_user)
+
+            if FILL_LOG_MESSAGE_ON_MERGE:
+                cursor.execute("""
+                INSERT INTO [dbo].[LogMessages] (LogID, LogDate, LogMessageType, ErrorCode, Severity, LogMessage, Euser)
+                SELECT s.LogID, s.LogDate, s.LogMessageType, s.ErrorCode, s.Severity, m.text, s.Euser
+                FROM #LogMessagesStaging s
+                LEFT JOIN sys.messages m ON m.message_id = s.ErrorCode AND m.language_id = ?
+                """, (SYS_MESSAGES_LANGUAGE_ID,))
+            else:
+                cursor.execute("""
+                INSERT INTO [dbo].[LogMessages] (LogID, LogDate, LogMessageType, ErrorCode, Severity, LogMessage, Euser)
+                SELECT LogID, LogDate, LogMessageType, ErrorCode, Severity, NULL, Euser
+                FROM #LogMessagesStaging
+                """)
+
+            cursor.execute("TRUNCATE TABLE #LogMessagesStaging")
+            connection.commit()
+
+            cursor.close()
+
+            logging.info(f"Bulk load of {len(log_entries)} log lines completed.")
+        return True
+    except Exception as e:
+        logging.error(f"An error occurred during bulk load: {str(e)}")
+        return False
 
 def insert_log_details(servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime):
     """
     Inserts details of the processed log file into the LogDetails table.
     """
     try:
-        connection = pyodbc.connect(sql_conn_str)
-        cursor = connection.cursor()
-
-        insert_query = """
-        INSERT INTO [dbo].[LogDetails] (ServerName, LogFileName, LogFileSize, LogFileType, Source, DB_Type, logfile_gen_date, LogExtractedTime, Euser)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(insert_query, (servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime, executing_user))
-        connection.commit()
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
 
-        cursor.execute("SELECT @@IDENTITY AS LogID")
-        log_id = cursor.fetchone()[0]
+            # OUTPUT INSERTED returns the new LogID in the same round trip as the insert
+            insert_query = """
+            INSERT INTO [dbo].[LogDetails] (ServerName, LogFileName, LogFileSize, LogFileType, Source, DB_Type, logfile_gen_date, LogExtractedTime, Euser)
+            OUTPUT INSERTED.LogID
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            cursor.execute(insert_query, (servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime, executing_user))
+            log_id = cursor.fetchone()[0]
+            connection.commit()
 
-        logging.info(f"Inserted log details for file: {LogFileName} with LogID: {log_id}")
+            logging.info(f"Inserted log details for file: {LogFileName} with LogID: {log_id}")
 
-        cursor.close()
-        connection.close()
+            cursor.close()
 
         return log_id
 
@@ -237,6 +941,50 @@ def insert_log_details(servername, LogFileName, LogFileSize, logfiletype, source
         logging.error(f"An error occurred while inserting log details: {str(e)}")
         return None
 
+def update_log_details(log_id, LogFileSize, db_type):
+    """
+    Updates the size and database type of a LogDetails row once the whole blob has been streamed.
+    """
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+
+            cursor.execute("UPDATE [dbo].[LogDetails] SET LogFileSize = ?, DB_Type = ? WHERE LogID = ?", (LogFileSize, db_type, log_id))
+            connection.commit()
+
+            cursor.close()
+
+        logging.info(f"Updated log details for LogID: {log_id}")
+
+    except Exception as e:
+        logging.error(f"An error occurred while updating log details: {str(e)}")
+
+def delete_log_messages(log_id, from_log_date=None, inclusive=True):
+    """
+    Deletes the LogMessages rows of a LogID, only those with LogDate >= from_log_date when given
+    (LogDate > from_log_date with inclusive=False). Returns True on success.
+    """
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+
+            if from_log_date is None:
+                cursor.execute("DELETE FROM [dbo].[LogMessages] WHERE LogID = ?", (log_id,))
+            else:
+                operator = ">=" if inclusive else ">"
+                cursor.execute(f"DELETE FROM [dbo].[LogMessages] WHERE LogID = ? AND LogDate {operator} ?", (log_id, from_log_date))
+            deleted_rows = cursor.rowcount
+            connection.commit()
+
+            cursor.close()
+
+        logging.info(f"Deleted {deleted_rows} previously ingested rows for LogID: {log_id}")
+        return True
+
+    except Exception as e:
+        logging.error(f"An error occurred while deleting log messages: {str(e)}")
+        return False
+
 def process_log_line(log_id, line):
     """
     Processes each log line to extract relevant information including ErrorCode and Severity.
@@ -275,8 +1023,7 @@ def execute_stored_procedure():
     Executes the stored procedure to update LogMessage in the LogMessages table.
     """
     try:
-        with db_lock:
-            connection = pyodbc.connect(sql_conn_str)
+        with db_pool.connection() as connection:
             cursor = connection.cursor()
 
             # Execute the stored procedure
@@ -284,22 +1031,148 @@ def execute_stored_procedure():
             connection.commit()
 
             cursor.close()
-            connection.close()
             logging.info("Stored procedure executed successfully to update LogMessage.")
     except Exception as e:
         logging.error(f"An error occurred while executing the stored procedure: {str(e)}")
 
-if __name__ == "__main__":
+class SqlServerRowSink:
+    """
+    Original sink: parameterized executemany into LogMessages in BATCH_SIZE batches,
+    followed by EXEC UpdateLogMessages to fill LogMessage.
+    """
+    batch_size = BATCH_SIZE
+
+    def insert_log_details(self, *log_details):
+        return insert_log_details(*log_details)
+
+    def update_log_details(self, log_id, LogFileSize, db_type):
+        update_log_details(log_id, LogFileSize, db_type)
+
+    def delete_log_messages(self, log_id, from_log_date=None, inclusive=True):
+        return delete_log_messages(log_id, from_log_date, inclusive)
+
+    def write(self, log_entries):
+        return batch_insert_log_lines(log_entries)
+
+    def finalize(self):
+        execute_stored_procedure()
+
+class SqlServerBulkSink(SqlServerRowSink):
+    """
+    Bulk sink: BULK_BATCH_SIZE rows per staging-table load and set-based merge into LogMessages.
+    """
+    batch_size = BULK_BATCH_SIZE
+
+    def write(self, log_entries):
+        return bulk_insert_log_lines(log_entries)
+
+    def finalize(self):
+        # LogMessage was filled during the merge, so the separate full-table pass is only needed when that is off
+        if not FILL_LOG_MESSAGE_ON_MERGE:
+            execute_stored_procedure()
+
+class SQLiteSink:
+    """
+    Local stand-in for SQL Server: writes LogDetails and LogMessages to a SQLite file so ingestion
+    can be run and tested without a database server. LogMessage is left NULL.
+    """
+    batch_size = BULK_BATCH_SIZE
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS LogDetails (
+                LogID INTEGER PRIMARY KEY AUTOINCREMENT, ServerName TEXT, LogFileName TEXT, LogFileSize REAL,
+                LogFileType TEXT, Source TEXT, DB_Type TEXT, logfile_gen_date TEXT, LogExtractedTime TEXT, Euser TEXT
+            );
+            CREATE TABLE IF NOT EXISTS LogMessages (
+                LogID INTEGER, LogDate TEXT, LogMessageType TEXT, ErrorCode INTEGER, Severity INTEGER,
+                LogMessage TEXT, Euser TEXT
+            );
+            """)
+
+    def insert_log_details(self, servername, LogFileName, LogFileSize, logfiletype, source, db_type, logfile_gen_date, LogExtractedTime):
+        with self.lock:
+            cursor = self.connection.execute("""
+            INSERT INTO LogDetails (ServerName, LogFileName, LogFileSize, LogFileType, Source, DB_Type, logfile_gen_date, LogExtractedTime, Euser)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (servername, LogFileName, LogFileSize, logfiletype, source, db_type,
+                  str(logfile_gen_date), LogExtractedTime.isoformat(sep=' '), executing_user))
+            self.connection.commit()
+            return cursor.lastrowid
+
+    def update_log_details(self, log_id, LogFileSize, db_type):
+        with self.lock:
+            self.connection.execute("UPDATE LogDetails SET LogFileSize = ?, DB_Type = ? WHERE LogID = ?", (LogFileSize, db_type, log_id))
+            self.connection.commit()
+
+    def delete_log_messages(self, log_id, from_log_date=None, inclusive=True):
+        with self.lock:
+            if from_log_date is None:
+                self.connection.execute("DELETE FROM LogMessages WHERE LogID = ?", (log_id,))
+            else:
+                operator = ">=" if inclusive else ">"
+                self.connection.execute(f"DELETE FROM LogMessages WHERE LogID = ? AND LogDate {operator} ?",
+                                        (log_id, from_log_date.isoformat(sep=' ')))
+            self.connection.commit()
+        return True
+
+    def write(self, log_entries):
+        with self.lock:
+            self.connection.executemany("""
+            INSERT INTO LogMessages (LogID, LogDate, LogMessageType, ErrorCode, Severity, LogMessage, Euser)
+            VALUES (?, ?, ?, ?, ?, NULL, ?)
+            """, [(log_id, log_date.isoformat(sep=' '), log_message_type, error_code, severity, executing_user)
+                  for (log_id, log_date, log_message_type, error_code, severity) in log_entries])
+            self.connection.commit()
+        return True
+
+    def finalize(self):
+        with self.lock:
+            self.connection.close()
+
+def create_log_sink(kind):
+    """
+    Creates the LogMessages sink selected by LOG_SINK.
+    """
+    if kind == "rows":
+        return SqlServerRowSink()
+    if kind == "bulk":
+        return SqlServerBulkSink()
+    if kind == "sqlite":
+        return SQLiteSink(SQLITE_SINK_PATH)
+    raise ValueError(f"Unknown log sink: {kind}")
+
+# Sink used by process_blob for LogDetails and LogMessages
+log_sink = create_log_sink(LOG_SINK)
+
+def main():
+    """
+    Runs one ingestion pass: reads every changed blob through the pipeline and finishes the sink.
+    """
     logging.info("Log extraction process started.")
     
     # Extract and log database connection details
     extract_db_connection_info(sql_conn_str)
 
     # Start the log reading process
-    read_blob_logs()
+    with metrics.stage("ingest.read_blobs"):
+        read_blob_logs()
+    logging.info(f"Encoding detection paths taken: {encoding_detection_stats}")
+
+    # Finish the sink; for SQL Server this runs the stored procedure to update LogMessage when still needed
+    with metrics.stage("ingest.finalize"):
+        log_sink.finalize()
 
-    # Execute the stored procedure to update LogMessage
-    execute_stored_procedure()
+    db_pool.close_all()
 
     logging.info("Log extraction process completed.")
     logging.info(">>-----------------------------------------------<<")
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        metrics.export("ingestion")
@@ -6,10 +6,32 @@ This script performs log parsing, anomaly detection, and predictive modeling on
 It uses machine learning techniques such as TF-IDF and DBSCAN for feature extraction and clustering, and Prophet for forecasting future issues.
 
 Key Features:
-- Parses log messages and identifies error patterns.
-- Detects anomalies in log data using DBSCAN clustering.
-- Predicts future issues using Prophet for time-series forecasting.
-- Stores processed data and forecasts in the SQL Server database.
+- Streams the stored procedure result in chunks through a server-side cursor, converting each chunk to compact
+  dtypes (categoricals, downcast integers, datetime64), classifying and mining it, and spilling it to disk before
+  the next is fetched. Only group-level aggregates stay in memory (row counts per template, issue counts per
+  forecast bucket, the newest LogDate per log file); the save reads the spilled chunks back one at a time.
+- Parses log messages and identifies error patterns using an external rule table
+  (issue_classification_rules.csv) compiled into one regex of per-rule lookaheads, evaluated once per distinct
+  message; each lookahead scans the message on its own, so matching cost still grows with the number of rules.
+- Mines message templates online (Drain-style, variable tokens masked) into a persistent template store,
+  and clusters once per distinct template weighted by its row count, broadcasting labels back to rows.
+- Detects anomalies in log data using DBSCAN clustering on sparse float32 TF-IDF features, either on all rows
+  (chunked sparse radius-neighbors graph, capped at dbscan_max_neighbors per row) or in a sampled mode that
+  scales to millions of rows.
+- Incremental mode: only rows past a persisted watermark (new log files, and rows appended to open log files)
+  are fetched and assigned to the clusters of a persisted model, and the daily forecast is refreshed from the
+  rollup; full refits (all history, re-clustering) run on a schedule.
+- Caches fitted artifacts on disk (vectorizer and cluster assignments, Prophet forecasts with their serialized
+  models, and warm-start parameters)
+  keyed by a content hash of their input and parameters, with LRU size bounds; unchanged input skips fitting
+  and changed series warm-start from their last cached Prophet parameters.
+- Predicts future issues using Prophet for time-series forecasting over issue counts per hourly or daily
+  bucket (zero-filled), rather than one row per log message, globally and per (ServerName, IssueType)
+  series fitted in parallel in a process pool.
+- Stores processed data and forecasts in the SQL Server database, maintaining a server x issue type x day
+  rollup (IssueRollup) incrementally as new processed rows are saved.
+- Stage timers (load, features, DBSCAN, save, forecast), row and series counters and save batch latency
+  histograms exported through pipeline_metrics (metrics/parsing.prom and metrics/parsing_summary.json).
 
 Requirements:
 - Python 3.8+
@@ -23,131 +45,867 @@ Run the script to parse logs, detect anomalies, and generate forecasts.
     python 3LogParsing_AD_CC_PM_v3.py
 """
 
+import os
+import re
+import json
+import pickle
+import shutil
+import hashlib
+import time
+import signal
+import tempfile
+import threading
+import multiprocessing
+import concurrent.futures
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.cluster import DBSCAN
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import NearestNeighbors
 from prophet import Prophet
+from prophet.serialize import model_to_json
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
 import urllib
+import pipeline_metrics as metrics
 
 # Correct SQLAlchemy connection string using DSN with `odbc_connect`
 connection_string = "<PROVIDE YOUR ODBC DSN AND CREDENTIALS>"
 params = urllib.parse.quote_plus(connection_string)
 sql_conn_str = f"mssql+pyodbc:///?odbc_connect={params}"
 
-# Function to call the stored procedure and get data
-def get_data_from_stored_procedure():
-    try:
-        # Create SQLAlchemy engine
-        engine = create_engine(sql_conn_str)
+# Shared SQLAlchemy engine (connection pool), created on first use; run_pipeline.py sets it to the pipeline's engine
+sql_engine = None
+engine_lock = threading.Lock()
+
+# Rule table used to classify log messages (Priority, Pattern, IgnoreCase, LogTemplate, ParsedMessage, IssueType)
+classification_rules_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "issue_classification_rules.csv")
+
+# Loading settings: the stored procedure result is streamed in chunks and converted to compact dtypes on the fly
+load_chunk_size = 100000  # Rows fetched, converted, classified and mined per chunk
+load_categorical_columns = ['LogMessageType', 'ServerName', 'LogMessage', 'LogTemplate', 'ParsedMessage', 'IssueType']  # Repetitive text (LogMessage comes from sys.messages)
+load_datetime_columns = ['LogDate']
+load_spill_dir = None  # Directory the classified chunks are spilled to between the load and the save; None uses the system temp directory
+
+# Classification of messages that match no rule
+default_log_template = "Other"
+default_issue_type = "General Issue"
+
+# Memo of classifications already computed, keyed by message text; least recently used entries are dropped
+# beyond classification_cache_size
+classification_cache = OrderedDict()
+classification_cache_size = 200000
+
+# Anomaly detection settings
+dbscan_eps = 1.0
+dbscan_min_samples = 3
+dbscan_max_neighbors = 50  # Nearest neighbours within eps kept per row, so the graph stays sparse; None keeps all of them
+clustering_mode = "exact"  # "exact": DBSCAN on all rows; "sampled": DBSCAN on a sample, other rows join the nearest core sample
+clustering_sample_size = 200000  # Rows clustered in sampled mode
+neighbor_chunk_size = 50000  # Rows per chunk when building neighbor graphs or assigning rows to clusters
+
+# Template mining settings
+template_store_path = "log_templates.json"  # Persistent template store, reused and extended by every run
+template_similarity_threshold = 0.5  # Share of matching tokens needed to join an existing template
+template_prefix_depth = 2  # Leading tokens used, with the token count, to pick candidate templates
+template_wildcard = "<*>"
+
+# Incremental processing settings
+processing_mode = "incremental"  # "incremental": only rows after the watermark, assigned to the persisted clusters; "full": always refit on all rows
+watermark_path = "parsing_watermark.json"  # Highest LogID saved, last LogDate saved per open log file, and when the last full refit ran
+watermark_open_file_days = 7  # Log files with a saved row this recent are watched for appended rows; older files are picked up by full refits
+cluster_model_path = "cluster_model.pkl"  # Vectorizer, type encoding and core samples of the last full refit
+full_refit_interval_days = 7  # Days between full refits in incremental mode
+
+# Artifact cache: fitted models and results keyed by a content hash of their input and parameters
+artifact_cache_enabled = True
+artifact_cache_dir = "artifact_cache"
+artifact_cache_max_bytes = 2 * 1024 * 1024 * 1024  # Least recently used artifacts are evicted beyond this size
+
+# Save settings for LogMessages_Processed
+save_chunk_size = 50000  # Rows staged and merged per INSERT ... SELECT
+save_commit_interval = 4  # Chunks per commit; earlier chunks stay committed if a later one fails
+
+# Forecast settings
+forecast_horizon_days = 30
+forecast_bucket = "daily"  # Issue counts are aggregated per "hourly" or "daily" bucket before fitting
+forecast_bucket_frequencies = {'hourly': 'h', 'daily': 'D'}
+forecast_buckets_per_day = {'hourly': 24, 'daily': 1}
+forecast_series_columns = ['ServerName', 'IssueType']  # One forecast per combination, besides the global one
+forecast_min_history_buckets = 5  # Series with fewer non-empty buckets are not forecast
+forecast_workers = os.cpu_count() or 1  # Processes fitting series in parallel
+forecast_timeout_seconds = 300  # Per-series fit timeout
+forecast_future_only = True  # Persist only the forecast horizon, not Prophet's fit over the history
+default_forecast_series = "all"  # Series key of the global forecast
+forecast_run_id = datetime.now().strftime("%Y%m%d%H%M%S")  # Run that last wrote each forecast row; the MERGE replaces earlier runs' rows, so no history is kept
 
-        # Call the stored procedure to fetch data
-        query = "EXEC GetErrorLogsWithDetails"
-        log_messages_df = pd.read_sql(query, engine)
+# Rollup of saved rows per (ServerName, IssueType, day) with first/last seen, maintained as rows are saved
+issue_rollup_table = "IssueRollup"
+
+# Tables whose index and rollup were prepared by this process
+prepared_tables = set()
+
+# Whether GetErrorLogsWithDetails accepted @SinceLogID / @SinceLogDate; set to False after the first failed call,
+# so later loads of this process go straight to the parameterless call
+procedure_accepts_watermark = True
+
+# Columns written to LogMessages_Processed, with the value used when a column is missing
+processed_columns = {
+    'LogID': None, 'LogDate': None, 'LogMessageType': None, 'LogMessage': None, 'LogTemplate': None,
+    'ParsedMessage': '', 'AnomalyScore': 1, 'Cluster': None, 'IssueType': None,
+}
+
+# Variable parts of SQL Server messages masked before mining, most specific first
+template_masks = [
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), template_wildcard),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b"), template_wildcard),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), template_wildcard),
+    (re.compile(r"'[^']*'"), f"'{template_wildcard}'"),
+    (re.compile(r"\b\d+\b"), template_wildcard),
+]
+
+# Function to get the process-wide SQLAlchemy engine, so every load and save reuses one connection pool
+def get_sql_engine():
+    global sql_engine
+    with engine_lock:
+        if sql_engine is None:
+            sql_engine = create_engine(sql_conn_str, fast_executemany=True)
+        return sql_engine
+
+# Function to convert a chunk to compact dtypes: categoricals for repetitive text, datetime64 dates and downcast integers
+def optimize_dtypes(chunk):
+    for column in load_datetime_columns:
+        if column in chunk.columns:
+            chunk[column] = pd.to_datetime(chunk[column])
+    for column in load_categorical_columns:
+        if column in chunk.columns:
+            chunk[column] = chunk[column].astype('category')
+    for column in chunk.select_dtypes(include='integer').columns:
+        chunk[column] = pd.to_numeric(chunk[column], downcast='integer')
+    return chunk
+
+# Function to keep the rows of a chunk that are past the watermark: rows of log files created after the last saved
+# LogID, and rows of open log files (appended passes of a live log reuse its LogID) from their last saved LogDate on.
+# Rows at exactly that LogDate are kept, since the save skips rows already saved.
+def rows_after_watermark(chunk, watermark):
+    file_log_dates = pd.Series({int(log_id): pd.Timestamp(log_date) for log_id, log_date in watermark.get('LogDates', {}).items()},
+                               dtype='datetime64[ns]')
+    new_file = chunk['LogID'] > watermark['LogID']
+    appended = pd.to_datetime(chunk['LogDate']) >= chunk['LogID'].map(file_log_dates)
+    return chunk[new_file | appended]
+
+# Function to stream the stored procedure result in chunks of load_chunk_size rows through a server-side cursor,
+# each converted to compact dtypes; with a watermark only rows past it are returned. The procedure is asked for rows
+# with a LogID past @SinceLogID or a LogDate from @SinceLogDate on (the earliest last saved LogDate of the open files).
+# A procedure without those parameters rejects the call; all rows are then read and filtered here instead.
+def iter_log_message_chunks(watermark=None):
+    global procedure_accepts_watermark
+    engine = get_sql_engine()
+
+    with engine.connect().execution_options(stream_results=True) as conn:
+        chunks = None
+        if watermark is not None and procedure_accepts_watermark:
+            open_file_dates = [pd.Timestamp(log_date) for log_date in watermark.get('LogDates', {}).values()]
+            query = text("EXEC GetErrorLogsWithDetails @SinceLogID = :since_log_id, @SinceLogDate = :since_log_date")
+            try:
+                chunks = pd.read_sql(query, conn, chunksize=load_chunk_size, params={
+                    'since_log_id': int(watermark['LogID']),
+                    'since_log_date': min(open_file_dates).to_pydatetime() if open_file_dates else None,
+                })
+            except DBAPIError as e:
+                print(f"GetErrorLogsWithDetails did not accept the watermark parameters ({e.orig}); "
+                      "reading all rows and keeping those past the watermark.")
+                metrics.inc("parse_watermark_fallback_total")
+                procedure_accepts_watermark = False
+                conn.rollback()
+        if chunks is None:
+            chunks = pd.read_sql(text("EXEC GetErrorLogsWithDetails"), conn, chunksize=load_chunk_size)
+
+        for chunk in chunks:
+            if watermark is not None:
+                # Narrows the procedure's result to each file's own watermark
+                chunk = rows_after_watermark(chunk, watermark)
+            yield optimize_dtypes(chunk.reset_index(drop=True))
+
+# Function to concatenate compact chunks; categorical columns are first given the union of their categories
+# so the result stays categorical instead of falling back to object
+def concat_log_chunks(chunks):
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            categories = chunks[0][column].cat.categories
+            for chunk in chunks[1:]:
+                categories = categories.union(chunk[column].cat.categories)
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+# Function to call the stored procedure and get data; with a watermark only rows past it are returned.
+# A failed load is raised, so it is never mistaken for "no new rows".
+def get_data_from_stored_procedure(watermark=None):
+    try:
+        chunks = list(iter_log_message_chunks(watermark))
+        log_messages_df = concat_log_chunks(chunks) if chunks else pd.DataFrame()
         print("Data loaded from stored procedure:", log_messages_df.shape)
         
         return log_messages_df
 
     except Exception as e:
         print(f"An error occurred while pulling data from SQL: {e}")
-        return pd.DataFrame()
+        raise
 
-# Function to parse log messages and categorize issues
-def parse_log_message(log_message):
-    # Example parsing logic - categorize based on log message content
-    if "timeout" in log_message.lower():
-        log_template = "Timeout error while waiting for resources"
-        parsed_message = "A timeout occurred due to resource contention."
-        issue_type = "Memory Resource Issue"
-    elif "SSPI handshake failed" in log_message:
-        log_template = "SSPI handshake failure"
-        parsed_message = "SSPI handshake failed, likely due to network or authentication issues."
-        issue_type = "Network or Authentication Issue"
-    elif "Login failed" in log_message:
-        log_template = "Login failure"
-        parsed_message = "Login failed due to an untrusted domain or incorrect credentials."
-        issue_type = "Authentication Issue"
+# Classified chunks of one load, spilled to disk as they stream in, with the aggregates the later steps need: row
+# counts per (TemplateID, LogMessageType) for clustering, issue counts per (forecast bucket, ServerName, IssueType)
+# for a full refit's forecast, and the newest LogDate per LogID for the watermark. Only one chunk is in memory at a
+# time; the save reads them back one by one.
+class SpilledLogChunks:
+    def __init__(self, spill_dir=load_spill_dir):
+        self.directory = tempfile.mkdtemp(prefix="log_chunks_", dir=spill_dir)
+        self.paths = []
+        self.rows = 0
+        self.group_counts = None
+        self.issue_counts = None
+        self.log_dates = pd.Series(dtype='datetime64[ns]')
+
+    def add(self, chunk):
+        path = os.path.join(self.directory, f"chunk_{len(self.paths):06d}.pkl")
+        chunk.to_pickle(path)
+        self.paths.append(path)
+        self.rows += len(chunk)
+
+        # Grouped as object, so a group missing from one chunk does not appear with a count of zero
+        groups = chunk[['TemplateID', 'LogMessageType']].astype({'LogMessageType': object})
+        self.group_counts = self.accumulate(self.group_counts, groups.groupby(['TemplateID', 'LogMessageType'], dropna=False).size())
+
+        series_columns = [column for column in forecast_series_columns if column in chunk.columns]
+        buckets = chunk[series_columns].astype(object)
+        buckets.insert(0, 'LogDate', pd.to_datetime(chunk['LogDate']).dt.floor(forecast_bucket_frequencies[forecast_bucket]))
+        self.issue_counts = self.accumulate(self.issue_counts, buckets.groupby(list(buckets.columns), dropna=False).size())
+
+        log_dates = pd.to_datetime(chunk['LogDate']).groupby(chunk['LogID'].astype('int64')).max()
+        self.log_dates = pd.concat([self.log_dates, log_dates]).groupby(level=0).max()
+
+    @staticmethod
+    def accumulate(total, counts):
+        return counts if total is None else total.add(counts, fill_value=0).astype('int64')
+
+    # One clustering group per distinct (mined template, message type): TemplateID, MinedTemplate, LogMessageType, Count
+    def template_groups(self, template_miner):
+        group_df = self.group_counts.rename('Count').reset_index()
+        group_df.insert(1, 'MinedTemplate', [template_miner.template_text(int(template_id)) for template_id in group_df['TemplateID']])
+        print("Clustering groups:", len(group_df), "for", self.rows, "rows")
+        return group_df
+
+    # Issue history in the shape of the rollup: one row per (bucket, ServerName, IssueType), the count as AnomalyScore
+    def issue_history(self):
+        return self.issue_counts.rename('AnomalyScore').reset_index()
+
+    # The spilled chunks one at a time, each row given its group's cluster and the mined template texts
+    def processed_chunks(self, group_df, template_miner):
+        group_index = pd.MultiIndex.from_frame(group_df[['TemplateID', 'LogMessageType']])
+        group_labels = group_df['Cluster'].to_numpy()
+        for path in self.paths:
+            chunk = pd.read_pickle(path)
+            row_groups = group_index.get_indexer(pd.MultiIndex.from_arrays([chunk['TemplateID'].astype('int64'), chunk['LogMessageType'].astype(object)]))
+            chunk['Cluster'] = group_labels[row_groups]
+            chunk['AnomalyScore'] = 1  # Flag all entries as issues
+            yield apply_mined_templates(chunk, template_miner)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+# Function to load, classify and mine the stored procedure result chunk by chunk, spilling each chunk to disk
+# before the next is fetched. Returns the SpilledLogChunks, which the caller cleans up once they are saved.
+# log_message_chunks (frames with the stored procedure's columns, e.g. handed over in memory by run_pipeline.py)
+# are used instead of the stored procedure when given. A failed load is raised, so it is never mistaken for "no new rows".
+def load_classified_log_messages(template_miner, watermark=None, log_message_chunks=None):
+    if log_message_chunks is None:
+        log_message_chunks = iter_log_message_chunks(watermark)
     else:
-        log_template = "Other"
-        parsed_message = log_message  # Default to the original message if no pattern matches
-        issue_type = "General Issue"
+        log_message_chunks = (optimize_dtypes(chunk.reset_index(drop=True)) for chunk in log_message_chunks)
+    log_chunks = SpilledLogChunks()
+    try:
+        for chunk in log_message_chunks:
+            if chunk.empty:
+                continue
+            with metrics.timer("parse_chunk_seconds", operation="classify"):
+                for column, values in classify_log_messages(chunk['LogMessage']).items():
+                    chunk[column] = values
+            with metrics.timer("parse_chunk_seconds", operation="mine_templates"):
+                assign_template_ids(chunk, template_miner)
+            with metrics.timer("parse_chunk_seconds", operation="spill"):
+                log_chunks.add(chunk)
+            metrics.inc("parse_rows_loaded_total", len(chunk))
+            print(f"Loaded chunk {len(log_chunks.paths)}: {len(chunk)} rows, {chunk.memory_usage(deep=True).sum() / (1024 * 1024):.1f} MB")
+    except Exception as e:
+        log_chunks.cleanup()
+        print(f"An error occurred while pulling data from SQL: {e}")
+        raise
+
+    if log_chunks.rows:
+        print(f"Data loaded: {log_chunks.rows} rows in {len(log_chunks.paths)} chunks; templates mined:",
+              len(log_chunks.group_counts.index.unique(level='TemplateID')), "in use,", len(template_miner.templates), "in store")
+    return log_chunks
 
+# Function to factorize a text column (object or categorical); missing values become ''.
+# Returns the row codes and the distinct texts as an object array.
+def factorize_text(values):
+    codes, uniques = pd.factorize(values)
+    unique_texts = np.asarray(uniques, dtype=object)
+    if (codes == -1).any():
+        codes = np.where(codes == -1, len(unique_texts), codes)
+        unique_texts = np.append(unique_texts, '')
+    return codes, unique_texts
+
+# Function to build a categorical column from row codes into values that may repeat
+def categorical_from_codes(codes, values):
+    value_codes, categories = pd.factorize(pd.Series(values, dtype=object))
+    return pd.Categorical.from_codes(value_codes[codes], categories)
+
+# Function to check that a rule pattern can be embedded in the combined regex; returns the problem, or None.
+# Plain capturing groups are fine (only the rule groups are read), but named groups would clash across rules
+# and numbered backreferences would point at the wrong group once the rules are combined.
+def rule_pattern_problem(pattern):
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        return f"invalid regex ({e})"
+    if compiled.groupindex:
+        return "named groups are not supported"
+    if re.search(r"(?<!\\)\\[1-9]", pattern):
+        return "backreferences are not supported"
+    return None
+
+# Function to load the classification rule table, ordered by priority (lowest value wins); rules with an
+# empty Pattern are disabled and left out, as are rules whose pattern cannot be combined (reported)
+def load_classification_rules(path=classification_rules_path):
+    rules = pd.read_csv(path, dtype={'Pattern': str, 'LogTemplate': str, 'ParsedMessage': str, 'IssueType': str})
+    rules = rules[rules['Pattern'].fillna('').str.strip() != '']
+    problems = rules['Pattern'].map(rule_pattern_problem)
+    for pattern, problem in zip(rules['Pattern'], problems):
+        if problem:
+            print(f"Classification rule {pattern!r} skipped: {problem}")
+    rules = rules[problems.isna()]
+    rules['IgnoreCase'] = rules['IgnoreCase'].astype(str).str.lower().isin(['true', '1', 'yes'])
+    return rules.sort_values('Priority', kind='stable').reset_index(drop=True)
+
+# Function to compile all rules into one regex: one optional lookahead per rule, so one match reports every rule
+# that occurs anywhere in the message through its named group. Each lookahead rescans the message from the start,
+# so this saves the per-rule Python loop, not the per-rule scan.
+def compile_classification_rules(rules):
+    lookaheads = []
+    for index, (pattern, ignore_case) in enumerate(zip(rules['Pattern'], rules['IgnoreCase'])):
+        rule_pattern = f"(?i:{pattern})" if ignore_case else f"(?:{pattern})"
+        lookaheads.append(f"(?:(?=.*?(?P<rule{index}>{rule_pattern})))?")
+    return re.compile("(?s)^" + "".join(lookaheads))
+
+classification_rules = load_classification_rules()
+classification_pattern = compile_classification_rules(classification_rules)
+
+# Function to classify a column of log messages; each distinct text is matched once and memoized.
+# Returns categorical LogTemplate, ParsedMessage and IssueType columns.
+def classify_log_messages(log_messages):
+    codes, unique_messages = factorize_text(log_messages)
+    unique_messages = [str(message) for message in unique_messages]
+
+    new_messages = pd.Series([message for message in unique_messages if message not in classification_cache], dtype=object)
+    if not new_messages.empty:
+        if classification_rules.empty:
+            # No enabled rules: every message is unmatched and keeps its text
+            templates = np.full(len(new_messages), default_log_template, dtype=object)
+            parsed_messages = new_messages.to_numpy()
+            issue_types = np.full(len(new_messages), default_issue_type, dtype=object)
+        else:
+            # Only the rule groups: capturing groups inside a rule's own pattern come back as extra columns
+            extracted = new_messages.str.extract(classification_pattern)
+            hits = extracted[[f"rule{index}" for index in range(len(classification_rules))]].notna().to_numpy()
+            matched = hits.any(axis=1)
+            first_rule = hits.argmax(axis=1)  # Columns are in priority order
+            templates = np.where(matched, classification_rules['LogTemplate'].to_numpy()[first_rule], default_log_template)
+            # A rule without a ParsedMessage keeps the original message text
+            rule_parsed_messages = classification_rules['ParsedMessage'].to_numpy()[first_rule]
+            has_parsed_message = classification_rules['ParsedMessage'].notna().to_numpy()[first_rule]
+            parsed_messages = np.where(matched & has_parsed_message, rule_parsed_messages, new_messages.to_numpy())
+            issue_types = np.where(matched, classification_rules['IssueType'].to_numpy()[first_rule], default_issue_type)
+        classification_cache.update(zip(new_messages, zip(templates, parsed_messages, issue_types)))
+
+    unique_results = pd.DataFrame([classification_cache[message] for message in unique_messages],
+                                  columns=['LogTemplate', 'ParsedMessage', 'IssueType'])
+    for message in unique_messages:
+        classification_cache.move_to_end(message)
+    while len(classification_cache) > classification_cache_size:
+        classification_cache.popitem(last=False)
+    return pd.DataFrame({column: categorical_from_codes(codes, unique_results[column]) for column in unique_results.columns},
+                        index=log_messages.index)
+
+# Function to parse a single log message and categorize the issue
+def parse_log_message(log_message):
+    log_template, parsed_message, issue_type = classify_log_messages(pd.Series([log_message])).iloc[0]
     return log_template, parsed_message, issue_type
 
-# Function for feature engineering
-def feature_engineering(log_messages_df):
-    print("Sample content from LogMessage column:")
-    print(log_messages_df['LogMessage'].head(10))
+# Drain-style online template miner: messages with the same token count and leading tokens are
+# candidates for the same template; a message joins the most similar candidate above the threshold,
+# and tokens where they differ become wildcards
+class TemplateMiner:
+    def __init__(self, similarity_threshold=template_similarity_threshold, prefix_depth=template_prefix_depth):
+        self.similarity_threshold = similarity_threshold
+        self.prefix_depth = prefix_depth
+        self.templates = []  # [{'key': ..., 'tokens': [...], 'count': n}], list index is the template id
+        self.leaves = {}  # leaf key -> template ids
+
+    def leaf_key(self, tokens):
+        prefix = [template_wildcard if any(ch.isdigit() for ch in token) else token for token in tokens[:self.prefix_depth]]
+        return json.dumps([len(tokens)] + prefix)
+
+    def add(self, masked_message, count=1):
+        tokens = masked_message.split()
+        key = self.leaf_key(tokens)
+        best_id, best_similarity = None, -1.0
+        for template_id in self.leaves.get(key, []):
+            template_tokens = self.templates[template_id]['tokens']
+            same = sum(1 for a, b in zip(template_tokens, tokens) if a == b and a != template_wildcard)
+            similarity = same / len(tokens) if tokens else 1.0
+            if similarity > best_similarity:
+                best_id, best_similarity = template_id, similarity
+
+        if best_id is not None and best_similarity >= self.similarity_threshold:
+            template = self.templates[best_id]
+            template['tokens'] = [a if a == b else template_wildcard for a, b in zip(template['tokens'], tokens)]
+            template['count'] += count
+            return best_id
+
+        self.templates.append({'key': key, 'tokens': tokens, 'count': count})
+        self.leaves.setdefault(key, []).append(len(self.templates) - 1)
+        return len(self.templates) - 1
+
+    def template_text(self, template_id):
+        return " ".join(self.templates[template_id]['tokens'])
+
+    def save(self, path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({'templates': self.templates}, file)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        miner = cls()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                miner.templates = json.load(file)['templates']
+            for template_id, template in enumerate(miner.templates):
+                miner.leaves.setdefault(template['key'], []).append(template_id)
+        return miner
+
+# On-disk artifact cache: one pickle per key, least recently used entries evicted beyond max_bytes.
+# A read refreshes the entry's modification time, which is what the eviction orders by.
+class ArtifactCache:
+    def __init__(self, cache_dir, max_bytes, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.total_bytes = None  # Size of the entries, from one directory scan and then kept up to date by put
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                artifact = pickle.load(file)
+            os.utime(path)
+            return artifact
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
 
-    if log_messages_df['LogMessage'].isnull().all() or log_messages_df['LogMessage'].str.strip().eq('').all():
-        print("LogMessage column is empty or contains only stop words. Skipping TF-IDF vectorization.")
-        tfidf_features = pd.DataFrame()  
+    def put(self, key, artifact):
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self.scan())
+        path = self.path(key)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(artifact, file)
+        replaced_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        self.total_bytes += os.path.getsize(path) - replaced_bytes
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def scan(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    # Evict down to 90% of max_bytes, so the directory is not rescanned on every put near the limit
+    def evict(self):
+        entries = self.scan()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.total_bytes <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+
+artifact_cache = ArtifactCache(artifact_cache_dir, artifact_cache_max_bytes, artifact_cache_enabled)
+
+# Function to hash the content of frames and parameters into a cache key
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(repr(list(part.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+# Function to mask variable tokens (GUIDs, IPs, hex, quoted names, numbers) in a column of messages
+def mask_log_messages(log_messages):
+    masked = log_messages.fillna('').astype(str)
+    for pattern, replacement in template_masks:
+        masked = masked.str.replace(pattern, replacement, regex=True)
+    return masked
+
+# Function to mine templates for a chunk of rows: each distinct masked message is mined once. Adds the TemplateID column.
+def assign_template_ids(log_messages_df, template_miner):
+    codes, unique_messages = factorize_text(log_messages_df['LogMessage'])
+    masked_codes, unique_masked = pd.factorize(mask_log_messages(pd.Series(unique_messages, dtype=object)))
+    masked_counts = np.bincount(masked_codes[codes], minlength=len(unique_masked))
+
+    masked_template_ids = np.array([template_miner.add(message, int(count)) for message, count in zip(unique_masked, masked_counts)], dtype=np.int32)
+    log_messages_df['TemplateID'] = masked_template_ids[masked_codes][codes]
+    return log_messages_df
+
+# Function to add the MinedTemplate column and use the mined template where no rule supplied one.
+# Templates may have been generalized by later messages, so texts are read once mining is done.
+def apply_mined_templates(log_messages_df, template_miner):
+    template_texts = [template_miner.template_text(template_id) for template_id in range(len(template_miner.templates))]
+    mined_templates = categorical_from_codes(log_messages_df['TemplateID'].to_numpy(), template_texts)
+    log_messages_df['MinedTemplate'] = mined_templates
+    if 'LogTemplate' in log_messages_df.columns:
+        log_templates = log_messages_df['LogTemplate'].astype('category')
+        categories = log_templates.cat.categories.union(mined_templates.categories)
+        use_mined = (log_templates == default_log_template).to_numpy()
+        codes = np.where(use_mined, mined_templates.set_categories(categories).codes, log_templates.cat.set_categories(categories).cat.codes)
+        log_messages_df['LogTemplate'] = pd.Categorical.from_codes(codes, categories)
+    return log_messages_df
+
+# Function to mine templates for all rows of one frame and apply the mined texts
+def mine_log_templates(log_messages_df, template_miner):
+    assign_template_ids(log_messages_df, template_miner)
+    apply_mined_templates(log_messages_df, template_miner)
+    print("Templates mined:", log_messages_df['TemplateID'].nunique(), "in use,", len(template_miner.templates), "in store")
+    return log_messages_df
+
+# Function for feature engineering; returns a sparse float32 CSR matrix (encoded type column + TF-IDF columns).
+# With a fitted cluster_model the stored type encoding and vectorizer are reused; with an empty dict they are fitted and stored in it.
+def feature_engineering(log_messages_df, text_column='LogMessage', cluster_model=None):
+    print(f"Sample content from {text_column} column:")
+    print(log_messages_df[text_column].head(10))
+
+    fitted = cluster_model is not None and 'type_categories' in cluster_model
+    if fitted:
+        type_categories = cluster_model['type_categories']
     else:
-        log_messages_df['LogMessageType_Encoded'] = pd.factorize(log_messages_df['LogMessageType'])[0]
-        vectorizer = TfidfVectorizer(max_features=50, stop_words=None)
-        tfidf_matrix = vectorizer.fit_transform(log_messages_df['LogMessage'].fillna('')).toarray()
-        tfidf_features = pd.DataFrame(tfidf_matrix, columns=vectorizer.get_feature_names_out())
+        type_categories = pd.unique(log_messages_df['LogMessageType'].dropna())
+    log_messages_df['LogMessageType_Encoded'] = pd.Categorical(log_messages_df['LogMessageType'], categories=type_categories).codes
+    type_features = sp.csr_matrix(log_messages_df[['LogMessageType_Encoded']].to_numpy(dtype=np.float32))
 
-    if not tfidf_features.empty:
-        combined_features = pd.concat([log_messages_df[['LogMessageType_Encoded']], tfidf_features], axis=1)
+    if fitted:
+        vectorizer = cluster_model['vectorizer']
+    elif log_messages_df[text_column].isnull().all() or log_messages_df[text_column].str.strip().eq('').all():
+        print(f"{text_column} column is empty or contains only stop words. Skipping TF-IDF vectorization.")
+        vectorizer = None
     else:
-        combined_features = log_messages_df[['LogMessageType_Encoded']]
+        vectorizer = TfidfVectorizer(max_features=50, stop_words=None, dtype=np.float32)
+        vectorizer.fit(log_messages_df[text_column].fillna(''))
+
+    if vectorizer is None:
+        combined_features = type_features
+    else:
+        tfidf_matrix = vectorizer.transform(log_messages_df[text_column].fillna(''))
+        combined_features = sp.hstack([type_features, tfidf_matrix], format='csr', dtype=np.float32)
+
+    if cluster_model is not None and not fitted:
+        cluster_model['type_categories'] = type_categories
+        cluster_model['vectorizer'] = vectorizer
     
     print("Features engineered:", combined_features.shape)
     return combined_features
 
-# Function for anomaly detection using DBSCAN
-def detect_anomalies(log_messages_df, features_df):
-    if log_messages_df.empty:
+# Function to build the eps-radius neighbors graph chunk by chunk, so only one chunk of distances is computed at a time.
+# With max_neighbors each row keeps only its nearest neighbours within eps: over L2-normalised TF-IDF most rows are
+# within eps = 1.0 of each other, so the full graph grows with the square of the row count. Core samples are unchanged
+# as long as max_neighbors >= min_samples; the kept edges are made symmetric, so clusters only split where no row
+# has the other among its nearest neighbours.
+def build_radius_neighbors_graph(features, eps, max_neighbors=None):
+    if max_neighbors is None or max_neighbors >= features.shape[0]:
+        neighbors = NearestNeighbors(radius=eps).fit(features)
+        chunks = [neighbors.radius_neighbors_graph(features[start:start + neighbor_chunk_size], mode='distance')
+                  for start in range(0, features.shape[0], neighbor_chunk_size)]
+        return sp.vstack(chunks, format='csr')
+
+    neighbors = NearestNeighbors(n_neighbors=max_neighbors).fit(features)
+    chunks = []
+    for start in range(0, features.shape[0], neighbor_chunk_size):
+        distances, indices = neighbors.kneighbors(features[start:start + neighbor_chunk_size])
+        within_eps = distances <= eps
+        indptr = np.concatenate([[0], np.cumsum(within_eps.sum(axis=1))])
+        # Built from the arrays so zero distances (identical rows, the row itself) stay explicit neighbours
+        chunks.append(sp.csr_matrix((distances[within_eps], indices[within_eps], indptr), shape=(len(distances), features.shape[0])))
+    graph = sp.vstack(chunks, format='coo')
+
+    # Union of both directions, each pair once (adding the transpose would double distances and drop explicit zeros)
+    rows = np.concatenate([graph.row, graph.col])
+    columns = np.concatenate([graph.col, graph.row])
+    _, first = np.unique(rows.astype(np.int64) * features.shape[0] + columns, return_index=True)
+    return sp.csr_matrix((np.concatenate([graph.data, graph.data])[first], (rows[first], columns[first])), shape=graph.shape)
+
+# Function to give each row the label of its nearest core sample within eps (-1 when none is that close)
+def assign_to_core_samples(features, core_features, core_labels, eps):
+    labels = np.full(features.shape[0], -1, dtype=np.int32)
+    if core_features.shape[0] == 0:
+        return labels
+
+    nearest_core = NearestNeighbors(n_neighbors=1).fit(core_features)
+    for start in range(0, features.shape[0], neighbor_chunk_size):
+        distances, nearest = nearest_core.kneighbors(features[start:start + neighbor_chunk_size])
+        chunk_labels = core_labels[nearest[:, 0]]
+        chunk_labels[distances[:, 0] > eps] = -1
+        labels[start:start + neighbor_chunk_size] = chunk_labels
+    return labels
+
+# Function to cluster a sample with DBSCAN and give every other row the label of its nearest core sample within eps.
+# Returns the labels and the core samples (features, labels).
+def cluster_sampled(features, eps, min_samples, sample_weight=None):
+    rng = np.random.default_rng(0)
+    sample_index = np.sort(rng.choice(features.shape[0], size=clustering_sample_size, replace=False))
+    sample_features = features[sample_index]
+    sample_weight = sample_weight[sample_index] if sample_weight is not None else None
+
+    clustering = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed').fit(
+        build_radius_neighbors_graph(sample_features, eps, dbscan_max_neighbors), sample_weight=sample_weight)
+    labels = np.full(features.shape[0], -1, dtype=np.int32)
+    labels[sample_index] = clustering.labels_
+
+    core_features = sample_features[clustering.core_sample_indices_]
+    core_labels = clustering.labels_[clustering.core_sample_indices_]
+
+    remaining_index = np.setdiff1d(np.arange(features.shape[0]), sample_index, assume_unique=True)
+    labels[remaining_index] = assign_to_core_samples(features[remaining_index], core_features, core_labels, eps)
+    return labels, core_features, core_labels
+
+# Function for anomaly detection using DBSCAN on the clustering groups, one feature row per group weighted by
+# sample_weight (its row count); adds each group's label as the Cluster column.
+# With refit=False the groups are assigned to the core samples of cluster_model; otherwise DBSCAN is fitted
+# and its core samples are stored in cluster_model (when given).
+def detect_anomalies(group_df, features, sample_weight=None, cluster_model=None, refit=True):
+    if group_df.empty:
         print("No log messages available for anomaly detection.")
-        return log_messages_df
+        return group_df
 
-    clustering = DBSCAN(eps=1.0, min_samples=3).fit(features_df)
-    log_messages_df['Cluster'] = clustering.labels_
-    log_messages_df['AnomalyScore'] = 1  # Flag all entries as issues
-    
-    print("Anomalies detected:", log_messages_df['AnomalyScore'].sum())
-    return log_messages_df
+    if not refit:
+        labels = assign_to_core_samples(features, cluster_model['core_features'], cluster_model['core_labels'], cluster_model['eps'])
+    elif clustering_mode == "sampled" and features.shape[0] > clustering_sample_size:
+        labels, core_features, core_labels = cluster_sampled(features, dbscan_eps, dbscan_min_samples, sample_weight)
+    else:
+        graph = build_radius_neighbors_graph(features, dbscan_eps, dbscan_max_neighbors)
+        clustering = DBSCAN(eps=dbscan_eps, min_samples=dbscan_min_samples, metric='precomputed').fit(graph, sample_weight=sample_weight)
+        labels = clustering.labels_
+        core_features = features[clustering.core_sample_indices_]
+        core_labels = clustering.labels_[clustering.core_sample_indices_]
+
+    if refit and cluster_model is not None:
+        cluster_model.update({'core_features': core_features, 'core_labels': core_labels, 'eps': dbscan_eps})
+    group_df['Cluster'] = labels
+
+    # Every row is flagged as an issue (AnomalyScore 1) when its chunk is saved
+    print("Anomalies detected:", int(group_df['Count'].sum()) if 'Count' in group_df.columns else len(group_df))
+    return group_df
+
+# Function to cluster the template groups (one per distinct mined template and message type, weighted by its row
+# count): on a full refit the DBSCAN result is cached by the content of the groups and the clustering parameters,
+# so unchanged input skips vectorizing and clustering. Returns the groups with their Cluster and the cluster model.
+def cluster_template_groups(group_df, cluster_model, refit):
+    if refit:
+        cache_key = content_hash(group_df, 'clusters', dbscan_eps, dbscan_min_samples, dbscan_max_neighbors, clustering_mode,
+                                 clustering_sample_size)
+        cached = artifact_cache.get(cache_key)
+        if cached is not None:
+            print("Clusters reused from the artifact cache; input unchanged since they were fitted.")
+            metrics.inc("parse_cluster_cache_total", result="hit")
+            group_df['Cluster'] = cached['group_labels']
+            return group_df, cached['cluster_model']
+
+        metrics.inc("parse_cluster_cache_total", result="miss")
 
-# Function to save processed data back to SQL
-def save_to_database(processed_data_df, table_name):
-    if processed_data_df.empty:
-        print(f"No data to save to {table_name}.")
+    with metrics.stage("parse.features"):
+        features = feature_engineering(group_df, text_column='MinedTemplate', cluster_model=cluster_model)
+    with metrics.stage("parse.dbscan"):
+        group_df = detect_anomalies(group_df, features, group_df['Count'].to_numpy(), cluster_model=cluster_model, refit=refit)
+
+    if refit:
+        artifact_cache.put(cache_key, {'cluster_model': cluster_model, 'group_labels': group_df['Cluster'].to_numpy()})
+    return group_df, cluster_model
+
+# Function to prepare the tables a save writes to, once per process and before the save, each step in its own
+# transaction so no schema change or backfill runs under the save's locks: the index the duplicate check seeks on,
+# and the rollup (created and backfilled on first use)
+def prepare_processed_tables(table_name, rollup_table=None):
+    if (table_name, rollup_table) in prepared_tables:
         return
+    with get_sql_engine().begin() as conn:
+        conn.exec_driver_sql(f"""
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table_name}_RowKey' AND object_id = OBJECT_ID('{table_name}'))
+            CREATE INDEX IX_{table_name}_RowKey ON {table_name} (LogID, LogDate)
+        """)
+    if rollup_table:
+        with get_sql_engine().begin() as conn:
+            ensure_rollup_schema(conn, rollup_table, table_name)
+    prepared_tables.add((table_name, rollup_table))
+
+# Function to split processed frames into save batches of save_chunk_size rows in the processed_columns layout,
+# one frame at a time
+def iter_save_batches(processed_data):
+    for processed_data_df in processed_data:
+        # Same columns and defaults as the row-by-row insert this replaces; every row is one log occurrence
+        save_df = pd.DataFrame({column: processed_data_df[column] if column in processed_data_df.columns else default
+                                for column, default in processed_columns.items()})
+        for start in range(0, len(save_df), save_chunk_size):
+            chunk = save_df.iloc[start:start + save_chunk_size].astype(object)
+            yield chunk.where(chunk.notna(), None)
 
-    # Debug: Print a sample of the data being saved
-    print(f"Data to save to {table_name}:")
-    print(processed_data_df.head())
+# Function to save processed data back to SQL: each chunk is bulk loaded into a session temp staging table
+# (fast_executemany), rows already in the target are dropped from staging, and the rest are moved into the target
+# with one set-based INSERT ... SELECT. A row is identified by its log file, timestamp, type and message (the
+# sys.messages text of its error code), not by LogID alone: appended passes of a live log add rows to an existing
+# LogID. With rollup_table the same new rows are merged into the rollup in the same transaction.
+# processed_data is one frame or an iterable of frames (e.g. spilled chunks read back one at a time).
+# Returns True when every chunk was committed.
+def save_to_database(processed_data, table_name, rollup_table=None):
+    if isinstance(processed_data, pd.DataFrame):
+        if processed_data.empty:
+            print(f"No data to save to {table_name}.")
+            return True
+        processed_data = [processed_data]
+
+    column_list = ", ".join(processed_columns)
+    placeholders = ", ".join("?" for _ in processed_columns)
 
     try:
-        engine = create_engine(sql_conn_str)
+        prepare_processed_tables(table_name, rollup_table)
+        engine = get_sql_engine()
         with engine.connect() as conn:
             transaction = conn.begin()
             try:
-                for _, row in processed_data_df.iterrows():
-                    result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name} WHERE LogID = :logid"), {'logid': row['LogID']})
-                    if result.scalar() == 0:  # Only insert if not already present
-                        conn.execute(text(f"""
-                        INSERT INTO {table_name} (LogID, LogDate, LogMessageType, LogMessage, LogTemplate, ParsedMessage, AnomalyScore, Cluster, IssueType)
-                        VALUES (:logid, :logdate, :logtype, :logmessage, :logtemplate, :parsed, :score, :cluster, :issuetype)
-                        """), {
-                            'logid': row['LogID'], 
-                            'logdate': row['LogDate'], 
-                            'logtype': row['LogMessageType'], 
-                            'logmessage': row['LogMessage'], 
-                            'logtemplate': row['LogTemplate'], 
-                            'parsed': row.get('ParsedMessage', ''), 
-                            'score': row.get('AnomalyScore', 1), 
-                            'cluster': row['Cluster'],
-                            'issuetype': row['IssueType']
-                        })
+                start_time = time.perf_counter()
+                inserted = 0
+                total_rows = 0
+                # Copy the column types of the target table, so the staging table needs no schema of its own
+                conn.exec_driver_sql("IF OBJECT_ID('tempdb..#ProcessedStaging') IS NOT NULL DROP TABLE #ProcessedStaging")
+                conn.exec_driver_sql(f"SELECT TOP 0 {column_list} INTO #ProcessedStaging FROM {table_name}")
+                for chunk_number, chunk in enumerate(iter_save_batches(processed_data), start=1):
+                    if chunk_number == 1:
+                        # Debug: Print a sample of the data being saved
+                        print(f"Data to save to {table_name}:")
+                        print(chunk.head())
+                    total_rows += len(chunk)
+                    with metrics.timer("parse_save_batch_seconds", table=table_name):
+                        conn.exec_driver_sql(f"INSERT INTO #ProcessedStaging ({column_list}) VALUES ({placeholders})",
+                                             list(chunk.itertuples(index=False, name=None)))
+                        # Keep only rows not saved yet, so the insert and the rollup both see exactly the rows added;
+                        # a re-run over rows already saved (e.g. after a failed watermark update) adds nothing
+                        conn.exec_driver_sql(f"""
+                        DELETE s FROM #ProcessedStaging s
+                        WHERE EXISTS (
+                            SELECT 1 FROM {table_name} t
+                            WHERE t.LogID = s.LogID AND t.LogDate = s.LogDate
+                              AND (t.LogMessageType = s.LogMessageType OR (t.LogMessageType IS NULL AND s.LogMessageType IS NULL))
+                              AND (t.LogMessage = s.LogMessage OR (t.LogMessage IS NULL AND s.LogMessage IS NULL))
+                        )
+                        """)
+                        result = conn.exec_driver_sql(f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM #ProcessedStaging")
+                        inserted += max(result.rowcount, 0)
+                        if rollup_table:
+                            update_rollup(conn, rollup_table)
+                        conn.exec_driver_sql("TRUNCATE TABLE #ProcessedStaging")
+                    metrics.inc("parse_batches_total", table=table_name)
+
+                    # Commit every save_commit_interval chunks so locks are not held for the whole load
+                    if chunk_number % save_commit_interval == 0:
+                        transaction.commit()
+                        transaction = conn.begin()
                 transaction.commit()
-                print(f"Data successfully saved to {table_name}.")
+                metrics.inc("parse_rows_inserted_total", inserted, table=table_name)
+
+                elapsed = time.perf_counter() - start_time
+                print(f"Data successfully saved to {table_name}: {inserted} of {total_rows} rows inserted, "
+                      f"{total_rows / elapsed if elapsed else 0:,.0f} rows/s.")
+                return True
             except Exception as e:
                 transaction.rollback()
                 print(f"An error occurred while saving data to SQL: {e}")
     except Exception as e:
         print(f"An error occurred while connecting to the database: {e}")
+    return False
+
+# Function to create the server x issue type x day rollup when it is missing, backfilled from the rows already saved
+def ensure_rollup_schema(conn, rollup_table, table_name):
+    conn.exec_driver_sql(f"""
+    IF OBJECT_ID('{rollup_table}') IS NULL
+    BEGIN
+        CREATE TABLE {rollup_table} (
+            ServerName NVARCHAR(256) NOT NULL, IssueType NVARCHAR(256) NOT NULL, BucketDate DATE NOT NULL,
+            IssueCount BIGINT NOT NULL, FirstSeen DATETIME2 NOT NULL, LastSeen DATETIME2 NOT NULL,
+            CONSTRAINT PK_{rollup_table} PRIMARY KEY (ServerName, IssueType, BucketDate)
+        );
+        INSERT INTO {rollup_table} (ServerName, IssueType, BucketDate, IssueCount, FirstSeen, LastSeen)
+        SELECT d.ServerName, p.IssueType, CAST(p.LogDate AS DATE), COUNT(*), MIN(p.LogDate), MAX(p.LogDate)
+        FROM {table_name} p
+        JOIN LogDetails d ON d.LogID = p.LogID
+        WHERE d.ServerName IS NOT NULL AND p.IssueType IS NOT NULL
+        GROUP BY d.ServerName, p.IssueType, CAST(p.LogDate AS DATE);
+    END
+    """)
+
+# Function to add the rows in #ProcessedStaging to the rollup: counts are added and first/last seen widened
+# per (server, issue type, day); the server comes from the row's LogDetails entry
+def update_rollup(conn, rollup_table):
+    conn.exec_driver_sql(f"""
+    MERGE {rollup_table} WITH (HOLDLOCK) AS r
+    USING (
+        SELECT d.ServerName, s.IssueType, CAST(s.LogDate AS DATE) AS BucketDate,
+               COUNT(*) AS IssueCount, MIN(s.LogDate) AS FirstSeen, MAX(s.LogDate) AS LastSeen
+        FROM #ProcessedStaging s
+        JOIN LogDetails d ON d.LogID = s.LogID
+        WHERE d.ServerName IS NOT NULL AND s.IssueType IS NOT NULL
+        GROUP BY d.ServerName, s.IssueType, CAST(s.LogDate AS DATE)
+    ) AS n ON r.ServerName = n.ServerName AND r.IssueType = n.IssueType AND r.BucketDate = n.BucketDate
+    WHEN MATCHED THEN
+        UPDATE SET IssueCount = r.IssueCount + n.IssueCount,
+                   FirstSeen = CASE WHEN n.FirstSeen < r.FirstSeen THEN n.FirstSeen ELSE r.FirstSeen END,
+                   LastSeen = CASE WHEN n.LastSeen > r.LastSeen THEN n.LastSeen ELSE r.LastSeen END
+    WHEN NOT MATCHED THEN
+        INSERT (ServerName, IssueType, BucketDate, IssueCount, FirstSeen, LastSeen)
+        VALUES (n.ServerName, n.IssueType, n.BucketDate, n.IssueCount, n.FirstSeen, n.LastSeen);
+    """)
 
 # Function to prepare data for Prophet
 def prepare_data_for_prophet(log_messages_df):
@@ -159,13 +917,142 @@ def prepare_data_for_prophet(log_messages_df):
         print("Required columns for Prophet ('LogDate', 'AnomalyScore') are missing.")
         return pd.DataFrame()
 
-    prophet_data = log_messages_df[['LogDate', 'AnomalyScore']].rename(columns={'LogDate': 'ds', 'AnomalyScore': 'y'})
-    print("Data prepared for Prophet:", prophet_data.shape)
+    # One row per bucket: y is the issue count in the bucket, and buckets without issues are zero-filled
+    issue_counts = (log_messages_df.set_index(pd.to_datetime(log_messages_df['LogDate']))['AnomalyScore']
+                    .resample(forecast_bucket_frequencies[forecast_bucket]).sum())
+    prophet_data = pd.DataFrame({'ds': issue_counts.index, 'y': issue_counts.to_numpy(dtype=float)})
+    print(f"Data prepared for Prophet: {len(log_messages_df)} rows aggregated into {prophet_data.shape[0]} {forecast_bucket} buckets")
     print("Sample of data prepared for Prophet:")
     print(prophet_data.head())
 
     return prophet_data
 
+# Function to prepare one Prophet series per (ServerName, IssueType); returns {series key: prophet data}.
+# Every series is zero-filled over the global bucket_index, and series with fewer than
+# forecast_min_history_buckets non-empty buckets are skipped.
+def prepare_series_for_prophet(log_messages_df, bucket_index):
+    series_columns = [column for column in forecast_series_columns if column in log_messages_df.columns]
+    if log_messages_df.empty or not series_columns:
+        return {}
+
+    frequency = forecast_bucket_frequencies[forecast_bucket]
+    issue_counts = (log_messages_df.assign(LogDate=pd.to_datetime(log_messages_df['LogDate']))
+                    .groupby(series_columns + [pd.Grouper(key='LogDate', freq=frequency)], observed=True)['AnomalyScore'].sum())
+
+    series_data = {}
+    skipped = 0
+    for key, counts in issue_counts.groupby(level=list(range(len(series_columns))), observed=True):
+        if (counts > 0).sum() < forecast_min_history_buckets:
+            skipped += 1
+            continue
+        counts = counts.droplevel(list(range(len(series_columns)))).reindex(bucket_index, fill_value=0)
+        series_key = "|".join(str(value) for value in (key if isinstance(key, tuple) else (key,)))
+        series_data[series_key] = pd.DataFrame({'ds': bucket_index, 'y': counts.to_numpy(dtype=float)})
+
+    print(f"Series prepared for Prophet: {len(series_data)} by {', '.join(series_columns)}, {skipped} skipped as too sparse")
+    return series_data
+
+# Function to fit Prophet on one series and forecast the horizon; returns the model and the forecast.
+# With init the fit warm-starts from earlier parameters, falling back to a cold fit when they do not fit the model.
+def fit_prophet(prophet_data, init=None):
+    model = Prophet()
+    if init is None:
+        model.fit(prophet_data)
+    else:
+        try:
+            model.fit(prophet_data, init=init)
+        except TimeoutError:
+            raise
+        except Exception:
+            model = Prophet()
+            model.fit(prophet_data)
+    future = model.make_future_dataframe(periods=forecast_horizon_days * forecast_buckets_per_day[forecast_bucket],
+                                         freq=forecast_bucket_frequencies[forecast_bucket])
+    return model, model.predict(future)
+
+# Function to extract a fitted model's parameters in the form Prophet accepts as init for a warm start
+def warm_start_params(model):
+    params = {name: model.params[name][0][0] for name in ['k', 'm', 'sigma_obs']}
+    params.update({name: model.params[name][0] for name in ['delta', 'beta']})
+    return params
+
+# Function to raise in a worker whose fit ran past forecast_timeout_seconds
+def raise_forecast_timeout(signum, frame):
+    raise TimeoutError(f"fit exceeded {forecast_timeout_seconds}s")
+
+# Function run in a worker process: forecast one series, tagged with its series key, optionally warm-started.
+# Returns the forecast, the model's warm-start parameters and the model serialized to JSON.
+# Where SIGALRM exists (not on Windows) the fit itself is interrupted at the timeout.
+def fit_series_forecast(series_key, prophet_data, init=None):
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, raise_forecast_timeout)
+        signal.alarm(forecast_timeout_seconds)
+    try:
+        model, forecast = fit_prophet(prophet_data, init)
+    finally:
+        if hasattr(signal, 'SIGALRM'):
+            signal.alarm(0)
+    forecast['SeriesKey'] = series_key
+    return forecast, warm_start_params(model), model_to_json(model)
+
+# Function to forecast all series in parallel across a process pool; returns one frame with a SeriesKey column.
+# Series whose data is unchanged reuse their cached forecast; the others are fitted warm-started from the
+# series' last cached parameters, and their forecast is cached with the fitted model (prophet.serialize JSON,
+# loadable with model_from_json to predict other dates without refitting).
+# Series that fail or run out of time are reported and left out.
+def forecast_all_series(series_data):
+    if not series_data:
+        print("No series available for Prophet modeling.")
+        return pd.DataFrame()
+
+    forecasts = []
+    cache_keys = {}
+    for series_key, prophet_data in series_data.items():
+        cache_key = content_hash(prophet_data, 'forecast', series_key, forecast_horizon_days, forecast_bucket)
+        cached = artifact_cache.get(cache_key)
+        if cached is not None:
+            forecasts.append(cached['forecast'])
+        else:
+            cache_keys[series_key] = cache_key
+    print(f"Forecasts reused from the artifact cache: {len(forecasts)} of {len(series_data)} series")
+    metrics.inc("parse_forecast_series_total", len(forecasts), result="cached")
+    if not cache_keys:
+        return pd.concat(forecasts, ignore_index=True)
+
+    # Leaving the pool's with block terminates its workers, so a fit still running at the deadline (or hung)
+    # is stopped instead of keeping the interpreter from exiting
+    unfinished = []
+    with multiprocessing.get_context().Pool(processes=min(forecast_workers, len(cache_keys))) as pool:
+        results = {series_key: pool.apply_async(fit_series_forecast, (series_key, series_data[series_key],
+                                                artifact_cache.get(content_hash('warm-start', series_key))))
+                   for series_key in cache_keys}
+        # Without SIGALRM a fit cannot be interrupted, so the whole batch gets the time of its rounds of fits
+        rounds = -(-len(results) // forecast_workers)
+        deadline = time.monotonic() + forecast_timeout_seconds * rounds
+        for series_key, result in results.items():
+            try:
+                forecast, init, model_json = result.get(timeout=max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                unfinished.append(series_key)
+                continue
+            except Exception as e:
+                print(f"An error occurred while forecasting series {series_key}: {e}")
+                metrics.inc("parse_forecast_series_total", result="failed")
+                continue
+            forecasts.append(forecast)
+            metrics.inc("parse_forecast_series_total", result="fitted")
+            artifact_cache.put(cache_keys[series_key], {'forecast': forecast, 'model': model_json})
+            artifact_cache.put(content_hash('warm-start', series_key), init)
+    if unfinished:
+        print(f"Forecasting timed out; {len(unfinished)} series left out: {', '.join(unfinished[:10])}")
+        metrics.inc("parse_forecast_series_total", len(unfinished), result="timed_out")
+
+    if not forecasts:
+        return pd.DataFrame()
+    forecast = pd.concat(forecasts, ignore_index=True)
+    print(f"Forecast completed: {len(forecasts)} of {len(series_data)} series, {forecast.shape[0]} rows")
+    return forecast
+
 # Function for predictive modeling using Prophet
 def predictive_modeling(prophet_data):
     if prophet_data.empty:
@@ -173,10 +1060,7 @@ def predictive_modeling(prophet_data):
         return pd.DataFrame()
 
     try:
-        model = Prophet()
-        model.fit(prophet_data)
-        future = model.make_future_dataframe(periods=30)
-        forecast = model.predict(future)
+        _, forecast = fit_prophet(prophet_data)
         print("Forecast completed:", forecast.shape)
         print("Sample of forecast data:")
         print(forecast.head())
@@ -186,58 +1070,251 @@ def predictive_modeling(prophet_data):
         print(f"An error occurred during predictive modeling: {e}")
         return pd.DataFrame()
 
-# Function to save forecast results to SQL
-def save_forecast_to_database(forecast):
+# Function to add the series key and run id columns to ForecastResults when they are missing
+def ensure_forecast_schema(conn):
+    conn.exec_driver_sql("""
+    IF COL_LENGTH('ForecastResults', 'SeriesKey') IS NULL
+        ALTER TABLE ForecastResults ADD SeriesKey NVARCHAR(256) NOT NULL CONSTRAINT DF_ForecastResults_SeriesKey DEFAULT 'all'
+    """)
+    conn.exec_driver_sql("""
+    IF COL_LENGTH('ForecastResults', 'RunID') IS NULL
+        ALTER TABLE ForecastResults ADD RunID VARCHAR(32) NULL
+    """)
+
+# Function to save forecast results to SQL: one bulk load into a temp staging table and one MERGE keyed by
+# (SeriesKey, ds), so a rerun replaces its forecast instead of appending it: the table holds the latest forecast
+# of each series and date, and RunID names the run that wrote it. The columns the report reads are written, plus
+# the existing seasonality column (0 when the forecast has none, as before). Rows carry their own SeriesKey column
+# when present, series_key otherwise.
+# With forecast_future_only, rows up to history_end (the fitted history) are not persisted.
+def save_forecast_to_database(forecast, history_end=None, series_key=default_forecast_series):
     if forecast.empty:
         print("No forecast data to save.")
         return
 
+    if forecast_future_only and history_end is not None:
+        forecast = forecast[forecast['ds'] > history_end]
+    forecast_df = pd.DataFrame({
+        'SeriesKey': forecast['SeriesKey'] if 'SeriesKey' in forecast.columns else series_key,
+        'ds': pd.to_datetime(forecast['ds']),
+        'yhat': forecast['yhat'].astype(float),
+        'yhat_lower': forecast['yhat_lower'].astype(float),
+        'yhat_upper': forecast['yhat_upper'].astype(float),
+        'trend': forecast['trend'].astype(float) if 'trend' in forecast.columns else 0.0,
+        'seasonality': forecast['seasonality'].astype(float) if 'seasonality' in forecast.columns else 0.0,
+        'RunID': forecast_run_id,
+    }).astype(object)
+
     try:
-        engine = create_engine(sql_conn_str)
+        engine = get_sql_engine()
         with engine.connect() as conn:
             transaction = conn.begin()
             try:
-                for _, row in forecast.iterrows():
-                    conn.execute(text(f"""
-                    INSERT INTO ForecastResults (ds, yhat, yhat_lower, yhat_upper, trend, seasonality)
-                    VALUES (:ds, :yhat, :yhat_lower, :yhat_upper, :trend, :seasonality)
-                    """), {
-                        'ds': row['ds'], 
-                        'yhat': row['yhat'], 
-                        'yhat_lower': row['yhat_lower'], 
-                        'yhat_upper': row['yhat_upper'], 
-                        'trend': row.get('trend', 0), 
-                        'seasonality': row.get('seasonality', 0)
-                    })
-                transaction.commit()
-                print("Forecast data successfully saved to ForecastResults.")
+                with metrics.timer("parse_save_batch_seconds", table="ForecastResults"):
+                    ensure_forecast_schema(conn)
+                    conn.exec_driver_sql("IF OBJECT_ID('tempdb..#ForecastStaging') IS NOT NULL DROP TABLE #ForecastStaging")
+                    conn.exec_driver_sql("""
+                    CREATE TABLE #ForecastStaging (
+                        SeriesKey NVARCHAR(256) NOT NULL, ds DATETIME2 NOT NULL, yhat FLOAT, yhat_lower FLOAT,
+                        yhat_upper FLOAT, trend FLOAT, seasonality FLOAT, RunID VARCHAR(32)
+                    )
+                    """)
+                    conn.exec_driver_sql("""
+                    INSERT INTO #ForecastStaging (SeriesKey, ds, yhat, yhat_lower, yhat_upper, trend, seasonality, RunID)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, list(forecast_df.itertuples(index=False, name=None)))
+                    conn.exec_driver_sql("""
+                    MERGE ForecastResults WITH (HOLDLOCK) AS t
+                    USING #ForecastStaging AS s ON t.SeriesKey = s.SeriesKey AND t.ds = s.ds
+                    WHEN MATCHED THEN
+                        UPDATE SET yhat = s.yhat, yhat_lower = s.yhat_lower, yhat_upper = s.yhat_upper, trend = s.trend,
+                            seasonality = s.seasonality, RunID = s.RunID
+                    WHEN NOT MATCHED THEN
+                        INSERT (SeriesKey, ds, yhat, yhat_lower, yhat_upper, trend, seasonality, RunID)
+                        VALUES (s.SeriesKey, s.ds, s.yhat, s.yhat_lower, s.yhat_upper, s.trend, s.seasonality, s.RunID);
+                    """)
+                    conn.exec_driver_sql("DROP TABLE #ForecastStaging")
+                    transaction.commit()
+                metrics.inc("parse_batches_total", table="ForecastResults")
+                metrics.inc("parse_rows_inserted_total", len(forecast_df), table="ForecastResults")
+                print(f"Forecast data successfully saved to ForecastResults: {len(forecast_df)} rows for "
+                      f"{forecast_df['SeriesKey'].nunique()} series, run {forecast_run_id}.")
             except Exception as e:
                 transaction.rollback()
                 print(f"An error occurred while saving forecast to SQL: {e}")
     except Exception as e:
         print(f"An error occurred while connecting to the database: {e}")
 
-# Main function to execute the process
-def main():
-    log_messages_df = get_data_from_stored_procedure()
-    
-    if log_messages_df.empty:
-        print("No data loaded. Exiting process.")
-        return
+# Function to load the watermark (highest LogID/LogDate saved, time of the last full refit)
+def load_watermark(path=watermark_path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
 
-    log_messages_df[['LogTemplate', 'ParsedMessage', 'IssueType']] = log_messages_df['LogMessage'].apply(lambda msg: pd.Series(parse_log_message(msg)))
+# Function to save the watermark atomically
+def save_watermark(watermark, path=watermark_path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(watermark, file, indent=2)
+    os.replace(temp_path, path)
 
-    features_df = feature_engineering(log_messages_df)
-    
-    log_messages_with_anomalies = detect_anomalies(log_messages_df, features_df)
-    
-    save_to_database(log_messages_with_anomalies, 'LogMessages_Processed')
+# Function to load the persisted cluster model, or None when there is none yet
+def load_cluster_model(path=cluster_model_path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+# Function to save the cluster model atomically
+def save_cluster_model(cluster_model, path=cluster_model_path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump(cluster_model, file)
+    os.replace(temp_path, path)
+
+# Function to decide whether this run refits on all history
+def is_full_refit_due(watermark, cluster_model):
+    if processing_mode == "full" or cluster_model is None or 'LogID' not in watermark:
+        return True
+    last_full_refit = datetime.fromisoformat(watermark['last_full_refit'])
+    return datetime.now() - last_full_refit >= timedelta(days=full_refit_interval_days)
+
+# Function to advance the watermark over saved rows, given as the last LogDate saved per LogID: the highest LogID,
+# and the last LogDate per log file. Files without a row in the watermark_open_file_days before the newest row are
+# dropped from the per-file dates as closed; rows appended to them after all are picked up by the next full refit.
+def advance_watermark(watermark, saved_log_dates):
+    file_log_dates = {int(log_id): pd.Timestamp(log_date) for log_id, log_date in watermark.get('LogDates', {}).items()}
+    for log_id, log_date in saved_log_dates.items():
+        file_log_dates[log_id] = max(log_date, file_log_dates.get(log_id, log_date))
+    newest_log_date = max(file_log_dates.values())
+    open_since = newest_log_date - timedelta(days=watermark_open_file_days)
+    watermark['LogDates'] = {str(log_id): str(log_date) for log_id, log_date in sorted(file_log_dates.items()) if log_date >= open_since}
+    watermark['LogID'] = max(int(saved_log_dates.index.max()), watermark.get('LogID', 0))
+    watermark['LogDate'] = str(newest_log_date)
+
+# Function to save the processed rows, read back from the spilled chunks with their group's cluster, and, once they
+# are saved, advance the watermark and persist the template store and (on a refit) the cluster model. The spilled
+# chunks are removed either way. Returns True when the rows were saved.
+def save_processed_rows(log_chunks, group_df, watermark, template_miner, cluster_model, refit):
+    try:
+        with metrics.stage("parse.save"):
+            saved = save_to_database(log_chunks.processed_chunks(group_df, template_miner), 'LogMessages_Processed',
+                                     rollup_table=issue_rollup_table)
+    finally:
+        log_chunks.cleanup()
+    if not saved:
+        print("Watermark not advanced; the next run will retry these rows.")
+        return False
+
+    # Advance the watermark only after the rows are saved; it never moves back
+    advance_watermark(watermark, log_chunks.log_dates)
+    template_miner.save(template_store_path)
+    if refit:
+        save_cluster_model(cluster_model)
+        watermark['last_full_refit'] = datetime.now().isoformat()
+    save_watermark(watermark)
+    return True
+
+# Function to run a persistence step in the calling thread and return its result
+def persist_inline(function, *args, **kwargs):
+    return function(*args, **kwargs)
+
+# Function to get the result of a persistence step, waiting for it when persist handed it to a background writer
+def persisted_result(result):
+    return result.result() if isinstance(result, concurrent.futures.Future) else result
+
+# Function to read the issue history for the forecast from the rollup: one row per (day, server, issue type)
+# with the day's issue count as AnomalyScore, the column the Prophet preparation sums per bucket
+def load_rollup_history():
+    query = text(f"SELECT BucketDate AS LogDate, ServerName, IssueType, IssueCount AS AnomalyScore FROM {issue_rollup_table}")
+    try:
+        history_df = pd.read_sql(query, get_sql_engine())
+    except Exception as e:
+        print(f"An error occurred while reading the issue history from {issue_rollup_table}: {e}")
+        return pd.DataFrame()
+    history_df['LogDate'] = pd.to_datetime(history_df['LogDate'])
+    print(f"Issue history loaded from {issue_rollup_table}: {len(history_df)} server / issue type / day rows")
+    return history_df
+
+# Function to run the parsing stage: load (or take log_message_chunks), classify, cluster and forecast.
+# SQL writes go through persist: inline by default, or handed to a background writer by run_pipeline.py,
+# in which case a full refit carries on with the forecast while the rows are being saved.
+# Full refits forecast from the issue counts aggregated while loading; incremental runs forecast from the rollup
+# (daily buckets only) once their rows are saved into it. Returns the clustering groups (with their Cluster),
+# the forecast and the end of the forecast history.
+def run_parsing(log_message_chunks=None, persist=persist_inline):
+    watermark = load_watermark()
+    cluster_model = load_cluster_model()
+    refit = is_full_refit_due(watermark, cluster_model)
+    template_miner = TemplateMiner.load(template_store_path)
+    if refit:
+        # A refit needs all history, so in-memory chunks are not enough
+        print("Full refit: loading all rows.")
+        cluster_model = {}
+        with metrics.stage("parse.load"):
+            log_chunks = load_classified_log_messages(template_miner)
+    elif log_message_chunks is not None:
+        print("Incremental run: using the rows handed over in memory.")
+        with metrics.stage("parse.load"):
+            log_chunks = load_classified_log_messages(template_miner, log_message_chunks=log_message_chunks)
+    else:
+        print(f"Incremental run: loading rows after LogID {watermark['LogID']} and rows appended to "
+              f"{len(watermark.get('LogDates', {}))} open log files.")
+        with metrics.stage("parse.load"):
+            log_chunks = load_classified_log_messages(template_miner, watermark=watermark)
     
-    prophet_data = prepare_data_for_prophet(log_messages_with_anomalies)
+    if not log_chunks.rows:
+        log_chunks.cleanup()
+        print("No data loaded. Exiting process.")
+        return pd.DataFrame(), pd.DataFrame(), None
+
+    try:
+        group_df, cluster_model = cluster_template_groups(log_chunks.template_groups(template_miner), cluster_model, refit)
+    except Exception:
+        log_chunks.cleanup()
+        raise
     
-    forecast = predictive_modeling(prophet_data)
+    # Inline the save result is known here; a background save is waited for before anything depends on it
+    saved = persist(save_processed_rows, log_chunks, group_df, watermark, template_miner, cluster_model, refit)
+    if saved is False:
+        return group_df, pd.DataFrame(), None
+
+    # The forecast needs the whole history: a refit aggregated it while loading, an incremental run reads it from the rollup
+    if refit:
+        history_df = log_chunks.issue_history()
+    elif forecast_bucket != 'daily':
+        print("Incremental run: the rollup holds daily counts, so the hourly forecast is refreshed at the next full refit.")
+        return group_df, pd.DataFrame(), None
+    elif persisted_result(saved) is False:
+        return group_df, pd.DataFrame(), None
+    else:
+        history_df = load_rollup_history()
+
+    prophet_data = prepare_data_for_prophet(history_df)
+    if prophet_data.empty:
+        return group_df, pd.DataFrame(), None
+
+    # The global series plus one per (ServerName, IssueType), fitted in parallel
+    series_data = {default_forecast_series: prophet_data}
+    series_data.update(prepare_series_for_prophet(history_df, prophet_data['ds']))
+    with metrics.stage("parse.forecast"):
+        forecast = forecast_all_series(series_data)
     
-    save_forecast_to_database(forecast)
+    # A forecast is only saved next to the processed rows it was fitted on
+    if persisted_result(saved) is False:
+        print("The processed rows were not saved; the forecast is not saved either.")
+        return group_df, pd.DataFrame(), None
+    history_end = prophet_data['ds'].max()
+    persist(save_forecast_to_database, forecast, history_end=history_end)
+    return group_df, forecast, history_end
+
+# Main function to execute the process
+def main():
+    run_parsing()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        metrics.export("parsing")
@@ -2,14 +2,21 @@
 4generatereport_v2.py
 
 Description:
-This script generates a comprehensive text report based on the processed log data and future forecasts.
+This script generates a comprehensive report based on the processed log data and future forecasts.
 It provides summaries of issues by server, as well as future predictions based on the results of the Prophet model.
 
 Key Features:
-- Generates server-wise issue summaries.
+- Pushes filtering, deduplication, top-N and GROUP BY counts into parameterized SQL, and pages detail rows
+  per server with keyset pagination, so report cost depends on report size rather than table size. Detail
+  rows come from GetEndUserLogReport, materialised and deduplicated once per report into an indexed temp table.
+- Generates server-wise issue summaries and a daily issue trend from the IssueRollup table, without scanning the log history.
 - Provides detailed log entries by date and issue.
-- Produces a forecast summary with predicted future log issues.
-- Outputs a text report for end-user consumption.
+- Produces a forecast summary with predicted future log issues, including the server / issue types
+  with the highest predicted counts.
+- Outputs the report for end-user consumption as text, CSV, JSON and HTML in one pass: each section is
+  formatted column-wise in chunks and streamed to every output as it is produced.
+- Query latency, per-table write time and row counters exported through pipeline_metrics
+  (metrics/report.prom and metrics/report_summary.json).
 
 Requirements:
 - Python 3.8+
@@ -21,118 +28,534 @@ Run the script to generate a report based on log data and forecasts.
     python 4generatereport_v2.py
 """
 
+import html
+import json
+from datetime import date, datetime, timedelta
 import pandas as pd
 from sqlalchemy import create_engine, text
 import urllib
+import pipeline_metrics as metrics
 
 # Connection details
 connection_string = "<PROVIDE YOUR ODBC DSN AND CREDENTIALS>"
 params = urllib.parse.quote_plus(connection_string)
 sql_conn_str = f"mssql+pyodbc:///?odbc_connect={params}"
 
-# Function to call the stored procedure and get data
-def get_data_from_stored_procedure():
-    try:
-        # Create SQLAlchemy engine
-        engine = create_engine(sql_conn_str)
+# Series key of the global forecast written by 3LogParsing_AD_CC_PM_v3.py
+global_forecast_series = "all"
 
-        # Execute the stored procedure
-        query = text("EXEC GetEndUserLogReport")
-        detailed_log_df = pd.read_sql(query, engine)
-        print("Data loaded from stored procedure:", detailed_log_df.shape)
+# Report output settings
+report_basename = "End_User_Log_Report"
+report_formats = ["txt", "csv", "json", "html"]  # Any of txt, csv, json, html; all are written in the same pass
+report_chunk_rows = 100000  # Rows formatted and written at a time, so memory stays flat for large sections
+report_top_n = 5  # Rows in the forecast top-N tables
+report_page_rows = 50000  # Detail rows fetched per query page
+report_detail_rows_per_server = 1000  # Cap on detail rows per server in Section 2; None prints all
+report_trend_days = 14  # Days in the daily issue trend of Section 1
 
-        return detailed_log_df
+# Rollup maintained by 3LogParsing_AD_CC_PM_v3.py: counts and first/last seen per (ServerName, IssueType, day)
+issue_rollup_table = "IssueRollup"
 
-    except Exception as e:
-        print(f"An error occurred while pulling data from SQL: {e}")
-        return pd.DataFrame()
+# Procedure Section 2 lists the log rows of, and the columns of its result set Section 2 reads
+report_log_procedure = "GetEndUserLogReport"
+report_log_required_columns = ['ServerName', 'LogDate', 'IssueType', 'ParsedMessage']
+
+# Report data-access layer: filtering, deduplication, top-N and counts run in SQL as parameterized queries,
+# so the report reads only the rows it prints. Detail rows are fetched per server in keyset-paged pages.
+class ReportDataAccess:
+    def __init__(self, engine):
+        self.engine = engine
+        self.detail_connection = None
+
+    def query(self, sql, connection=None, **params):
+        with metrics.timer("report_query_seconds"):
+            return pd.read_sql(text(sql), connection if connection is not None else self.engine, params=params)
+
+    # Column definitions of the report procedure's result set as SQL Server describes it, so the temp table
+    # INSERT ... EXEC fills always has the procedure's shape. Raises when the result set cannot be described
+    # or lacks a column Section 2 reads.
+    def report_log_columns(self, connection):
+        described = self.query("""
+        SELECT name, system_type_name, error_message
+        FROM sys.dm_exec_describe_first_result_set(:statement, NULL, 0)
+        ORDER BY column_ordinal
+        """, connection, statement=f"EXEC {report_log_procedure}")
+        if described.empty or described['error_message'].notna().any():
+            reason = described['error_message'].dropna().iloc[0] if not described.empty else "no result set"
+            raise RuntimeError(f"Cannot describe the result set of {report_log_procedure}: {reason}")
+        missing = [column for column in report_log_required_columns if column not in set(described['name'])]
+        if missing:
+            raise RuntimeError(f"The result set of {report_log_procedure} lacks the columns {', '.join(missing)}")
+        return ", ".join("[" + described['name'].str.replace("]", "]]") + "] " + described['system_type_name'] + " NULL")
+
+    # Materialise the detail rows once per report, on a connection held until close: the rows of
+    # EXEC report_log_procedure (so its filtering applies), deduplicated on (ServerName, LogDate, ParsedMessage)
+    # and numbered per server in date order into a temp table clustered on (ServerName, RowNumber),
+    # so every page is an index seek instead of a re-ranking of the server's rows
+    def materialize_detail_rows(self):
+        connection = self.engine.connect()
+        with metrics.timer("report_query_seconds"):
+            connection.exec_driver_sql(f"CREATE TABLE #ReportLogs ({self.report_log_columns(connection)})")
+            connection.exec_driver_sql(f"INSERT INTO #ReportLogs EXEC {report_log_procedure}")
+            connection.exec_driver_sql("""
+            SELECT ServerName, LogDate, IssueType, ParsedMessage,
+                   ROW_NUMBER() OVER (PARTITION BY ServerName ORDER BY LogDate, ParsedMessage) AS RowNumber
+            INTO #ReportDetail
+            FROM (
+                SELECT ServerName, LogDate, IssueType, COALESCE(ParsedMessage, '') AS ParsedMessage,
+                       ROW_NUMBER() OVER (PARTITION BY ServerName, LogDate, COALESCE(ParsedMessage, '') ORDER BY IssueType) AS duplicate_rank
+                FROM #ReportLogs
+            ) AS logs
+            WHERE duplicate_rank = 1
+            """)
+            connection.exec_driver_sql("CREATE CLUSTERED INDEX IX_ReportDetail ON #ReportDetail (ServerName, RowNumber)")
+            connection.commit()
+        return connection
+
+    # Connection holding the materialised detail rows, materialising them on first use
+    def detail_rows_connection(self):
+        if self.detail_connection is None:
+            self.detail_connection = self.materialize_detail_rows()
+        return self.detail_connection
+
+    # Servers with detail rows and their deduplicated row counts, in server order
+    def detail_server_counts(self):
+        return self.query("""
+        SELECT ServerName, COUNT(*) AS DetailRows
+        FROM #ReportDetail
+        WHERE ServerName IS NOT NULL
+        GROUP BY ServerName
+        ORDER BY ServerName
+        """, self.detail_rows_connection())
+
+    # Release the connection holding the materialised detail rows
+    def close(self):
+        if self.detail_connection is not None:
+            self.detail_connection.close()
+            self.detail_connection = None
+
+    # Issue counts per (ServerName, IssueType) with first/last seen, most frequent first within each server,
+    # read from the rollup the parsing script maintains
+    def server_issue_counts(self):
+        return self.query(f"""
+        SELECT ServerName, IssueType, SUM(IssueCount) AS Count, MIN(FirstSeen) AS FirstSeen, MAX(LastSeen) AS LastSeen
+        FROM {issue_rollup_table}
+        GROUP BY ServerName, IssueType
+        ORDER BY ServerName, Count DESC
+        """)
+
+    # Issue counts per day and issue type over the last days, from the rollup
+    def daily_issue_trend(self, days):
+        return self.query(f"""
+        SELECT BucketDate, IssueType, SUM(IssueCount) AS Count
+        FROM {issue_rollup_table}
+        WHERE BucketDate >= :since
+        GROUP BY BucketDate, IssueType
+        ORDER BY BucketDate, Count DESC
+        """, since=date.today() - timedelta(days=days - 1))
+
+    # Detail rows of one server, deduplicated on (LogDate, ParsedMessage) and ordered by date, in pages of
+    # report_page_rows from the materialised detail rows; each page continues after the RowNumber of the previous one
+    def iter_server_detail_pages(self, server_name, row_limit=None):
+        after_row, fetched = 0, 0
+        while row_limit is None or fetched < row_limit:
+            page_rows = report_page_rows if row_limit is None else min(report_page_rows, row_limit - fetched)
+            page = self.query("""
+            SELECT TOP (:page_rows) LogDate, IssueType, ParsedMessage, RowNumber
+            FROM #ReportDetail
+            WHERE ServerName = :server_name AND RowNumber > :after_row
+            ORDER BY RowNumber
+            """, self.detail_rows_connection(), page_rows=page_rows, server_name=server_name, after_row=after_row)
+            if page.empty:
+                break
+            after_row = int(page['RowNumber'].iloc[-1])
+            page = page.drop(columns='RowNumber')
+            page.insert(0, 'ServerName', server_name)
+            yield page
+            fetched += len(page)
+            if len(page) < page_rows:
+                break
+
+    # Top-N future dates of the global forecast by predicted count
+    def top_forecast_dates(self, top_n):
+        return self.query("""
+        SELECT TOP (:top_n) ds, yhat, yhat_lower, yhat_upper
+        FROM ForecastResults
+        WHERE SeriesKey = :series_key AND ds >= :now
+        ORDER BY yhat DESC
+        """, top_n=top_n, series_key=global_forecast_series, now=datetime.now())
+
+    # Row counts per trend value of the global forecast from today onward
+    def forecast_trends(self):
+        return self.query("""
+        SELECT trend, COUNT(*) AS Count
+        FROM ForecastResults
+        WHERE SeriesKey = :series_key AND ds >= :since
+        GROUP BY trend
+        ORDER BY trend
+        """, series_key=global_forecast_series, since=date.today())
+
+    # Top-N (ServerName, IssueType) series by total predicted count over the future horizon
+    def top_forecast_series(self, top_n):
+        top_series = self.query("""
+        SELECT TOP (:top_n) SeriesKey, SUM(yhat) AS PredictedIssueCount
+        FROM ForecastResults
+        WHERE SeriesKey <> :series_key AND ds >= :now
+        GROUP BY SeriesKey
+        ORDER BY SUM(yhat) DESC
+        """, top_n=top_n, series_key=global_forecast_series, now=datetime.now())
+        if top_series.empty:
+            return pd.DataFrame(columns=['ServerName', 'IssueType', 'PredictedIssueCount'])
+        series_parts = top_series['SeriesKey'].str.partition("|")
+        return pd.DataFrame({'ServerName': series_parts[0], 'IssueType': series_parts[2],
+                             'PredictedIssueCount': top_series['PredictedIssueCount']})
+
+# Data access for a report generated right after the parsing stage in the same process (run_pipeline.py):
+# the forecast sections are answered from the forecast frame just fitted instead of being read back from
+# ForecastResults; everything else is read from SQL. Rows up to history_end are the fit over the history,
+# which is not persisted either.
+class CycleReportDataAccess(ReportDataAccess):
+    def __init__(self, engine, forecast, history_end=None):
+        super().__init__(engine)
+        if history_end is not None:
+            forecast = forecast[forecast['ds'] > history_end]
+        self.forecast = forecast
+
+    def future_forecast(self, since):
+        return self.forecast[self.forecast['ds'] >= pd.Timestamp(since)]
+
+    def top_forecast_dates(self, top_n):
+        forecast = self.future_forecast(datetime.now())
+        forecast = forecast[forecast['SeriesKey'] == global_forecast_series]
+        return forecast.nlargest(top_n, 'yhat')[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].reset_index(drop=True)
+
+    def forecast_trends(self):
+        forecast = self.future_forecast(date.today())
+        forecast = forecast[forecast['SeriesKey'] == global_forecast_series]
+        return forecast.groupby('trend').size().reset_index(name='Count')
+
+    def top_forecast_series(self, top_n):
+        forecast = self.future_forecast(datetime.now())
+        forecast = forecast[forecast['SeriesKey'] != global_forecast_series]
+        top_series = forecast.groupby('SeriesKey')['yhat'].sum().nlargest(top_n)
+        if top_series.empty:
+            return pd.DataFrame(columns=['ServerName', 'IssueType', 'PredictedIssueCount'])
+        series_parts = top_series.index.to_series().str.partition("|")
+        return pd.DataFrame({'ServerName': series_parts[0].to_numpy(), 'IssueType': series_parts[2].to_numpy(),
+                             'PredictedIssueCount': top_series.to_numpy()})
+
+# A table in a report section. text_format builds the text line of every row of a chunk column-wise;
+# rows of a group_column get a "<group_label>: <value>" header line in the text report when the value changes.
+class ReportTable:
+    def __init__(self, name, title, text_format, group_column=None, group_label=None):
+        self.name = name
+        self.title = title
+        self.text_format = text_format
+        self.group_column = group_column
+        self.group_label = group_label
+
+# Text report writer: the layout of the original End_User_Log_Report.txt
+class TextReportWriter:
+    extension = "txt"
+
+    def __init__(self, basename):
+        self.path = f"{basename}.{self.extension}"
+        self.file = open(self.path, "w")
+        self.last_group = None
+
+    def start_report(self, title):
+        self.file.write(f"{title}\n" + "=" * 50 + "\n")
+
+    def start_section(self, title):
+        self.file.write(f"{title}\n")
+
+    def note(self, text):
+        self.file.write(f"{text}\n")
+
+    def start_table(self, table):
+        self.last_group = None
+        if table.title:
+            self.file.write(f"{table.title}\n")
+
+    def write_rows(self, table, chunk):
+        lines = table.text_format(chunk)
+        if table.group_column:
+            groups = chunk[table.group_column].astype(str)
+            previous = groups.shift(1)
+            previous.iloc[0] = self.last_group
+            headers = ("\n" + table.group_label + ": " + groups + "\n").where(groups != previous, "")
+            lines = headers + lines
+            self.last_group = groups.iloc[-1]
+        self.file.write("".join(lines + "\n"))
+
+    def end_table(self, table):
+        pass
+
+    def end_section(self):
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+# CSV report writer: one file per table, named <basename>_<table>.csv
+class CsvReportWriter:
+    extension = "csv"
+
+    def __init__(self, basename):
+        self.basename = basename
+        self.path = f"{basename}_*.{self.extension}"
+        self.file = None
+
+    def start_report(self, title):
+        pass
+
+    def start_section(self, title):
+        pass
+
+    def note(self, text):
+        pass
+
+    def start_table(self, table):
+        self.file = open(f"{self.basename}_{table.name}.{self.extension}", "w", newline="")
+        self.header = True
+
+    def write_rows(self, table, chunk):
+        chunk.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def end_table(self, table):
+        self.file.close()
+
+    def end_section(self):
+        pass
 
-# Function to load forecasting data from SQL Server
-def load_forecast_data():
+    def close(self):
+        pass
+
+# JSON report writer: {"title", "sections": [{"title", "items": [{"note"} | {"table", "title", "rows"}]}]}, streamed
+class JsonReportWriter:
+    extension = "json"
+
+    def __init__(self, basename):
+        self.path = f"{basename}.{self.extension}"
+        self.file = open(self.path, "w")
+
+    def start_report(self, title):
+        self.file.write('{"title": %s, "sections": [' % json.dumps(title))
+        self.first_section = True
+
+    def start_section(self, title):
+        self.file.write(("" if self.first_section else ", ") + '{"title": %s, "items": [' % json.dumps(title))
+        self.first_section = False
+        self.first_item = True
+
+    def next_item(self):
+        if not self.first_item:
+            self.file.write(", ")
+        self.first_item = False
+
+    def note(self, text):
+        self.next_item()
+        self.file.write('{"note": %s}' % json.dumps(text.strip()))
+
+    def start_table(self, table):
+        self.next_item()
+        self.file.write('{"table": %s, "title": %s, "rows": [' % (json.dumps(table.name), json.dumps(table.title.strip())))
+        self.first_row = True
+
+    def write_rows(self, table, chunk):
+        rows = chunk.to_json(orient='records', date_format='iso')[1:-1]
+        self.file.write(("" if self.first_row else ", ") + rows)
+        self.first_row = False
+
+    def end_table(self, table):
+        self.file.write("]}")
+
+    def end_section(self):
+        self.file.write("]}")
+
+    def close(self):
+        self.file.write("]}\n")
+        self.file.close()
+
+# HTML report writer: one heading per section and one HTML table per report table
+class HtmlReportWriter:
+    extension = "html"
+
+    def __init__(self, basename):
+        self.path = f"{basename}.{self.extension}"
+        self.file = open(self.path, "w")
+
+    def start_report(self, title):
+        self.file.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head><body>\n"
+                        f"<h1>{html.escape(title)}</h1>\n")
+
+    def start_section(self, title):
+        self.file.write(f"<h2>{html.escape(title)}</h2>\n")
+
+    def note(self, text):
+        self.file.write(f"<p>{html.escape(text.strip())}</p>\n")
+
+    def start_table(self, table):
+        if table.title:
+            self.file.write(f"<h3>{html.escape(table.title.strip())}</h3>\n")
+        self.file.write("<table>\n")
+        self.header = True
+
+    def write_rows(self, table, chunk):
+        if self.header:
+            self.file.write("<tr>" + "".join(f"<th>{html.escape(str(column))}</th>" for column in chunk.columns) + "</tr>\n")
+            self.header = False
+        cells = ["<td>" + chunk[column].astype(str).map(html.escape) + "</td>" for column in chunk.columns]
+        rows = "<tr>" + pd.concat(cells, axis=1).sum(axis=1) + "</tr>\n"
+        self.file.write("".join(rows))
+
+    def end_table(self, table):
+        self.file.write("</table>\n")
+
+    def end_section(self):
+        pass
+
+    def close(self):
+        self.file.write("</body></html>\n")
+        self.file.close()
+
+report_writer_classes = {writer.extension: writer for writer in [TextReportWriter, CsvReportWriter, JsonReportWriter, HtmlReportWriter]}
+
+# Function to cut a frame into chunks of report_chunk_rows rows
+def iter_frame_chunks(table_df):
+    for start in range(0, len(table_df), report_chunk_rows):
+        yield table_df.iloc[start:start + report_chunk_rows]
+
+# Function to write a table to every writer, chunk by chunk as the chunks arrive; the time recorded
+# for the table includes fetching chunks that are read lazily (detail pages)
+def write_report_table(writers, table, chunks):
+    with metrics.timer("report_table_seconds", table=table.name):
+        for writer in writers:
+            writer.start_table(table)
+        for chunk in chunks:
+            for writer in writers:
+                writer.write_rows(table, chunk)
+            metrics.inc("report_rows_written_total", len(chunk), table=table.name)
+        for writer in writers:
+            writer.end_table(table)
+
+# Function to write a note to every writer
+def write_report_note(writers, text):
+    for writer in writers:
+        writer.note(text)
+
+# Function to format floats with two decimals, column-wise
+def format_2f(values):
+    return values.map("{:.2f}".format)
+
+# Function to format timestamps column-wise the way str(Timestamp) does (microseconds only when present)
+def format_timestamp(values):
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype(str)
+    formatted = values.dt.strftime("%Y-%m-%d %H:%M:%S")
+    microseconds = values.dt.microsecond
+    return formatted.where(microseconds == 0, formatted + "." + microseconds.astype(str).str.zfill(6))
+
+# Function to generate the report in every format of report_formats, one section at a time,
+# fetching each section's rows from the data-access layer as it is written
+def generate_report(data_access, formats=None):
+    writers = [report_writer_classes[extension](report_basename) for extension in (formats or report_formats)]
     try:
-        # Create SQLAlchemy engine
-        engine = create_engine(sql_conn_str)
+        for writer in writers:
+            writer.start_report("LOG PARSING AND FORECASTING REPORT")
 
-        # Load data from ForecastResults table
-        forecast_results_query = "SELECT * FROM ForecastResults"
-        forecast_results_df = pd.read_sql(forecast_results_query, engine)
+        # Section 1: Server-Wise Summary
+        for writer in writers:
+            writer.start_section("1. Server-Wise Issue Summary")
+        server_wise_summary = data_access.server_issue_counts()
+        if server_wise_summary.empty:
+            write_report_note(writers, "No issues found.")
+        else:
+            write_report_table(writers, ReportTable(
+                "server_summary", "",
+                lambda chunk: "Issue: " + chunk['IssueType'].astype(str) + " - " + chunk['Count'].astype(str) + " occurrences",
+                group_column='ServerName', group_label="Server"), iter_frame_chunks(server_wise_summary))
 
-        return forecast_results_df
+        daily_trend = data_access.daily_issue_trend(report_trend_days)
+        if not daily_trend.empty:
+            write_report_table(writers, ReportTable(
+                "daily_issue_trend", f"\nDaily Issue Trend (last {report_trend_days} days):",
+                lambda chunk: "Issue: " + chunk['IssueType'].astype(str) + " - " + chunk['Count'].astype(str) + " occurrences",
+                group_column='BucketDate', group_label="Day"), iter_frame_chunks(daily_trend))
+        for writer in writers:
+            writer.end_section()
 
-    except Exception as e:
-        print(f"An error occurred while loading forecast data from SQL: {e}")
-        return pd.DataFrame()
-
-# Function to generate a user-friendly text report
-def generate_text_report(detailed_log_df, forecast_results_df):
-    report = []
-    report.append("LOG PARSING AND FORECASTING REPORT\n")
-    report.append("=" * 50 + "\n")
-
-    # Section 1: Server-Wise Summary
-    report.append("1. Server-Wise Issue Summary\n")
-    server_wise_summary = detailed_log_df.groupby('ServerName')['IssueType'].value_counts().reset_index(name='Count')
-    
-    if server_wise_summary.empty:
-        report.append("No issues found.\n")
-    else:
-        for server, group in server_wise_summary.groupby('ServerName'):
-            report.append(f"\nServer: {server}\n")
-            for _, row in group.iterrows():
-                report.append(f"Issue: {row['IssueType']} - {row['Count']} occurrences\n")
-    report.append("\n")
-
-    # Remove duplicate entries for Section 2
-    unique_logs_df = detailed_log_df.drop_duplicates(subset=['ServerName', 'LogDate', 'ParsedMessage'])
-
-    # Section 2: Detailed Logs by Server and Date
-    report.append("2. Detailed Logs by Server and Date\n")
-    for server, group in unique_logs_df.groupby('ServerName'):
-        report.append(f"\nServer: {server}\n")
-        for _, row in group.iterrows():
-            report.append(f"Date: {row['LogDate']}, Issue: {row['IssueType']}, Message: {row['ParsedMessage']}\n")
-    report.append("\n")
-
-    # Section 3: Forecasting Summary
-    report.append("3. Forecasting Summary\n")
-    future_forecasts = forecast_results_df[forecast_results_df['ds'] >= pd.Timestamp.now()]
-    
-    if future_forecasts.empty:
-        report.append("No future forecasts available.\n")
-    else:
-        max_forecast = future_forecasts.sort_values(by='yhat', ascending=False).head(5)
-        report.append("Top 5 Dates with Highest Predicted Issue Counts:\n")
-        for _, row in max_forecast.iterrows():
-            report.append(f"Date: {row['ds']}, Predicted Issue Count: {row['yhat']:.2f}, Confidence Interval: [{row['yhat_lower']:.2f}, {row['yhat_upper']:.2f}]\n")
-
-        report.append("\nGeneral Forecast Trends:\n")
-        trend_summary = forecast_results_df.groupby('trend').size().reset_index(name='Count')
-        for _, row in trend_summary.iterrows():
-            report.append(f"Trend Value: {row['trend']}, Count: {row['Count']} occurrences\n")
-    
-    report.append("\n")
-
-    # Save the report to a text file
-    with open("End_User_Log_Report.txt", "w") as file:
-        file.writelines(report)
-
-    print("Report generated successfully: End_User_Log_Report.txt")
+        # Section 2: Detailed Logs by Server and Date, deduplicated and paged per server in SQL; the servers come
+        # from the detail rows themselves, and servers cut off by the per-server cap are noted after the table
+        for writer in writers:
+            writer.start_section("2. Detailed Logs by Server and Date")
+        detail_servers = data_access.detail_server_counts()
+        detail_pages = (page for server_name in detail_servers['ServerName']
+                        for page in data_access.iter_server_detail_pages(server_name, report_detail_rows_per_server))
+        write_report_table(writers, ReportTable(
+            "detailed_logs", "",
+            lambda chunk: ("Date: " + format_timestamp(chunk['LogDate']) + ", Issue: " + chunk['IssueType'].astype(str)
+                           + ", Message: " + chunk['ParsedMessage'].astype(str)),
+            group_column='ServerName', group_label="Server"), detail_pages)
+        if report_detail_rows_per_server is not None:
+            for server_name, detail_rows in zip(detail_servers['ServerName'], detail_servers['DetailRows']):
+                if detail_rows > report_detail_rows_per_server:
+                    write_report_note(writers, f"Server {server_name}: {detail_rows - report_detail_rows_per_server} more rows omitted "
+                                               f"(report_detail_rows_per_server = {report_detail_rows_per_server}).")
+        for writer in writers:
+            writer.end_section()
+
+        # Section 3: Forecasting Summary; dates and trends come from the global series,
+        # per-(ServerName, IssueType) series are ranked separately
+        for writer in writers:
+            writer.start_section("3. Forecasting Summary")
+        max_forecast = data_access.top_forecast_dates(report_top_n)
+        if max_forecast.empty:
+            write_report_note(writers, "No future forecasts available.")
+        else:
+            write_report_table(writers, ReportTable(
+                "top_forecast_dates", f"Top {report_top_n} Dates with Highest Predicted Issue Counts:",
+                lambda chunk: ("Date: " + format_timestamp(chunk['ds']) + ", Predicted Issue Count: " + format_2f(chunk['yhat'])
+                               + ", Confidence Interval: [" + format_2f(chunk['yhat_lower']) + ", " + format_2f(chunk['yhat_upper']) + "]")),
+                iter_frame_chunks(max_forecast))
+
+            write_report_table(writers, ReportTable(
+                "forecast_trends", "\nGeneral Forecast Trends:",
+                lambda chunk: "Trend Value: " + chunk['trend'].astype(str) + ", Count: " + chunk['Count'].astype(str) + " occurrences"),
+                iter_frame_chunks(data_access.forecast_trends()))
+
+        top_series_df = data_access.top_forecast_series(report_top_n)
+        if not top_series_df.empty:
+            write_report_table(writers, ReportTable(
+                "top_forecast_series", "\nServer / Issue Types with Highest Predicted Issue Counts:",
+                lambda chunk: ("Server: " + chunk['ServerName'] + ", Issue: " + chunk['IssueType']
+                               + ", Predicted Issue Count: " + format_2f(chunk['PredictedIssueCount']))),
+                iter_frame_chunks(top_series_df))
+        for writer in writers:
+            writer.end_section()
+    finally:
+        for writer in writers:
+            writer.close()
+        data_access.close()
+
+    print("Report generated successfully:", ", ".join(writer.path for writer in writers))
 
 # Main function to execute the process
 def main():
-    # Load data from stored procedure
-    detailed_log_df = get_data_from_stored_procedure()
-
-    # Load forecast data from SQL Server
-    forecast_results_df = load_forecast_data()
+    try:
+        # Create SQLAlchemy engine
+        engine = create_engine(sql_conn_str)
 
-    # Check if data is loaded
-    if detailed_log_df.empty or forecast_results_df.empty:
-        print("No data loaded. Exiting process.")
-        return
+        # Generate the report in every configured format, reading each section from SQL as it is written
+        with metrics.stage("report.generate"):
+            generate_report(ReportDataAccess(engine))
 
-    # Generate text report
-    generate_text_report(detailed_log_df, forecast_results_df)
+    except Exception as e:
+        print(f"An error occurred while generating the report: {e}")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        metrics.export("report")
@@ -0,0 +1,99 @@
+"""
+bench_log_parser.py
+
+Description:
+This script is a micro-benchmark for the line parser of 2logIngestion_v9_SysMessageintegration.py.
+It generates a synthetic SQL Server ERRORLOG in memory and compares the per-line path
+(filter_log_lines + process_log_line) with the single-pass block parser (iter_line_blocks + parse_log_block).
+
+Key Features:
+- Configurable synthetic log size and share of error lines.
+- Checks that both paths extract identical entries before reporting timings.
+- Reports lines/s for each path and the speed-up.
+
+Requirements:
+- Python 3.8+
+- The dependencies of 2logIngestion_v9_SysMessageintegration.py (the script is imported, not run).
+
+Usage:
+Run the script to benchmark the ingestion parser.
+    python bench_log_parser.py
+"""
+
+import os
+import time
+import random
+import importlib.util
+from datetime import datetime, timedelta
+
+# Adjustable parameters
+TOTAL_LINES = 500000
+ERROR_LINE_RATIO = 0.3  # Share of lines carrying "Error: N, Severity: N"
+CHUNK_CHARS = 4 * 1024 * 1024  # Text chunk size fed to the block parser, like a decoded download chunk
+
+# Function to load the ingestion script as a module (its file name is not a valid identifier)
+def load_ingestion_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2logIngestion_v9_SysMessageintegration.py")
+    spec = importlib.util.spec_from_file_location("log_ingestion", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Function to generate a synthetic ERRORLOG as a single string
+def generate_errorlog(total_lines, error_line_ratio, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    lines = []
+    for i in range(total_lines):
+        timestamp = (start + timedelta(milliseconds=i * 37)).strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
+        if rng.random() < error_line_ratio:
+            error_code = rng.choice([18456, 17806, 833, 1205, 9002])
+            severity = rng.choice([14, 16, 20])
+            lines.append(f"{timestamp} spid{rng.randint(50, 400)}    Error: {error_code}, Severity: {severity}, State: {rng.randint(1, 58)}.")
+        else:
+            lines.append(f"{timestamp} Logon       Login succeeded for user 'app_user_{rng.randint(1, 500)}'. [CLIENT: 10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}]")
+    return "\r\n".join(lines) + "\r\n"
+
+# Function to run the per-line path over the whole log
+def parse_per_line(ingestion, log_content):
+    log_entries = []
+    for line in ingestion.filter_log_lines(log_content.splitlines()):
+        log_entry = ingestion.process_log_line(1, line)
+        if log_entry:
+            log_entries.append(log_entry)
+    return log_entries
+
+# Function to run the block path over the log cut into download-sized chunks
+def parse_blocks(ingestion, log_content):
+    text_chunks = (log_content[i:i + CHUNK_CHARS] for i in range(0, len(log_content), CHUNK_CHARS))
+    log_entries = []
+    for block in ingestion.iter_line_blocks(text_chunks):
+        log_entries.extend(ingestion.parse_log_block(1, block))
+    return log_entries
+
+# Function to time a parser and return its entries and elapsed seconds
+def time_parser(parser, ingestion, log_content):
+    start = time.perf_counter()
+    log_entries = parser(ingestion, log_content)
+    return log_entries, time.perf_counter() - start
+
+# Main function
+def main():
+    ingestion = load_ingestion_module()
+    log_content = generate_errorlog(TOTAL_LINES, ERROR_LINE_RATIO)
+    print(f"Synthetic ERRORLOG: {TOTAL_LINES} lines, {len(log_content) / (1024 * 1024):.1f} MB of text")
+
+    before_entries, before_seconds = time_parser(parse_per_line, ingestion, log_content)
+    after_entries, after_seconds = time_parser(parse_blocks, ingestion, log_content)
+
+    if before_entries != after_entries:
+        print(f"Mismatch: per-line parser found {len(before_entries)} entries, block parser found {len(after_entries)}")
+        return
+
+    print(f"Error entries extracted: {len(after_entries)}")
+    print(f"Per-line parser (before): {TOTAL_LINES / before_seconds:,.0f} lines/s ({before_seconds:.2f}s)")
+    print(f"Block parser (after):     {TOTAL_LINES / after_seconds:,.0f} lines/s ({after_seconds:.2f}s)")
+    print(f"Speed-up: {before_seconds / after_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
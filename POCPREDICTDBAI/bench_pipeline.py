@@ -0,0 +1,650 @@
+"""
+bench_pipeline.py
+
+Description:
+This script is an offline end-to-end benchmark of the four pipeline scripts. It generates synthetic SQL Server
+ERRORLOG and SQLAGENT.OUT files, then runs each stage against local stand-ins: a filesystem-backed blob store
+in place of Azure Blob Storage and a SQLite database in place of SQL Server. No Azure account or database server is needed.
+
+Key Features:
+- Synthetic log generator with configurable file size, encoding, error mix, repetition rate and server count.
+- Filesystem blob stand-in covering the calls the collector and ingestion make (block, append and ranged reads).
+- SQLite stand-in: ingestion uses its SQLite sink, and the T-SQL of the parsing writers and the report
+  (temp tables, MERGE, TOP) is rewritten to SQLite on the fly.
+- Per-stage benchmarks: upload_files_in_parallel, process_blob (read_blob_logs), classification and template
+  mining (parse_log_message's column-wise path), feature_engineering, detect_anomalies, Prophet fitting
+  (forecast_all_series), save_to_database, save_forecast_to_database and generate_report.
+- Each stage runs in its own process, so peak RSS is measured per stage; results are reported as rows/s,
+  MB/s and peak RSS and stored as JSON, optionally compared with an earlier result file.
+
+Requirements:
+- Python 3.8+
+- The dependencies of the four scripts (the scripts are imported, not run).
+
+Usage:
+Run the script to benchmark every stage; pass an earlier result file to compare against it.
+    python bench_pipeline.py
+    python bench_pipeline.py --compare bench_results/<earlier run>.json
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import uuid
+import codecs
+import random
+import shutil
+import sqlite3
+import platform
+import tempfile
+import argparse
+import subprocess
+import importlib.util
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, event
+from sklearn.metrics import adjusted_rand_score
+import pipeline_metrics as metrics
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows; peak RSS is then not reported
+
+# Adjustable parameters
+bench_servers = 4  # Servers generating logs; each gets a live and an archived ERRORLOG and SQLAGENT.OUT
+bench_log_file_mb = 8  # Size of each generated log file after encoding
+bench_log_days = 30  # Days of history covered by each file, ending now
+bench_encodings = ["utf-16", "utf-8", "cp1252"]  # Cycled over servers; SQL Server writes ERRORLOG as UTF-16 with a BOM
+bench_error_ratio = 0.2  # Share of ERRORLOG events that are errors (an "Error: N, Severity: N" line and its message line)
+bench_repetition_rate = 0.5  # Share of events repeating one of the last few events verbatim apart from the timestamp
+bench_seed = 42
+bench_stages = ["collect", "ingest", "parse", "forecast", "save", "report"]
+bench_results_dir = "bench_results"
+bench_regression_threshold = 0.1  # Rows/s drop against the baseline reported as a regression
+bench_keep_workdir = False  # Keep the generated logs, blob store and database after the run
+bench_cluster_agreement_max_groups = 20000  # Largest template group count compared against the uncapped DBSCAN graph
+
+# Log files per server: (file suffix, log file type); files ending in ERRORLOG / SQLAGENT.OUT are live (append blobs)
+bench_log_files = [("ERRORLOG", "errorlog"), ("ERRORLOG.1", "errorlog"), ("SQLAGENT.OUT", "sqlagent"), ("SQLAGENT.1", "sqlagent")]
+
+# Error mix: error code -> (severity, weight, sys.messages text, message line written to the ERRORLOG)
+error_catalog = {
+    18456: (14, 50, "Login failed for user '%.*ls'.%.*ls%.*ls",
+            "Logon       Login failed for user '{user}'. Reason: Password did not match that for the login provided. [CLIENT: {ip}]"),
+    17806: (20, 10, "SSPI handshake failed with error code 0x%x, state %d while establishing a connection with integrated security; the connection has been closed. Reason: %.*ls %.*ls [CLIENT: %.*hs]",
+            "Logon       SSPI handshake failed with error code 0x8009030c, state 14 while establishing a connection with integrated security; the connection has been closed. [CLIENT: {ip}]"),
+    1205: (13, 15, "Transaction (Process ID %d) was deadlocked on %.*ls resources with another process and has been chosen as the deadlock victim. Rerun the transaction.",
+           "spid{spid}      Transaction (Process ID {spid}) was deadlocked on lock resources with another process and has been chosen as the deadlock victim. Rerun the transaction."),
+    9002: (17, 10, "The transaction log for database '%.*ls' is full due to '%ls'.",
+           "spid{spid}      The transaction log for database '{db}' is full due to 'LOG_BACKUP'."),
+    833: (10, 10, "SQL Server has encountered %d occurrence(s) of I/O requests taking longer than %d seconds to complete on file [%ls] in database [%ls] (%d).",
+          "spid{spid}      SQL Server has encountered {count} occurrence(s) of I/O requests taking longer than 15 seconds to complete on file [D:\\Data\\{db}.mdf] in database [{db}] ({dbid})."),
+    17883: (16, 5, "Process %ld:%ld:%ld (0x%lx) Worker 0x%p appears to be non-yielding on Scheduler %ld. Thread creation time: %I64d. Approx Thread CPU Used: kernel %I64d ms, user %I64d ms. Process Utilization %d%%. System Idle %d%%. Interval: %I64d ms. Resource timeout.",
+            "Server      Process 0:0:0 (0x1a2c) Worker 0x0000023A5E4C0160 appears to be non-yielding on Scheduler {dbid}. Resource timeout."),
+}
+
+# Informational ERRORLOG and SQLAGENT.OUT lines (without the timestamp)
+errorlog_info_lines = [
+    "Logon       Login succeeded for user '{user}'. Connection made using SQL Server authentication. [CLIENT: {ip}]",
+    "spid{spid}      Starting up database '{db}'.",
+    "Backup      Log was backed up. Database: {db}, creation date(time): 2023/01/01(00:00:00), pages dumped: {count}, first LSN: 1:2:3, last LSN: 4:5:6, number of dump devices: 1.",
+    "spid{spid}      CHECKDB for database '{db}' finished without errors. This is an informational message only; no user action is required.",
+]
+sqlagent_info_lines = [
+    "+ [396] An idle CPU condition has not been defined - OnIdle job schedules will have no effect",
+    "? [129] SQLSERVERAGENT starting under Windows NT service control",
+    "! [298] SQLServer Error: {code}, Login failed for user '{user}'. [SQLSTATE 28000]",
+    "! [382] Logon to server '{server}' failed (ConnAttemptCachableOp)",
+]
+
+# Function to load a pipeline script as a module (its file name is not a valid identifier); it is registered
+# in sys.modules so the process pools of the script can pickle its functions
+def load_script_module(module_name, file_name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Function to fill the placeholders of a line template with random values
+def fill_line(template, rng, server):
+    return template.format(user=f"app_user_{rng.randint(1, 50)}", ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                           spid=rng.randint(50, 400), db=f"db{rng.randint(1, 20)}", dbid=rng.randint(5, 40),
+                           count=rng.randint(1, 5000), code=rng.choice(list(error_catalog)), server=server)
+
+# Function to produce the next event of a log: one or more lines without timestamps
+def next_event(log_type, rng, server, error_codes, error_weights):
+    if log_type == "sqlagent":
+        return [fill_line(rng.choice(sqlagent_info_lines), rng, server)]
+    if rng.random() < bench_error_ratio:
+        code = rng.choices(error_codes, error_weights)[0]
+        severity = error_catalog[code][0]
+        return [f"spid{rng.randint(50, 400)}      Error: {code}, Severity: {severity}, State: {rng.randint(1, 58)}.",
+                fill_line(error_catalog[code][3], rng, server)]
+    return [fill_line(rng.choice(errorlog_info_lines), rng, server)]
+
+# Function to format a line timestamp: ERRORLOG timestamps carry centiseconds, SQLAGENT.OUT timestamps whole seconds
+def format_log_timestamp(timestamp, log_type):
+    if log_type == "errorlog":
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-4] + " "
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S - ")
+
+# Function to write one synthetic log file of about bench_log_file_mb in the given encoding;
+# returns the number of lines and bytes written
+def generate_log_file(path, server, log_type, encoding, rng):
+    target_bytes = int(bench_log_file_mb * 1024 * 1024)
+    char_width = 2 if encoding.startswith("utf-16") else 1
+    line_step = timedelta(seconds=bench_log_days * 86400 / max(target_bytes / (100 * char_width), 1))
+    timestamp = datetime.now().replace(microsecond=0) - timedelta(days=bench_log_days)
+    error_codes = list(error_catalog)
+    error_weights = [error_catalog[code][1] for code in error_codes]
+    encoder = codecs.getincrementalencoder(encoding)()
+    recent_events = deque(maxlen=8)
+
+    if log_type == "errorlog":
+        lines = ["Server      Microsoft SQL Server 2019 (RTM-CU18) (KB5017593) - 15.0.4261.1 (X64)",
+                 f"Server      Server process ID is {rng.randint(1000, 9000)}.", "Server      Authentication mode is MIXED."]
+    else:
+        lines = ["? [100] Microsoft SQLServerAgent version 15.0.4261.1 (X64 unicode retail build) : Process ID 4242"]
+    written_lines = 0
+    written_bytes = 0
+    with open(path, "wb") as file:
+        while written_bytes < target_bytes:
+            batch = []
+            for line in lines:
+                batch.append(format_log_timestamp(timestamp, log_type) + line)
+                timestamp += line_step
+            for _ in range(1000):
+                if recent_events and rng.random() < bench_repetition_rate:
+                    event_lines = rng.choice(recent_events)
+                else:
+                    event_lines = next_event(log_type, rng, server, error_codes, error_weights)
+                    recent_events.append(event_lines)
+                for line in event_lines:
+                    batch.append(format_log_timestamp(timestamp, log_type) + line)
+                    timestamp += line_step
+            lines = []
+            data = encoder.encode("\r\n".join(batch) + "\r\n")
+            file.write(data)
+            written_lines += len(batch)
+            written_bytes += len(data)
+    return written_lines, written_bytes
+
+# Function to generate every server's log files in logs_dir; returns their descriptions
+def generate_logs(logs_dir):
+    rng = random.Random(bench_seed)
+    os.makedirs(logs_dir, exist_ok=True)
+    files = []
+    for server_index in range(bench_servers):
+        server = f"SQLSRV{server_index + 1:03d}"
+        encoding = bench_encodings[server_index % len(bench_encodings)]
+        for suffix, log_type in bench_log_files:
+            path = os.path.join(logs_dir, f"{server}_{suffix}")
+            lines, size = generate_log_file(path, server, log_type, encoding, rng)
+            files.append({'path': path, 'server': server, 'log_type': log_type, 'encoding': encoding, 'lines': lines, 'bytes': size})
+    return files
+
+# Filesystem-backed stand-in for BlobServiceClient: containers are directories under root, blob properties
+# (etag, type, metadata) are kept in JSON files next to them. from_connection_string takes the root directory.
+class LocalBlobServiceClient:
+    def __init__(self, root, chunk_size=4 * 1024 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_connection_string(cls, conn_str, max_chunk_get_size=4 * 1024 * 1024, **kwargs):
+        return cls(conn_str, max_chunk_get_size)
+
+    def get_container_client(self, container):
+        return LocalContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return LocalBlobClient(self, container, blob)
+
+class LocalContainerClient:
+    def __init__(self, service, container):
+        self.service = service
+        self.container = container
+
+    def list_blobs(self, include=None):
+        container_dir = os.path.join(self.service.root, self.container)
+        if not os.path.isdir(container_dir):
+            return []
+        blobs = []
+        for name in sorted(os.listdir(container_dir)):
+            blob_client = self.service.get_blob_client(self.container, name)
+            if os.path.isfile(blob_client.path):
+                blobs.append(blob_client.get_blob_properties())
+        return blobs
+
+class LocalBlobClient:
+    def __init__(self, service, container, blob):
+        self.service = service
+        self.path = os.path.join(service.root, container, blob)
+        self.properties_path = os.path.join(service.root, ".properties", container, blob + ".json")
+        self.blocks_dir = os.path.join(service.root, ".blocks", container, blob)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.properties_path), exist_ok=True)
+
+    def write_properties(self, blob_type, metadata=None):
+        properties = {'etag': f'"{uuid.uuid4().hex}"', 'blob_type': blob_type, 'metadata': metadata or {},
+                      'creation_time': datetime.now().isoformat()}
+        with open(self.properties_path, "w") as file:
+            json.dump(properties, file)
+        return {'etag': properties['etag']}
+
+    def read_properties(self):
+        with open(self.properties_path, "r") as file:
+            return json.load(file)
+
+    def get_blob_properties(self):
+        properties = self.read_properties()
+        return SimpleNamespace(name=os.path.basename(self.path), size=os.path.getsize(self.path), etag=properties['etag'],
+                               blob_type=properties['blob_type'], metadata=properties['metadata'],
+                               creation_time=datetime.fromisoformat(properties['creation_time']))
+
+    def upload_blob(self, data, overwrite=True, content_settings=None, metadata=None):
+        with open(self.path, "wb") as file:
+            file.write(data)
+        return self.write_properties("BlockBlob", metadata)
+
+    def stage_block(self, block_id, data):
+        os.makedirs(self.blocks_dir, exist_ok=True)
+        with open(os.path.join(self.blocks_dir, block_id.replace("/", "_")), "wb") as file:
+            file.write(data)
+
+    def commit_block_list(self, block_list, content_settings=None, metadata=None):
+        with open(self.path, "wb") as file:
+            for block in block_list:
+                with open(os.path.join(self.blocks_dir, block.id.replace("/", "_")), "rb") as block_file:
+                    shutil.copyfileobj(block_file, file)
+        shutil.rmtree(self.blocks_dir)
+        return self.write_properties("BlockBlob", metadata)
+
+    def create_append_blob(self, content_settings=None):
+        open(self.path, "wb").close()
+        return self.write_properties("AppendBlob")
+
+    def append_block(self, data, etag=None, match_condition=None):
+        properties = self.read_properties()
+        if etag is not None and etag != properties['etag']:
+            from azure.core.exceptions import ResourceModifiedError
+            raise ResourceModifiedError("The condition specified using HTTP conditional header(s) is not met.")
+        with open(self.path, "ab") as file:
+            file.write(data)
+        properties['etag'] = f'"{uuid.uuid4().hex}"'
+        with open(self.properties_path, "w") as file:
+            json.dump(properties, file)
+        return {'etag': properties['etag']}
+
+    def download_blob(self, offset=None):
+        return LocalDownloadStream(self.path, offset or 0, self.service.chunk_size)
+
+class LocalDownloadStream:
+    def __init__(self, path, offset, chunk_size):
+        self.path = path
+        self.offset = offset
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+# T-SQL statements of the parsing writers and the report rewritten for SQLite, applied in order
+tsql_rewrites = [
+    (r"IF OBJECT_ID\('tempdb\.\.#(\w+)'\) IS NOT NULL DROP TABLE #\w+", r"DROP TABLE IF EXISTS temp.\1"),
+    (r"SELECT TOP 0 (.*?) INTO #(\w+) FROM (\w+)", r"CREATE TEMP TABLE \2 AS SELECT \1 FROM \3 WHERE 0"),
+    (r"^\s*SELECT (.*?)\s+INTO #(\w+)\s+FROM", r"CREATE TEMP TABLE \2 AS SELECT \1 FROM"),
+    (r"(?i)NVARCHAR\(MAX\)", "TEXT"),
+    (r"CREATE CLUSTERED INDEX", "CREATE INDEX"),
+    # Stand-in for the report procedure: processed rows with the server of their log file
+    (r"EXEC GetEndUserLogReport", "SELECT d.ServerName, p.LogDate, p.IssueType, p.ParsedMessage "
+                                  "FROM LogMessages_Processed p JOIN LogDetails d ON d.LogID = p.LogID"),
+    (r"^\s*IF (NOT EXISTS|OBJECT_ID|COL_LENGTH)\b.*", "SELECT 1"),  # Schema upkeep; the stand-in schema is created up front
+    (r"DELETE s FROM #(\w+) s\s+WHERE", r"DELETE FROM \1 AS s WHERE"),
+    (r"TRUNCATE TABLE", "DELETE FROM"),
+    (r"CREATE TABLE #", "CREATE TEMP TABLE "),
+    (r"#(\w+)", r"\1"),
+]
+
+# Result set of the report procedure stand-in, as sys.dm_exec_describe_first_result_set describes it
+sqlite_report_log_description = """
+SELECT 'ServerName' AS name, 'nvarchar(128)' AS system_type_name, NULL AS error_message
+UNION ALL SELECT 'LogDate', 'datetime2(3)', NULL
+UNION ALL SELECT 'IssueType', 'nvarchar(255)', NULL
+UNION ALL SELECT 'ParsedMessage', 'nvarchar(max)', NULL
+"""
+
+# MERGE statements replaced by SQLite upserts, by target table
+sqlite_upserts = {
+    'ForecastResults': """
+    INSERT INTO ForecastResults (SeriesKey, ds, yhat, yhat_lower, yhat_upper, trend, seasonality, RunID)
+    SELECT SeriesKey, ds, yhat, yhat_lower, yhat_upper, trend, seasonality, RunID FROM ForecastStaging WHERE true
+    ON CONFLICT (SeriesKey, ds) DO UPDATE SET yhat = excluded.yhat, yhat_lower = excluded.yhat_lower,
+        yhat_upper = excluded.yhat_upper, trend = excluded.trend, seasonality = excluded.seasonality, RunID = excluded.RunID
+    """,
+    'rollup': """
+    INSERT INTO {table} (ServerName, IssueType, BucketDate, IssueCount, FirstSeen, LastSeen)
+    SELECT d.ServerName, s.IssueType, date(s.LogDate), COUNT(*), MIN(s.LogDate), MAX(s.LogDate)
+    FROM ProcessedStaging s JOIN LogDetails d ON d.LogID = s.LogID
+    WHERE d.ServerName IS NOT NULL AND s.IssueType IS NOT NULL
+    GROUP BY d.ServerName, s.IssueType, date(s.LogDate)
+    ON CONFLICT (ServerName, IssueType, BucketDate) DO UPDATE SET IssueCount = IssueCount + excluded.IssueCount,
+        FirstSeen = min(FirstSeen, excluded.FirstSeen), LastSeen = max(LastSeen, excluded.LastSeen)
+    """,
+}
+
+# Function to rewrite one T-SQL statement and its positional parameters for SQLite
+def rewrite_for_sqlite(statement, parameters):
+    merge = re.match(r"\s*MERGE (\w+)", statement)
+    if merge:
+        target = merge.group(1)
+        return (sqlite_upserts['ForecastResults'] if target == 'ForecastResults' else sqlite_upserts['rollup'].format(table=target)), parameters
+    if "sys.dm_exec_describe_first_result_set" in statement:
+        return sqlite_report_log_description, ()
+    for pattern, replacement in tsql_rewrites:
+        statement = re.sub(pattern, replacement, statement, flags=re.S)
+    # TOP (?) is always the first parameter of the report's queries; SQLite takes it as a trailing LIMIT
+    if re.search(r"SELECT TOP \(\?\)", statement):
+        statement = re.sub(r"SELECT TOP \(\?\)", "SELECT", statement, count=1) + " LIMIT ?"
+        parameters = tuple(parameters[1:]) + (parameters[0],)
+    return statement, parameters
+
+# Function to create the SQLite stand-in engine with the T-SQL rewriting hook and the tables the writers expect
+def create_sqlite_engine(db_path, rollup_table):
+    sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat(sep=' '))
+    sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+    sqlite3.register_adapter(date, lambda value: value.isoformat())
+    for numpy_type, python_type in [(np.int64, int), (np.int32, int), (np.int16, int), (np.int8, int), (np.float64, float), (np.float32, float)]:
+        sqlite3.register_adapter(numpy_type, python_type)
+    engine = create_engine(f"sqlite:///{db_path}")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def rewrite_statement(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return rewrite_for_sqlite(statement, ())[0], parameters
+        return rewrite_for_sqlite(statement, tuple(parameters or ()))
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS LogMessages_Processed (
+            LogID INTEGER, LogDate TEXT, LogMessageType TEXT, LogMessage TEXT, LogTemplate TEXT,
+            ParsedMessage TEXT, AnomalyScore INTEGER, Cluster INTEGER, IssueType TEXT
+        )""")
+        conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {rollup_table} (
+            ServerName TEXT NOT NULL, IssueType TEXT NOT NULL, BucketDate TEXT NOT NULL, IssueCount INTEGER NOT NULL,
+            FirstSeen TEXT NOT NULL, LastSeen TEXT NOT NULL, PRIMARY KEY (ServerName, IssueType, BucketDate)
+        )""")
+        conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS ForecastResults (
+            SeriesKey TEXT NOT NULL, ds TEXT NOT NULL, yhat REAL, yhat_lower REAL, yhat_upper REAL, trend REAL,
+            seasonality REAL NOT NULL, RunID TEXT, PRIMARY KEY (SeriesKey, ds)
+        )""")
+    return engine
+
+# Function to read the peak resident set size of this process and its finished children in MB
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # Bytes on macOS, KB elsewhere
+
+# Function to time a call; returns its result and elapsed seconds
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# Function to build one benchmark result
+def bench_result(name, seconds, rows, size_bytes, **extra):
+    return dict({'name': name, 'seconds': round(seconds, 3), 'rows': int(rows), 'mb': round(size_bytes / (1024 * 1024), 2),
+                 'rows_per_s': round(rows / seconds, 1) if seconds else None,
+                 'mb_per_s': round(size_bytes / (1024 * 1024) / seconds, 2) if seconds else None}, **extra)
+
+# Function to benchmark the collector uploading the generated logs to the blob stand-in
+def bench_collect(workdir, generated):
+    collector = load_script_module("log_collector", "1LogCollector_v1.py")
+    collector.blob_service_client = LocalBlobServiceClient(os.path.join(workdir, "blobs"))
+    collector.container_name = "logs"
+    file_paths = [file['path'] for file in generated]
+    _, seconds = timed(collector.upload_files_in_parallel, file_paths, {})
+    return [bench_result("upload_files_in_parallel", seconds, sum(file['lines'] for file in generated),
+                         sum(file['bytes'] for file in generated), files=len(file_paths))]
+
+# Function to benchmark ingestion of every blob (process_blob through read_blob_logs) into the SQLite sink
+def bench_ingest(workdir, generated):
+    ingestion = load_script_module("log_ingestion", "2logIngestion_v9_SysMessageintegration.py")
+    ingestion.BlobServiceClient = LocalBlobServiceClient
+    ingestion.azure_storage_connection_string = os.path.join(workdir, "blobs")
+    ingestion.CHECKPOINT_PATH = os.path.join(workdir, "ingestion_checkpoints.json")
+    db_path = os.path.join(workdir, "standin.db")
+    ingestion.log_sink = ingestion.SQLiteSink(db_path)
+    _, seconds = timed(ingestion.read_blob_logs)
+    ingestion.log_sink.finalize()
+    with sqlite3.connect(db_path) as connection:
+        entries = connection.execute("SELECT COUNT(*) FROM LogMessages").fetchone()[0]
+    return [bench_result("process_blob", seconds, sum(file['lines'] for file in generated),
+                         sum(file['bytes'] for file in generated), entries_written=entries,
+                         encoding_paths=dict(ingestion.encoding_detection_stats))]
+
+# Function to read the ingested rows in the shape of GetErrorLogsWithDetails; LogMessage comes from the
+# error catalog, standing in for sys.messages
+def load_ingested_rows(workdir):
+    with sqlite3.connect(os.path.join(workdir, "standin.db")) as connection:
+        rows_df = pd.read_sql("""
+        SELECT m.LogID, d.ServerName, m.LogDate, m.LogMessageType, m.ErrorCode, m.Severity
+        FROM LogMessages m JOIN LogDetails d ON d.LogID = m.LogID
+        ORDER BY m.LogID, m.LogDate
+        """, connection)
+    # The SQLite sink stores ISO text, without the fraction when it is zero
+    rows_df['LogDate'] = pd.to_datetime(rows_df['LogDate'], format='ISO8601')
+    rows_df['LogMessage'] = rows_df['ErrorCode'].map({code: entry[2] for code, entry in error_catalog.items()})
+    return rows_df
+
+# Function to measure what the neighbour cap does to the clusters: adjusted Rand index of the DBSCAN labels on the
+# capped graph against the full radius graph, for the same features and weights (1.0 means identical clusterings)
+def cluster_label_agreement(parsing, features, sample_weight):
+    if features.shape[0] > bench_cluster_agreement_max_groups:
+        return None
+    labels = []
+    for max_neighbors in (parsing.dbscan_max_neighbors, None):
+        graph = parsing.build_radius_neighbors_graph(features, parsing.dbscan_eps, max_neighbors)
+        clustering = parsing.DBSCAN(eps=parsing.dbscan_eps, min_samples=parsing.dbscan_min_samples, metric='precomputed')
+        labels.append(clustering.fit(graph, sample_weight=sample_weight).labels_)
+    return round(adjusted_rand_score(labels[1], labels[0]), 4)
+
+# Function to benchmark classification and template mining, feature engineering and DBSCAN on the ingested rows;
+# the processed rows and the issue history aggregated while loading are kept for the later stages
+def bench_parse(workdir, generated):
+    parsing = load_script_module("log_parsing", "3LogParsing_AD_CC_PM_v3.py")
+    parsing.artifact_cache.enabled = False
+    rows_df = load_ingested_rows(workdir)
+    chunks = [rows_df.iloc[start:start + parsing.load_chunk_size] for start in range(0, len(rows_df), parsing.load_chunk_size)]
+    input_bytes = rows_df.memory_usage(deep=True).sum()
+    del rows_df
+
+    template_miner = parsing.TemplateMiner()
+    log_chunks, parse_seconds = timed(parsing.load_classified_log_messages, template_miner, log_message_chunks=chunks)
+    try:
+        group_df = log_chunks.template_groups(template_miner)
+        cluster_model = {}
+        features, feature_seconds = timed(parsing.feature_engineering, group_df, 'MinedTemplate', cluster_model)
+        group_df, cluster_seconds = timed(parsing.detect_anomalies, group_df, features, group_df['Count'].to_numpy(),
+                                          cluster_model=cluster_model, refit=True)
+        processed_df = parsing.concat_log_chunks(list(log_chunks.processed_chunks(group_df, template_miner)))
+        processed_df.to_pickle(os.path.join(workdir, "processed.pkl"))
+        log_chunks.issue_history().to_pickle(os.path.join(workdir, "history.pkl"))
+    finally:
+        log_chunks.cleanup()
+    label_agreement = cluster_label_agreement(parsing, features, group_df['Count'].to_numpy())
+
+    rows = log_chunks.rows
+    return [bench_result("parse_log_message", parse_seconds, rows, input_bytes, templates=len(template_miner.templates)),
+            bench_result("feature_engineering", feature_seconds, rows, input_bytes, groups=len(group_df)),
+            bench_result("detect_anomalies", cluster_seconds, rows, input_bytes, groups=len(group_df),
+                         label_agreement=label_agreement)]
+
+# Function to benchmark Prophet fitting of the global and per-(ServerName, IssueType) series, from the issue
+# history a full refit aggregates while loading
+def bench_forecast(workdir, generated):
+    parsing = load_script_module("log_parsing", "3LogParsing_AD_CC_PM_v3.py")
+    parsing.artifact_cache.enabled = False
+    history_df = pd.read_pickle(os.path.join(workdir, "history.pkl"))
+    prophet_data = parsing.prepare_data_for_prophet(history_df)
+    series_data = {parsing.default_forecast_series: prophet_data}
+    series_data.update(parsing.prepare_series_for_prophet(history_df, prophet_data['ds']))
+    forecast, seconds = timed(parsing.forecast_all_series, series_data)
+    pd.to_pickle({'forecast': forecast, 'history_end': prophet_data['ds'].max()}, os.path.join(workdir, "forecast.pkl"))
+    buckets = sum(len(data) for data in series_data.values())
+    return [bench_result("forecast_all_series", seconds, buckets, sum(data.memory_usage(deep=True).sum() for data in series_data.values()),
+                         series=len(series_data), forecast_rows=len(forecast))]
+
+# Function to benchmark the parsing writers against the SQLite stand-in
+def bench_save(workdir, generated):
+    parsing = load_script_module("log_parsing", "3LogParsing_AD_CC_PM_v3.py")
+    parsing.sql_engine = create_sqlite_engine(os.path.join(workdir, "standin.db"), parsing.issue_rollup_table)
+    log_messages_df = pd.read_pickle(os.path.join(workdir, "processed.pkl"))
+    saved = pd.read_pickle(os.path.join(workdir, "forecast.pkl"))
+
+    _, save_seconds = timed(parsing.save_to_database, log_messages_df, 'LogMessages_Processed', rollup_table=parsing.issue_rollup_table)
+    _, forecast_seconds = timed(parsing.save_forecast_to_database, saved['forecast'], history_end=saved['history_end'])
+    return [bench_result("save_to_database", save_seconds, len(log_messages_df), log_messages_df.memory_usage(deep=True).sum()),
+            bench_result("save_forecast_to_database", forecast_seconds, len(saved['forecast']), saved['forecast'].memory_usage(deep=True).sum())]
+
+# Function to benchmark report generation in every configured format from the SQLite stand-in
+def bench_report(workdir, generated):
+    report = load_script_module("log_report", "4generatereport_v2.py")
+    engine = create_sqlite_engine(os.path.join(workdir, "standin.db"), report.issue_rollup_table)
+    report.report_basename = os.path.join(workdir, report.report_basename)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT COUNT(*) FROM LogMessages_Processed").scalar()
+        rows += conn.exec_driver_sql(f"SELECT COUNT(*) FROM {report.issue_rollup_table}").scalar()
+    _, seconds = timed(report.generate_report, report.ReportDataAccess(engine))
+    output_bytes = sum(os.path.getsize(path) for path in glob.glob(report.report_basename + "*"))
+    return [bench_result("generate_report", seconds, rows, output_bytes, formats=list(report.report_formats))]
+
+stage_benchmarks = {
+    'collect': bench_collect, 'ingest': bench_ingest, 'parse': bench_parse,
+    'forecast': bench_forecast, 'save': bench_save, 'report': bench_report,
+}
+
+# Function run in the stage's own process: benchmark one stage and write its results next to the stage data
+def run_stage(stage, workdir):
+    # The scripts' own timers and counters for the stage go to the results directory, which outlives the work
+    # directory; it is resolved before the chdir, relative to where the benchmark was started
+    metrics.metrics_dir = os.path.abspath(bench_results_dir)
+    os.chdir(workdir)  # Checkpoints, manifests, templates, caches and logs of the scripts land in the work directory
+    try:
+        with open(os.path.join(workdir, "generated.json"), "r") as file:
+            generated = json.load(file)
+        results = stage_benchmarks[stage](workdir, generated)
+        for result in results:
+            result['peak_rss_mb'] = peak_rss_mb()
+        with open(os.path.join(workdir, f"result_{stage}.json"), "w") as file:
+            json.dump(results, file, indent=2, default=str)
+    finally:
+        metrics.export(f"bench_{stage}")
+
+# Function to run a stage in a child process, its output going to a log file in the work directory
+def run_stage_process(stage, workdir):
+    log_path = os.path.join(workdir, f"{stage}.log")
+    with open(log_path, "w") as log_file:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--stage", stage, workdir],
+                                   stdout=log_file, stderr=subprocess.STDOUT)
+    result_path = os.path.join(workdir, f"result_{stage}.json")
+    if completed.returncode != 0 or not os.path.exists(result_path):
+        with open(log_path, "r", errors="replace") as log_file:
+            tail = log_file.read()[-2000:]
+        print(f"Stage {stage} failed (exit code {completed.returncode}):\n{tail}")
+        return [{'name': stage, 'error': f"exit code {completed.returncode}"}]
+    with open(result_path, "r") as file:
+        return json.load(file)
+
+# Function to get the current git commit of the scripts, when they are in a git checkout
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# Function to print the results as a table, with the rows/s ratio against a baseline when given
+def print_results(results, baseline=None):
+    baseline_results = {result['name']: result for result in (baseline or {}).get('results', [])}
+    print(f"{'Benchmark':<28}{'rows/s':>14}{'MB/s':>10}{'peak RSS MB':>13}{'seconds':>10}" + (f"{'vs baseline':>14}" if baseline else ""))
+    for result in results:
+        if 'error' in result:
+            print(f"{result['name']:<28}{'failed: ' + result['error']:>47}")
+            continue
+        line = (f"{result['name']:<28}{result['rows_per_s'] or 0:>14,.0f}{result['mb_per_s'] or 0:>10.2f}"
+                f"{result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '-':>13}{result['seconds']:>10.2f}")
+        previous = baseline_results.get(result['name'])
+        if previous and previous.get('rows_per_s') and result['rows_per_s']:
+            ratio = result['rows_per_s'] / previous['rows_per_s']
+            line += f"{ratio:>13.2f}x" + ("  REGRESSION" if ratio < 1 - bench_regression_threshold else "")
+        print(line)
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the log pipeline stages.")
+    parser.add_argument("--compare", help="earlier result file to compare rows/s against")
+    parser.add_argument("--stage", nargs=2, metavar=("STAGE", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.stage:
+        run_stage(*args.stage)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        generated, seconds = timed(generate_logs, os.path.join(workdir, "logs"))
+        with open(os.path.join(workdir, "generated.json"), "w") as file:
+            json.dump(generated, file)
+        total_mb = sum(file['bytes'] for file in generated) / (1024 * 1024)
+        print(f"Generated {len(generated)} log files, {sum(file['lines'] for file in generated):,} lines, {total_mb:.1f} MB in {seconds:.1f}s")
+
+        results = []
+        for stage in bench_stages:
+            print(f"Running stage {stage}...")
+            results.extend(run_stage_process(stage, workdir))
+    finally:
+        if bench_keep_workdir:
+            print(f"Work directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    run = {
+        'commit': current_commit(), 'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        'config': {'servers': bench_servers, 'log_file_mb': bench_log_file_mb, 'log_days': bench_log_days,
+                   'encodings': bench_encodings, 'error_ratio': bench_error_ratio,
+                   'repetition_rate': bench_repetition_rate, 'seed': bench_seed},
+        'results': results,
+    }
+    os.makedirs(bench_results_dir, exist_ok=True)
+    result_path = os.path.join(bench_results_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{run['commit'] or 'nocommit'}.json")
+    with open(result_path, "w") as file:
+        json.dump(run, file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    print(f"Results saved to {result_path}")
+
+if __name__ == "__main__":
+    main()
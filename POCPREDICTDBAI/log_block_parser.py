@@ -0,0 +1,62 @@
+"""
+log_block_parser.py
+
+Description:
+This module holds the single-pass block parser of the ingestion script. It is kept apart from the script,
+with no setup at import time, because the ingestion parse pool runs it in worker processes: with the spawn
+or forkserver start methods each worker imports the module that defines the function it runs.
+
+Key Features:
+- One precompiled regex finds the "Error: N, Severity: N" pairs of a block of complete lines; the
+  timestamp is matched only at the start of each hit's line and decoded without strptime.
+- Importing it has no side effects (no logging setup, sinks or connection pools).
+
+Requirements:
+- Python 3.8+ (standard library only)
+
+Usage:
+Imported by the ingestion script and bench_log_parser.py:
+    from log_block_parser import parse_log_block
+    log_entries = parse_log_block(log_id, block)
+"""
+
+import re
+import logging
+from datetime import datetime
+
+# Block parser patterns: the error pattern starts with a literal so the regex engine can skip
+# non-error text quickly; the timestamp pattern is then matched only at the start of each hit's line
+ERROR_SEVERITY_PATTERN = re.compile(r"Error:[^\S\r\n]*(\d+),[^\S\r\n]*Severity:[^\S\r\n]*(\d+)")
+LOG_TIMESTAMP_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})\.(\d{1,6}) ")
+
+def parse_log_block(log_id, block):
+    """
+    Extracts (LogID, LogDate, LogMessageType, ErrorCode, Severity) for every error line of a block of
+    complete lines with a single regex scan. Equivalent to filter_log_lines + process_log_line
+    of the ingestion script, applied per line.
+    """
+    log_entries = []
+    previous_line_start = -1
+    for match in ERROR_SEVERITY_PATTERN.finditer(block):
+        line_start = block.rfind("\n", 0, match.start()) + 1
+        if line_start == previous_line_start:
+            continue  # Only the first error/severity pair of a line counts, as with process_log_line
+        previous_line_start = line_start
+
+        timestamp = LOG_TIMESTAMP_PATTERN.match(block, line_start)
+        if timestamp is None or timestamp.end() > match.start():
+            line_end = block.find("\n", line_start)
+            line = block[line_start:line_end if line_end != -1 else len(block)]
+            logging.warning(f"Skipping line due to invalid date format: {line}")
+            continue
+
+        year, month, day, hour, minute, second, fraction = timestamp.groups()
+        try:
+            # Fixed-width SQL Server timestamp: build the datetime from the captured fields instead of strptime
+            log_date = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                int(fraction.ljust(6, '0')))
+        except ValueError:
+            logging.warning(f"Skipping line due to invalid date: {block[line_start:match.start()]}")
+            continue
+        log_entries.append((log_id, log_date, "error", int(match.group(1)), int(match.group(2))))
+    return log_entries
@@ -0,0 +1,231 @@
+"""
+pipeline_metrics.py
+
+Description:
+This module is the shared instrumentation of the pipeline scripts. It collects per-stage timers, counters,
+gauges and latency histograms in-process, and exports them at the end of a run as a Prometheus textfile
+(for the node_exporter textfile collector) and a JSON run summary.
+
+Key Features:
+- Thread-safe counters, gauges and histograms with labels, and stage timers as context managers.
+- Negligible overhead when disabled (metrics_enabled = False): every call returns at once and timers are
+  a shared no-op context manager.
+- Prometheus text exposition format, written atomically so a scraper never reads a partial file.
+- JSON run summary with per-stage durations, counter totals and histogram count, sum, max and quantile estimates.
+- Optional cProfile (profile_stages) and tracemalloc (trace_memory_stages) hooks for individual stages.
+
+Requirements:
+- Python 3.8+ (standard library only)
+
+Usage:
+Imported by the pipeline scripts:
+    import pipeline_metrics as metrics
+    with metrics.stage("ingest"):
+        metrics.inc("ingest_rows_written_total", len(rows))
+        with metrics.timer("ingest_batch_write_seconds"):
+            ...
+    metrics.export("ingestion")
+"""
+
+import os
+import json
+import time
+import threading
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Adjustable parameters
+metrics_enabled = True
+metrics_dir = "metrics"  # Prometheus textfile (<script>.prom) and JSON summary (<script>_summary.json) of each run
+metrics_prefix = "predictive_dbai_"  # Prefix of every exported Prometheus metric name
+profile_stages = []  # Stages run under cProfile; stats are written to metrics_dir/<stage>.prof
+trace_memory_stages = []  # Stages run under tracemalloc; the peak is recorded as stage_traced_memory_peak_bytes
+latency_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # Histogram upper bounds (s)
+
+# Collected values, keyed by (metric name, sorted label pairs)
+metrics_lock = threading.Lock()
+counters = {}
+gauges = {}
+histograms = {}  # [count per bucket..., count in +Inf bucket], sum, count, max
+run_started = time.time()
+
+# Shared no-op context manager returned while metrics are disabled
+null_timer = nullcontext()
+
+# Function to turn keyword labels into a hashable, ordered key
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+# Function to add to a counter
+def inc(name, value=1, **labels):
+    if not metrics_enabled:
+        return
+    key = (name, label_key(labels))
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value
+
+# Function to set a gauge
+def set_gauge(name, value, **labels):
+    if not metrics_enabled:
+        return
+    with metrics_lock:
+        gauges[(name, label_key(labels))] = value
+
+# Function to record one observation in a histogram with the latency buckets
+def observe(name, value, **labels):
+    if not metrics_enabled:
+        return
+    key = (name, label_key(labels))
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {'buckets': [0] * (len(latency_buckets) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0}
+        index = 0
+        while index < len(latency_buckets) and value > latency_buckets[index]:
+            index += 1
+        histogram['buckets'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+        histogram['max'] = max(histogram['max'], value)
+
+# Context manager observing the seconds spent in its block into a histogram
+class Timer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+# Function to time a block into a histogram; a shared no-op while metrics are disabled
+def timer(name, **labels):
+    if not metrics_enabled:
+        return null_timer
+    return Timer(name, labels)
+
+# Function to time a pipeline stage (stage_duration_seconds{stage=...}), running it under cProfile or
+# tracemalloc when the stage is listed in profile_stages or trace_memory_stages
+@contextmanager
+def stage(name):
+    if not metrics_enabled:
+        yield
+        return
+    profiler = cProfile.Profile() if name in profile_stages else None
+    trace_memory = name in trace_memory_stages and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+            os.makedirs(metrics_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(metrics_dir, f"{name}.prof"))
+        if trace_memory:
+            set_gauge("stage_traced_memory_peak_bytes", tracemalloc.get_traced_memory()[1], stage=name)
+            tracemalloc.stop()
+        observe("stage_duration_seconds", elapsed, stage=name)
+
+# Function to format labels for the Prometheus text format
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+# Function to render everything collected in the Prometheus text exposition format
+def prometheus_text(script):
+    with metrics_lock:
+        counter_items = sorted(counters.items())
+        gauge_items = sorted(gauges.items())
+        histogram_items = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in histograms.items())
+    lines = []
+    typed = set()
+    script_label = (('script', script),)
+
+    def declare(name, metric_type):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {metrics_prefix}{name} {metric_type}")
+
+    for (name, labels), value in counter_items:
+        declare(name, "counter")
+        lines.append(f"{metrics_prefix}{name}{format_labels(labels, script_label)} {value}")
+    for (name, labels), value in gauge_items:
+        declare(name, "gauge")
+        lines.append(f"{metrics_prefix}{name}{format_labels(labels, script_label)} {value}")
+    for (name, labels), histogram in histogram_items:
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(list(latency_buckets) + ["+Inf"], histogram['buckets']):
+            cumulative += bucket_count
+            lines.append(f"{metrics_prefix}{name}_bucket{format_labels(labels, script_label + (('le', str(bound)),))} {cumulative}")
+        lines.append(f"{metrics_prefix}{name}_sum{format_labels(labels, script_label)} {histogram['sum']}")
+        lines.append(f"{metrics_prefix}{name}_count{format_labels(labels, script_label)} {histogram['count']}")
+    declare("run_last_completed_timestamp_seconds", "gauge")
+    lines.append(f"{metrics_prefix}run_last_completed_timestamp_seconds{format_labels((), script_label)} {time.time()}")
+    return "\n".join(lines) + "\n"
+
+# Function to estimate a quantile from the histogram buckets (upper bound of the bucket holding it)
+def histogram_quantile(histogram, quantile):
+    target = quantile * histogram['count']
+    cumulative = 0
+    for bound, bucket_count in zip(latency_buckets, histogram['buckets']):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return min(bound, histogram['max'])
+    return histogram['max']
+
+# Function to summarize the run as a dict: stage durations, counters, gauges and histogram statistics
+def run_summary(script):
+    def metric_label(name, labels):
+        return name + "".join(f"[{label}={value}]" for label, value in labels)
+
+    with metrics_lock:
+        summary = {
+            'script': script,
+            'started': datetime.fromtimestamp(run_started).isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'duration_seconds': round(time.time() - run_started, 3),
+            'stages': {dict(labels)['stage']: round(histogram['sum'], 3)
+                       for (name, labels), histogram in sorted(histograms.items()) if name == "stage_duration_seconds"},
+            'counters': {metric_label(name, labels): value for (name, labels), value in sorted(counters.items())},
+            'gauges': {metric_label(name, labels): value for (name, labels), value in sorted(gauges.items())},
+            'histograms': {metric_label(name, labels): {
+                'count': histogram['count'], 'sum': round(histogram['sum'], 6), 'max': round(histogram['max'], 6),
+                'p50': round(histogram_quantile(histogram, 0.5), 6),
+                'p95': round(histogram_quantile(histogram, 0.95), 6),
+            } for (name, labels), histogram in sorted(histograms.items()) if histogram['count']},
+        }
+    return summary
+
+# Function to write a file atomically
+def write_atomically(path, content):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+# Function to export the run: metrics_dir/<script>.prom and metrics_dir/<script>_summary.json.
+# Returns the two paths, or None while metrics are disabled.
+def export(script):
+    if not metrics_enabled:
+        return None
+    os.makedirs(metrics_dir, exist_ok=True)
+    textfile_path = os.path.join(metrics_dir, f"{script}.prom")
+    summary_path = os.path.join(metrics_dir, f"{script}_summary.json")
+    write_atomically(textfile_path, prometheus_text(script))
+    write_atomically(summary_path, json.dumps(run_summary(script), indent=2, default=str))
+    return textfile_path, summary_path
@@ -0,0 +1,374 @@
+"""
+run_pipeline.py
+
+Description:
+This script runs the collector, ingestion, parsing and report stages in one process instead of four.
+Each stage script is imported and driven through its own functions; the stages share one SQL connection pool,
+and the rows ingested in this cycle are handed to the parsing stage in memory instead of being read back from SQL.
+
+Key Features:
+- Runs all four stages or any subset of them, always in pipeline order (pipeline_stages or the command line).
+- One SQLAlchemy engine (connection pool) shared by every stage: ingestion borrows raw connections from it
+  in place of its own pool, and parsing and the report use it instead of creating engines of their own.
+- Log lines written by ingestion are captured as they are written (in memory up to capture_memory_limit_bytes,
+  spilled to disk beyond it) and passed to parsing one chunk at a time, with LogMessage filled from sys.messages,
+  so an incremental cycle skips the GetErrorLogsWithDetails read.
+  This needs the bulk sink with FILL_LOG_MESSAGE_ON_MERGE; when EXEC UpdateLogMessages fills LogMessage,
+  when rows past the parsing watermark exist that this cycle did not ingest, or when a full refit is due,
+  parsing reads from SQL as before.
+- The SQL writes of the parsing stage (processed rows, watermark, forecast) run on a background writer thread
+  while the stage carries on; the report waits only for the processed rows and takes its forecast sections
+  from the forecast just fitted instead of reading ForecastResults back.
+- The metrics of every stage, plus one timer per stage, are exported together through pipeline_metrics
+  (metrics/pipeline.prom and metrics/pipeline_summary.json).
+
+Requirements:
+- Python 3.8+
+- SQLAlchemy for SQL Server connection
+- The dependencies of the stage scripts that are run (the scripts are imported, not run)
+- Modify the connection_string variable for database connection; Azure settings stay in the stage scripts.
+
+Usage:
+Run the script to run every stage, or name the stages to run.
+    python run_pipeline.py
+    python run_pipeline.py ingest parse
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import importlib.util
+import concurrent.futures
+from contextlib import contextmanager
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+import urllib
+import pipeline_metrics as metrics
+
+# Correct SQLAlchemy connection string using DSN with `odbc_connect`
+connection_string = "<PROVIDE YOUR ODBC DSN AND CREDENTIALS>"
+params = urllib.parse.quote_plus(connection_string)
+sql_conn_str = f"mssql+pyodbc:///?odbc_connect={params}"
+
+# Stages in pipeline order and the script implementing each
+pipeline_stages = ["collect", "ingest", "parse", "report"]
+stage_scripts = {
+    'collect': ("log_collector", "1LogCollector_v1.py"),
+    'ingest': ("log_ingestion", "2logIngestion_v9_SysMessageintegration.py"),
+    'parse': ("log_parsing", "3LogParsing_AD_CC_PM_v3.py"),
+    'report': ("log_report", "4generatereport_v2.py"),
+}
+
+# Shared connection pool; None sizes it for the ingestion threads plus the main and writer threads
+db_pool_size = None
+db_pool_extra_connections = 2
+
+# Columns of the entries ingestion writes (log_id, log_date, log_message_type, error_code, severity)
+log_entry_columns = ['LogID', 'LogDate', 'LogMessageType', 'ErrorCode', 'Severity']
+
+# Captured entries held in memory; later batches are spilled to capture_spill_dir (None: the system temp directory)
+capture_memory_limit_bytes = 256 * 1024 * 1024
+capture_spill_dir = None
+
+# Function to load a stage script as a module (its file name is not a valid identifier); it is registered
+# in sys.modules so the process pools of the stage can pickle its functions
+def load_stage_module(stage):
+    module_name, file_name = stage_scripts[stage]
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Stand-in for the ingestion script's ConnectionPool that lends raw DBAPI connections from the shared engine.
+# Same contract: on error the transaction is rolled back, and the connection is invalidated if the rollback fails.
+class EnginePool:
+    def __init__(self, engine):
+        self.engine = engine
+
+    @contextmanager
+    def connection(self):
+        connection = self.engine.raw_connection()
+        try:
+            yield connection
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                connection.invalidate()
+            raise
+        finally:
+            connection.close()  # Returns the connection to the engine's pool
+
+    # The engine is disposed once by the pipeline, after the last stage
+    def close_all(self):
+        pass
+
+# Log sink wrapper that forwards everything to the ingestion script's sink and keeps what was written:
+# the server of every LogDetails row inserted, and every batch of log entries as a frame. Batches are kept in
+# memory up to capture_memory_limit_bytes and spilled to disk beyond it; they are read back one at a time.
+class CapturingLogSink:
+    def __init__(self, sink, memory_limit_bytes=capture_memory_limit_bytes, spill_dir=capture_spill_dir):
+        self.sink = sink
+        self.batch_size = sink.batch_size
+        self.lock = threading.Lock()
+        self.server_names = {}
+        self.frames = []  # In-memory frames, or the paths of spilled ones
+        self.memory_limit_bytes = memory_limit_bytes
+        self.memory_bytes = 0
+        self.spill_dir = spill_dir
+        self.spill_directory = None
+        self.rows = 0
+        self.log_ids = set()
+        self.error_codes = set()
+
+    def insert_log_details(self, servername, *log_details):
+        log_id = self.sink.insert_log_details(servername, *log_details)
+        if log_id:
+            with self.lock:
+                self.server_names[log_id] = servername
+                self.log_ids.add(log_id)
+        return log_id
+
+    def update_log_details(self, log_id, LogFileSize, db_type):
+        self.sink.update_log_details(log_id, LogFileSize, db_type)
+
+    def delete_log_messages(self, log_id, from_log_date=None, inclusive=True):
+        deleted = self.sink.delete_log_messages(log_id, from_log_date, inclusive)
+        if deleted:
+            with self.lock:
+                for index, item in enumerate(self.frames):
+                    frame = pd.read_pickle(item) if isinstance(item, str) else item
+                    keep = frame['LogID'] != log_id
+                    if from_log_date is not None:
+                        keep |= (frame['LogDate'] < from_log_date) if inclusive else (frame['LogDate'] <= from_log_date)
+                    if keep.all():
+                        continue
+                    self.rows -= int((~keep).sum())
+                    if isinstance(item, str):
+                        frame[keep].to_pickle(item)
+                    else:
+                        self.memory_bytes -= int(frame[~keep].memory_usage(deep=True).sum())
+                        self.frames[index] = frame[keep]
+        return deleted
+
+    def write(self, log_entries):
+        written = self.sink.write(log_entries)
+        if written:
+            frame = pd.DataFrame.from_records(log_entries, columns=log_entry_columns)
+            frame_bytes = int(frame.memory_usage(deep=True).sum())
+            with self.lock:
+                if self.memory_bytes + frame_bytes > self.memory_limit_bytes:
+                    if self.spill_directory is None:
+                        self.spill_directory = tempfile.mkdtemp(prefix="captured_entries_", dir=self.spill_dir)
+                    path = os.path.join(self.spill_directory, f"batch_{len(self.frames):06d}.pkl")
+                    frame.to_pickle(path)
+                    self.frames.append(path)
+                else:
+                    self.frames.append(frame)
+                    self.memory_bytes += frame_bytes
+                self.rows += len(frame)
+                self.log_ids.update(frame['LogID'].unique().tolist())
+                self.error_codes.update(frame['ErrorCode'].dropna().unique().tolist())
+        return written
+
+    def finalize(self):
+        self.sink.finalize()
+
+    # LogIDs of the log files this cycle created or wrote rows for
+    def captured_log_ids(self):
+        return set(self.log_ids)
+
+    # The captured batches one at a time, spilled ones read back from disk
+    def iter_frames(self):
+        for item in list(self.frames):
+            yield pd.read_pickle(item) if isinstance(item, str) else item
+
+    # The captured entries in frames of at most chunk_size rows, built from one batch at a time
+    def iter_entry_chunks(self, chunk_size):
+        pending, pending_rows = [], 0
+        for frame in self.iter_frames():
+            while len(frame):
+                take = frame.iloc[:chunk_size - pending_rows]
+                frame = frame.iloc[len(take):]
+                pending.append(take)
+                pending_rows += len(take)
+                if pending_rows == chunk_size:
+                    yield pd.concat(pending, ignore_index=True)
+                    pending, pending_rows = [], 0
+        if pending_rows:
+            yield pd.concat(pending, ignore_index=True)
+
+    # Remove the spilled batches
+    def close(self):
+        if self.spill_directory is not None:
+            shutil.rmtree(self.spill_directory, ignore_errors=True)
+            self.spill_directory = None
+
+# Function to read a column of values for a list of keys from SQL, as a {key: value} dict
+def query_lookup(engine, sql, keys, **params):
+    if not keys:
+        return {}
+    query = text(sql).bindparams(bindparam('keys', expanding=True))
+    with engine.connect() as conn:
+        return dict(conn.execute(query, {'keys': list(keys), **params}).fetchall())
+
+# Function to give a frame of captured entries the columns of GetErrorLogsWithDetails
+def log_message_chunk(entries_df, server_names, messages):
+    entries_df.insert(1, 'ServerName', entries_df['LogID'].map(server_names))
+    entries_df['LogMessage'] = entries_df['ErrorCode'].map(messages)
+    return entries_df
+
+# Function to build the parsing stage's input from the captured entries: frames of at most chunk_size rows
+# with the columns of GetErrorLogsWithDetails, built lazily one at a time as parsing consumes them. LogMessage
+# comes from sys.messages (only the error codes seen), and the server of log files not created this cycle
+# (appended blobs) from LogDetails.
+def build_log_message_chunks(sink, engine, language_id, chunk_size):
+    if not sink.rows:
+        return []
+
+    server_names = dict(sink.server_names)
+    missing_log_ids = sink.captured_log_ids() - set(server_names)
+    server_names.update(query_lookup(engine, "SELECT LogID, ServerName FROM LogDetails WHERE LogID IN :keys", missing_log_ids))
+    messages = query_lookup(engine, """
+    SELECT message_id, text FROM sys.messages WHERE language_id = :language_id AND message_id IN :keys
+    """, sorted(sink.error_codes), language_id=language_id)
+
+    print(f"Rows handed from ingestion to parsing in memory: {sink.rows}")
+    return (log_message_chunk(entries_df, server_names, messages) for entries_df in sink.iter_entry_chunks(chunk_size))
+
+# Function to check whether SQL holds rows past the parsing watermark that this cycle did not ingest (e.g. from
+# a standalone ingestion run): newer log files, or rows appended to open log files; they are only seen from SQL
+def has_uncaptured_log_files(engine, watermark, sink):
+    captured_log_ids = sink.captured_log_ids()
+    with engine.connect() as conn:
+        log_ids = conn.execute(text("SELECT LogID FROM LogDetails WHERE LogID > :since_log_id"),
+                               {'since_log_id': int(watermark['LogID'])}).scalars().all()
+        if any(log_id not in captured_log_ids for log_id in log_ids):
+            return True
+        # Rows appended to an open log file past its watermark, beyond those ingested in this cycle
+        for log_id, log_date in watermark.get('LogDates', {}).items():
+            log_date = pd.Timestamp(log_date)
+            sql_rows = conn.execute(text("SELECT COUNT(*) FROM LogMessages WHERE LogID = :log_id AND LogDate > :log_date"),
+                                    {'log_id': int(log_id), 'log_date': log_date.to_pydatetime()}).scalar()
+            captured_rows = sum(int(((frame['LogID'] == int(log_id)) & (pd.to_datetime(frame['LogDate']) > log_date)).sum())
+                                for frame in sink.iter_frames())
+            if sql_rows > captured_rows:
+                return True
+    return False
+
+# Background SQL writer: persistence steps run in submission order on one thread, so the stage that submitted
+# them carries on; failures are reported when they are waited for
+class BackgroundWriter:
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+
+    def __call__(self, function, *args, **kwargs):
+        future = self.executor.submit(function, *args, **kwargs)
+        self.futures.append((function.__name__, future))
+        return future
+
+    # Wait for the last submitted step of a function, and with it for every step submitted before it;
+    # returns the step's result (None if it was never submitted) and raises its error
+    def wait_for(self, function):
+        for name, future in reversed(self.futures):
+            if name == function.__name__:
+                return future.result()
+        return None
+
+    # Wait for every step and report failures
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for name, future in self.futures:
+            if future.exception() is not None:
+                print(f"An error occurred in background step {name}: {future.exception()}")
+
+# Function to run the ingestion stage on the shared pool; returns the sink holding what was written
+def run_ingestion(ingestion, engine):
+    ingestion.db_pool = EnginePool(engine)
+    ingestion.log_sink = CapturingLogSink(ingestion.log_sink)
+    ingestion.main()
+    return ingestion.log_sink
+
+# Function to run the parsing stage on the shared engine, fed in memory by the ingestion stage when it ran
+def run_parsing(parsing, engine, writer, sink=None):
+    parsing.sql_engine = engine
+    log_message_chunks = None
+    if sink is not None:
+        watermark = parsing.load_watermark()
+        ingestion = sys.modules[stage_scripts['ingest'][0]]
+        if parsing.is_full_refit_due(watermark, parsing.load_cluster_model()):
+            # A full refit reads all history from SQL, so the captured entries are not used
+            print("A full refit is due; parsing reads from SQL.")
+        elif has_uncaptured_log_files(engine, watermark, sink):
+            print("Rows ingested outside this cycle are pending; parsing reads from SQL.")
+        elif not (ingestion.LOG_SINK == "bulk" and ingestion.FILL_LOG_MESSAGE_ON_MERGE):
+            # LogMessage was filled by EXEC UpdateLogMessages, which only SQL knows the result of
+            print("LogMessage is filled by UpdateLogMessages; parsing reads from SQL.")
+        else:
+            language_id = ingestion.SYS_MESSAGES_LANGUAGE_ID
+            log_message_chunks = build_log_message_chunks(sink, engine, language_id, parsing.load_chunk_size)
+    return parsing.run_parsing(log_message_chunks, persist=writer)
+
+# Function to run the report stage once the processed rows of this cycle are saved; a forecast fitted
+# in this cycle is used directly. The report is skipped when the save failed, as it would miss this cycle.
+def run_report(report, engine, writer, parsing_result=None):
+    try:
+        data_access = report.ReportDataAccess(engine)
+        if parsing_result is not None:
+            if writer.wait_for(sys.modules[stage_scripts['parse'][0]].save_processed_rows) is False:
+                print("The processed rows of this cycle were not saved; the report is skipped.")
+                return
+            _, forecast, history_end = parsing_result
+            if not forecast.empty:
+                data_access = report.CycleReportDataAccess(engine, forecast, history_end)
+        report.generate_report(data_access)
+    except Exception as e:
+        print(f"An error occurred while generating the report: {e}")
+
+# Main function to execute the process
+def main():
+    unknown = [stage for stage in sys.argv[1:] if stage not in pipeline_stages]
+    if unknown:
+        print(f"Unknown stages: {', '.join(unknown)}. Choose from: {', '.join(pipeline_stages)}")
+        return
+    stages = [stage for stage in pipeline_stages if stage in (sys.argv[1:] or pipeline_stages)]
+    modules = {stage: load_stage_module(stage) for stage in stages}
+
+    engine = None
+    if stages != ["collect"]:
+        pool_size = db_pool_size or (modules['ingest'].DB_POOL_SIZE if 'ingest' in modules else 0) + db_pool_extra_connections
+        engine = create_engine(sql_conn_str, fast_executemany=True, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+    writer = BackgroundWriter()
+
+    sink = None
+    parsing_result = None
+    try:
+        for stage in stages:
+            print(f"Stage {stage} started.")
+            start_time = time.perf_counter()
+            with metrics.stage(stage):
+                if stage == "collect":
+                    modules['collect'].main()
+                elif stage == "ingest":
+                    sink = run_ingestion(modules['ingest'], engine)
+                elif stage == "parse":
+                    parsing_result = run_parsing(modules['parse'], engine, writer, sink)
+                elif stage == "report":
+                    run_report(modules['report'], engine, writer, parsing_result)
+            print(f"Stage {stage} finished in {time.perf_counter() - start_time:.1f}s.")
+    finally:
+        writer.close()
+        if sink is not None:
+            sink.close()
+        if engine is not None:
+            engine.dispose()
+        metrics.export("pipeline")
+
+if __name__ == "__main__":
+    main()
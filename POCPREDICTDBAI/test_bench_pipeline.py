@@ -0,0 +1,123 @@
+"""
+test_bench_pipeline.py
+
+Description:
+Smoke test of the SQLite stand-in of bench_pipeline.py: the parsing writers and the report run on a few hundred
+synthetic rows through the T-SQL rewriting hook (tsql_rewrites, sqlite_upserts), so a writer or report query the
+hook no longer covers fails here instead of in the middle of a benchmark run.
+
+Usage:
+    python -m pytest test_bench_pipeline.py
+"""
+
+import json
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("prophet")  # Imported by the parsing script at load time
+bench = pytest.importorskip("bench_pipeline")
+
+servers = ["SQLSRV001", "SQLSRV002", "SQLSRV003"]
+issue_types = ["Login Failure", "Deadlock", "Disk Space"]
+rows_per_server = 100
+
+# Function to build the synthetic processed rows: one log file (LogID) per server, spread over the last days
+def synthetic_processed_rows():
+    rng = np.random.default_rng(7)
+    rows = len(servers) * rows_per_server
+    start = datetime.combine(date.today(), datetime.min.time()) - timedelta(days=6)
+    issue_type = rng.choice(issue_types, rows)
+    return pd.DataFrame({
+        'LogID': np.repeat(np.arange(1, len(servers) + 1), rows_per_server),
+        'LogDate': start + pd.to_timedelta(rng.integers(0, 6 * 86400, rows), unit='s'),
+        'LogMessageType': "Error",
+        'LogMessage': "Message for " + issue_type,
+        'LogTemplate': "Message for <*>",
+        'ParsedMessage': "Parsed " + issue_type,
+        'AnomalyScore': 1,
+        'Cluster': rng.integers(-1, 3, rows),
+        'IssueType': issue_type,
+    })
+
+# Function to build a forecast frame for the global series and one (ServerName, IssueType) series
+def synthetic_forecast(history_end):
+    days = pd.date_range(history_end - timedelta(days=2), periods=10, freq='D')
+    forecasts = []
+    for series_key in ["all", f"{servers[0]}|{issue_types[0]}"]:
+        forecasts.append(pd.DataFrame({'SeriesKey': series_key, 'ds': days, 'yhat': np.linspace(1, 10, len(days)),
+                                       'yhat_lower': 0.0, 'yhat_upper': 12.0, 'trend': 1.0}))
+    return pd.concat(forecasts, ignore_index=True)
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    parsing = bench.load_script_module("log_parsing", "3LogParsing_AD_CC_PM_v3.py")
+    report = bench.load_script_module("log_report", "4generatereport_v2.py")
+    engine = bench.create_sqlite_engine(str(tmp_path / "standin.db"), parsing.issue_rollup_table)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE LogDetails (LogID INTEGER PRIMARY KEY, ServerName TEXT)")
+        for log_id, server_name in enumerate(servers, start=1):
+            conn.exec_driver_sql("INSERT INTO LogDetails (LogID, ServerName) VALUES (?, ?)", (log_id, server_name))
+    parsing.sql_engine = engine
+    report.report_basename = str(tmp_path / report.report_basename)
+    yield parsing, report, engine
+    engine.dispose()
+
+# The save, its rerun and the forecast save go through the rewritten staging, rollup and MERGE statements
+def test_save_to_database(standin):
+    parsing, _, engine = standin
+    processed_df = synthetic_processed_rows()
+
+    assert parsing.save_to_database(processed_df, 'LogMessages_Processed', rollup_table=parsing.issue_rollup_table)
+    # A rerun over rows already saved adds nothing, to the rows or to the rollup
+    assert parsing.save_to_database(processed_df, 'LogMessages_Processed', rollup_table=parsing.issue_rollup_table)
+    parsing.save_forecast_to_database(synthetic_forecast(processed_df['LogDate'].max()))
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM LogMessages_Processed").scalar() == len(processed_df)
+        rollup_total = conn.exec_driver_sql(f"SELECT SUM(IssueCount) FROM {parsing.issue_rollup_table}").scalar()
+        forecast_series = conn.exec_driver_sql("SELECT COUNT(DISTINCT SeriesKey) FROM ForecastResults").scalar()
+    assert rollup_total == len(processed_df)
+    assert forecast_series == 2
+
+# The report reads every section back from the stand-in through the rewritten procedure, temp tables and TOP queries
+def test_generate_report(standin):
+    parsing, report, engine = standin
+    processed_df = synthetic_processed_rows()
+    assert parsing.save_to_database(processed_df, 'LogMessages_Processed', rollup_table=parsing.issue_rollup_table)
+    parsing.save_forecast_to_database(synthetic_forecast(processed_df['LogDate'].max()))
+
+    report.generate_report(report.ReportDataAccess(engine))
+
+    with open(report.report_basename + ".txt", "r") as file:
+        text_report = file.read()
+    for server_name in servers:
+        assert server_name in text_report
+    assert "No future forecasts available." not in text_report
+    with open(report.report_basename + ".json", "r") as file:
+        json_report = json.load(file)
+    assert json_report
+    detail_rows = processed_df.drop_duplicates(['LogID', 'LogDate', 'ParsedMessage'])
+    assert text_report.count(", Message: ") == len(detail_rows)
+
+# Section 2 lists the servers of the detail rows, not of the rollup, and notes the rows the per-server cap leaves out
+def test_report_detail_servers_and_cap(standin, monkeypatch):
+    parsing, report, engine = standin
+    processed_df = synthetic_processed_rows()
+    assert parsing.save_to_database(processed_df, 'LogMessages_Processed', rollup_table=parsing.issue_rollup_table)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DELETE FROM {parsing.issue_rollup_table} WHERE ServerName = ?", (servers[0],))
+    monkeypatch.setattr(report, "report_detail_rows_per_server", 10)
+
+    report.generate_report(report.ReportDataAccess(engine), formats=["txt"])
+
+    with open(report.report_basename + ".txt", "r") as file:
+        detail_section = file.read().split("2. Detailed Logs by Server and Date")[1].split("3. Forecasting Summary")[0]
+    detail_rows = processed_df.drop_duplicates(['LogID', 'LogDate', 'ParsedMessage'])
+    for log_id, server_name in enumerate(servers, start=1):
+        assert f"Server: {server_name}\n" in detail_section
+        omitted = (detail_rows['LogID'] == log_id).sum() - 10
+        assert f"Server {server_name}: {omitted} more rows omitted" in detail_section
+    assert detail_section.count(", Message: ") == 10 * len(servers)
@@ -0,0 +1,59 @@
+"""
+test_classification_rules.py
+
+Description:
+Tests of the rule-table classifier of 3LogParsing_AD_CC_PM_v3.py: rules are combined into one regex of named
+lookaheads, so patterns with their own groups must not shift which rule a message is attributed to.
+
+Usage:
+    python -m pytest test_classification_rules.py
+"""
+
+from collections import OrderedDict
+import pandas as pd
+import pytest
+
+pytest.importorskip("prophet")  # Imported by the parsing script at load time
+bench = pytest.importorskip("bench_pipeline")
+
+rules_csv = """Priority,Pattern,IgnoreCase,LogTemplate,ParsedMessage,IssueType
+10,Login failed for user '(\\w+)',False,Login failure,,Authentication Issue
+20,(dead)(lock),True,Deadlock,A deadlock occurred.,Concurrency Issue
+30,disk (full|space),True,Disk space,,Storage Issue
+40,(?P<user>\\w+) logged out,False,Logout,,Session
+50,(a)\\1,False,Repeated letter,,Other
+"""
+
+@pytest.fixture
+def parsing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    parsing = bench.load_script_module("log_parsing", "3LogParsing_AD_CC_PM_v3.py")
+    rules_path = tmp_path / "rules.csv"
+    rules_path.write_text(rules_csv)
+    rules = parsing.load_classification_rules(str(rules_path))
+    monkeypatch.setattr(parsing, "classification_rules", rules)
+    monkeypatch.setattr(parsing, "classification_pattern", parsing.compile_classification_rules(rules))
+    monkeypatch.setattr(parsing, "classification_cache", OrderedDict())
+    return parsing
+
+# Rules whose pattern cannot be combined are left out; grouped patterns are kept
+def test_rules_with_named_groups_or_backreferences_are_skipped(parsing):
+    assert list(parsing.classification_rules['IssueType']) == ["Authentication Issue", "Concurrency Issue", "Storage Issue"]
+
+# Capturing groups inside a rule do not shift the rule each message is attributed to
+def test_grouped_patterns_classify_to_their_own_rule(parsing):
+    messages = pd.Series([
+        "Login failed for user 'sa'. Reason: password mismatch.",
+        "Transaction was DEADLOCKED on lock resources.",
+        "Could not allocate space: disk full.",
+        "Login failed for user 'app' after a deadlock.",
+        "Nothing to see here.",
+    ])
+    result = parsing.classify_log_messages(messages)
+    assert list(result['IssueType']) == ["Authentication Issue", "Concurrency Issue", "Storage Issue",
+                                         "Authentication Issue", parsing.default_issue_type]
+    assert list(result['LogTemplate']) == ["Login failure", "Deadlock", "Disk space", "Login failure",
+                                           parsing.default_log_template]
+    # A rule without a ParsedMessage keeps the message text
+    assert result['ParsedMessage'][0] == messages[0]
+    assert result['ParsedMessage'][1] == "A deadlock occurred."